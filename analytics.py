@@ -0,0 +1,136 @@
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MIN_RETURNS_FOR_ZSCORE = 20  # کمترین تعداد بازده لازم برای محاسبه انحراف معیار معتبر
+
+
+class PriceWindow:
+    """پنجره قیمت‌های اخیر همه نمادها به صورت آرایه NumPy (هر سطر یک نماد)
+
+    همه محاسبات (درصد تغییر در چند بازه، نوسان و z-score) در یک گذر برداری
+    روی کل ماتریس انجام می‌شوند، پس هزینه هر تیک به تعداد نمادها بستگی عملی ندارد.
+    """
+
+    def __init__(self, names, span, capacity=4096):
+        self.names = list(names)
+        self.span = span  # بیشترین بازه زمانی نگه‌داری (ثانیه)
+        self.capacity = capacity
+        # بافر خطی دو برابر ظرفیت؛ وقتی پر شود نیمه آخر به ابتدا منتقل می‌شود
+        self._times = np.zeros(capacity * 2)
+        self._values = np.full((len(self.names), capacity * 2), np.nan)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def times(self):
+        return self._times[:self._size]
+
+    @property
+    def values(self):
+        return self._values[:, :self._size]
+
+    def push(self, timestamp, values):
+        """اضافه کردن یک اسنپ‌شات؛ values هم‌ترتیب با names است و مقدار نامعتبر NaN می‌شود"""
+        if self._size == self._times.size:
+            self._compact()
+        row = np.array([_to_float(value) for value in values])
+        self._times[self._size] = timestamp
+        self._values[:, self._size] = row
+        self._size += 1
+
+    def _compact(self):
+        """حذف نمونه‌های قدیمی‌تر از span و نگه داشتن حداکثر capacity نمونه"""
+        newest = self._times[self._size - 1]
+        start = int(np.searchsorted(self._times[:self._size], newest - self.span))
+        start = max(start, self._size - self.capacity)
+        kept = self._size - start
+        self._times[:kept] = self._times[start:self._size]
+        self._values[:, :kept] = self._values[:, start:self._size]
+        self._values[:, kept:] = np.nan
+        self._size = kept
+
+    def seed(self, history, symbols, now):
+        """پر کردن پنجره از تاریخچه دائمی بعد از راه‌اندازی؛ symbols نماد API هر name است"""
+        series = {name: dict(history.range(symbols[name], now - self.span)) for name in self.names}
+        times = sorted(set().union(*(s.keys() for s in series.values())))[-self.capacity:]
+        for timestamp in times:
+            self.push(timestamp, [series[name].get(timestamp) for name in self.names])
+        logger.info(f"📈 پنجره تحلیل با {len(times)} اسنپ‌شات از تاریخچه پر شد")
+
+    def evaluate(self, windows, volatility_window):
+        """محاسبه دسته‌ای معیارهای همه نمادها برای همه بازه‌ها
+
+        خروجی دیکشنری شامل آرایه‌های زیر است (سطرها نماد، ستون‌ها بازه‌ها):
+        change: درصد تغییر از ابتدای هر بازه تا آخرین قیمت
+        zscore: بازده لگاریتمی هر بازه تقسیم بر نوسان مورد انتظار همان بازه
+        volatility: انحراف معیار بازده هر نمونه در volatility_window (یک مقدار برای هر نماد)
+        """
+        windows = np.asarray(windows, dtype=float)
+        shape = (len(self.names), windows.size)
+        if self._size < 2:
+            empty = np.full(shape, np.nan)
+            return {'change': empty, 'zscore': empty.copy(), 'volatility': np.full(len(self.names), np.nan)}
+
+        times = self.times
+        values = self.values
+        now = times[-1]
+        latest = values[:, -1]
+
+        # اندیس اولین نمونه داخل هر بازه؛ بازه صفر یعنی نمونه قبلی
+        starts = np.searchsorted(times, now - windows)
+        starts = np.where(windows <= 0, self._size - 2, np.minimum(starts, self._size - 2))
+        base = values[:, starts]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = (latest[:, None] - base) / base * 100
+            log_move = np.log(latest[:, None] / base)
+
+            vol_start = int(np.searchsorted(times, now - volatility_window))
+            returns = np.diff(np.log(values[:, vol_start:]), axis=1)
+            counts = np.sum(~np.isnan(returns), axis=1)
+            volatility = np.full(len(self.names), np.nan)
+            enough = counts >= MIN_RETURNS_FOR_ZSCORE
+            if enough.any():
+                volatility[enough] = np.nanstd(returns[enough], axis=1)
+
+            # نوسان مورد انتظار بازه = نوسان هر نمونه × ریشه تعداد گام‌های داخل بازه
+            steps = np.maximum(self._size - 1 - starts, 1)
+            zscore = log_move / (volatility[:, None] * np.sqrt(steps)[None, :])
+        return {'change': change, 'zscore': zscore, 'volatility': volatility}
+
+    def check(self, rules, volatility_window):
+        """ارزیابی قوانین هشدار روی آخرین اسنپ‌شات
+
+        هر قانون دیکشنری با کلید window (ثانیه) و percent و/یا zscore است؛ اگر هر دو باشند هر دو باید برقرار باشند.
+        خروجی لیست (name, درصد تغییر, آخرین قیمت, قانون) برای نمادهایی است که دست‌کم یک قانون را نقض کرده‌اند.
+        """
+        if not rules:
+            return []
+        metrics = self.evaluate([rule['window'] for rule in rules], volatility_window)
+        fired = np.ones(metrics['change'].shape, dtype=bool)
+        with np.errstate(invalid='ignore'):
+            for column, rule in enumerate(rules):
+                if 'percent' in rule:
+                    fired[:, column] &= np.abs(metrics['change'][:, column]) > rule['percent']
+                if 'zscore' in rule:
+                    fired[:, column] &= np.abs(metrics['zscore'][:, column]) > rule['zscore']
+
+        latest = self.values[:, -1]
+        results = []
+        for row in np.flatnonzero(fired.any(axis=1)):
+            column = int(np.flatnonzero(fired[row])[0])
+            results.append((self.names[row], float(metrics['change'][row, column]), float(latest[row]), rules[column]))
+        return results
+
+
+def _to_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return math.nan
+    return value if value > 0 else math.nan
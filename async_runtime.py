@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+
+from scheduler import JOB_ERRORS, JOB_SECONDS, next_following
+
+logger = logging.getLogger(__name__)
+
+# ==================== تنظیمات اجرای asyncio ====================
+REQUEST_TIMEOUT = 10     # حداکثر زمان انتظار هر درخواست HTTP (ثانیه)
+POOL_SIZE = 16           # بیشترین تعداد اتصال همزمان کلاینت
+JOB_TIMEOUT = 120        # حداکثر زمان اجرای هر کار زمان‌بندی‌شده (ثانیه)
+# ===============================================================
+
+
+class AsyncHttp:
+    """کلاینت HTTP غیرمسدودکننده مشترک روی aiohttp با استخر اتصال keep-alive
+
+    aiohttp فقط هنگام اولین درخواست import می‌شود تا اجرای معمولی (نخ‌محور) به آن نیازی نداشته باشد.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, timeout=REQUEST_TIMEOUT):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            import aiohttp
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def get(self, url, headers=None, timeout=None):
+        """درخواست GET؛ خروجی (کد وضعیت, هدرها, بدنه) است"""
+        kwargs = {}
+        if timeout is not None:
+            import aiohttp
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=timeout)
+        async with self._get_session().get(url, headers=headers, **kwargs) as response:
+            return response.status, dict(response.headers), await response.read()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class AsyncScheduler:
+    """زمان‌بند asyncio: هر کار یک task مستقل با سقف زمان اجرا دارد
+
+    رابط آن مثل Scheduler است؛ func می‌تواند تابع async یا معمولی باشد. تابع معمولی در
+    یک نخ کارگر اجرا می‌شود. کاری که از timeout بیشتر طول بکشد لغو می‌شود (نخ کارگر
+    رها می‌شود) و چون هر کار task خودش را دارد، یک کار کند هیچ‌وقت کار دیگری را عقب نمی‌اندازد.
+    """
+
+    def __init__(self, timeout=JOB_TIMEOUT):
+        self.timeout = timeout
+        self._jobs = []
+        self._tasks = []
+        self._next = {}
+
+    def add_job(self, name, func, next_run, first_run=None, timeout=None):
+        """اضافه کردن یک کار؛ first_run اگر داده شود زمان اولین اجرا است"""
+        when = first_run if first_run is not None else next_run(time.time())
+        if when is None:
+            logger.warning(f"⚠️ کار {name} زمان اجرایی ندارد و زمان‌بندی نشد")
+            return
+        self._jobs.append((name, func, next_run, when, timeout or self.timeout))
+        self._next[name] = when
+        logger.info(f"🗓️ کار {name} برای {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(when))} زمان‌بندی شد")
+
+    def jobs(self):
+        """لیست (زمان اجرا, نام) کارهای در انتظار به ترتیب اجرا"""
+        return sorted((when, name) for name, when in self._next.items() if when is not None)
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+
+    async def _call(self, name, func, timeout):
+        started = time.monotonic()
+        try:
+            if asyncio.iscoroutinefunction(func):
+                await asyncio.wait_for(func(), timeout)
+            else:
+                await asyncio.wait_for(asyncio.to_thread(func), timeout)
+        except asyncio.TimeoutError:
+            JOB_ERRORS.inc(job=name)
+            logger.error(f"⌛ کار {name} بعد از {timeout} ثانیه لغو شد")
+        except Exception as e:
+            JOB_ERRORS.inc(job=name)
+            logger.error(f"❌ خطای غیرمنتظره در کار {name}: {e}")
+        else:
+            logger.debug("✅ کار %s در %.2f ثانیه انجام شد", name, time.monotonic() - started, extra={'event': 'job'})
+        finally:
+            JOB_SECONDS.observe(time.monotonic() - started, job=name)
+
+    async def _run_job(self, name, func, next_run, when, timeout):
+        while when is not None:
+            delay = when - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._call(name, func, timeout)
+            when = next_following(name, next_run, when, time.time())
+            self._next[name] = when
+
+    async def run(self):
+        """اجرای همه کارها تا وقتی stop صدا زده شود یا هیچ کاری زمان بعدی نداشته باشد"""
+        self._tasks = [asyncio.create_task(self._run_job(*job), name=job[0]) for job in self._jobs]
+        try:
+            await asyncio.gather(*self._tasks)
+        except asyncio.CancelledError:
+            pass
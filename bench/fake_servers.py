@@ -0,0 +1,243 @@
+"""سرورهای HTTP محلی شبیه brsapi.ir، Bot API تلگرام و whapi.cloud برای بنچمارک و تست بار
+
+هر سرور تأخیر (latency و jitter)، نرخ خطای 500 (error_rate) و محدودیت نرخ با پاسخ 429
+(rate_limit درخواست در ثانیه و retry_after) قابل تنظیم دارد و درخواست‌ها را می‌شمارد.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tehran_clock import TEHRAN_TZ
+
+# نمادهای پاسخ Gold_Currency.php به تفکیک بخش با قیمت اولیه
+MARKET_SYMBOLS = {
+    'gold': {
+        'XAUUSD': ('انس طلا', 2650),
+        'IR_GOLD_18K': ('طلای 18 عیار', 7200000),
+        'IR_COIN_BAHAR': ('سکه بهار آزادی', 72000000),
+        'IR_COIN_EMAMI': ('سکه امامی', 76000000),
+        'IR_COIN_HALF': ('نیم سکه', 41000000),
+        'IR_COIN_QUARTER': ('ربع سکه', 24000000),
+        'IR_COIN_1G': ('سکه گرمی', 12500000),
+    },
+    'currency': {
+        'USD': ('دلار', 82000),
+        'EUR': ('یورو', 89000),
+        'GBP': ('پوند', 104000),
+        'AED': ('درهم', 22300),
+        'USDT_IRT': ('تتر', 83000),
+    },
+    'cryptocurrency': {
+        'BTC': ('بیت کوین', 68000),
+    },
+}
+
+
+class FakeServer:
+    """پایه سرورهای جعلی؛ handle(method, path, headers, body) را زیرکلاس‌ها پیاده می‌کنند"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=0, retry_after=1, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'throttled': 0}
+        self._window = deque()
+        self._server = None
+        self.url = None
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _serve(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                status, headers, payload = server._dispatch(self.command, self.path, self.headers, body)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _throttled(self):
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            while self._window and now - self._window[0] >= 1:
+                self._window.popleft()
+            if len(self._window) >= self.rate_limit:
+                return True
+            self._window.append(now)
+            return False
+
+    def _dispatch(self, method, path, headers, body):
+        with self.lock:
+            self.stats['requests'] += 1
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            failed = self.random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if self._throttled():
+            with self.lock:
+                self.stats['throttled'] += 1
+            return self.too_many_requests()
+        if failed:
+            with self.lock:
+                self.stats['errors'] += 1
+            return 500, {'Content-Type': 'application/json'}, b'{"ok":false,"description":"Internal Server Error"}'
+        return self.handle(method, path, headers, body)
+
+    def too_many_requests(self):
+        return 429, {'Retry-After': str(self.retry_after), 'Content-Type': 'application/json'}, b'{}'
+
+    def handle(self, method, path, headers, body):
+        raise NotImplementedError
+
+
+class FakeBrsApi(FakeServer):
+    """شبیه Gold_Currency.php؛ قیمت‌ها با step() قدم تصادفی برمی‌دارند و quote_time زمان قیمت است
+
+    ETag هش بدنه پاسخ است و If-None-Match برابر، پاسخ 304 می‌گیرد.
+    """
+
+    def __init__(self, volatility=0.002, **kwargs):
+        super().__init__(**kwargs)
+        self.volatility = volatility
+        self.prices = {
+            symbol: float(price)
+            for section in MARKET_SYMBOLS.values() for symbol, (_, price) in section.items()
+        }
+        self.changes = dict.fromkeys(self.prices, 0.0)
+        self.quote_time = None
+        self._payload = None
+
+    def step(self, volatility=None, quote_time=None):
+        """یک قدم تصادفی برای همه قیمت‌ها"""
+        volatility = self.volatility if volatility is None else volatility
+        with self.lock:
+            for symbol, price in self.prices.items():
+                change = self.random.gauss(0, volatility)
+                self.prices[symbol] = price * (1 + change)
+                self.changes[symbol] = round(change * 100, 2)
+            self.quote_time = quote_time
+            self._payload = None
+
+    def shock(self, symbol, percent):
+        """جهش ناگهانی قیمت یک نماد (برای تست هشدار فوری)"""
+        with self.lock:
+            self.prices[symbol] *= 1 + percent / 100
+            self.changes[symbol] = percent
+            self._payload = None
+
+    def payload(self):
+        with self.lock:
+            if self._payload is None:
+                quote_time = self.quote_time or datetime.now(TEHRAN_TZ).strftime('%H:%M')
+                data = {
+                    section: [
+                        {
+                            'symbol': symbol,
+                            'name': name,
+                            'price': round(self.prices[symbol]) if self.prices[symbol] > 1000 else round(self.prices[symbol], 2),
+                            'change_percent': self.changes[symbol],
+                            'time': quote_time,
+                        }
+                        for symbol, (name, _) in symbols.items()
+                    ]
+                    for section, symbols in MARKET_SYMBOLS.items()
+                }
+                self._payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            return self._payload
+
+    def handle(self, method, path, headers, body):
+        payload = self.payload()
+        etag = '"' + hashlib.md5(payload).hexdigest() + '"'
+        if headers.get('If-None-Match') == etag:
+            return 304, {'ETag': etag}, b''
+        return 200, {'Content-Type': 'application/json; charset=utf-8', 'ETag': etag}, payload
+
+
+class FakeTelegram(FakeServer):
+    """شبیه Bot API تلگرام؛ هر sendMessage، editMessageText و sendPhoto با زمان دریافت (time.monotonic) ثبت می‌شود"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.received = []
+        self.edits = []
+        self.photos = []
+        self._message_id = 0
+
+    def too_many_requests(self):
+        body = {
+            'ok': False, 'error_code': 429,
+            'description': f'Too Many Requests: retry after {self.retry_after}',
+            'parameters': {'retry_after': self.retry_after},
+        }
+        return 429, {'Content-Type': 'application/json'}, json.dumps(body).encode()
+
+    def handle(self, method, path, headers, body):
+        if headers.get('Content-Type', '').startswith('multipart/form-data'):
+            # آپلود sendPhoto؛ فقط chat_id از فرم خوانده می‌شود
+            match = re.search(rb'name="chat_id"\r\n\r\n([^\r]*)', body)
+            payload = {'chat_id': match.group(1).decode() if match else None, 'photo': f'upload:{len(body)}'}
+        else:
+            payload = json.loads(body or b'{}')
+        with self.lock:
+            self._message_id += 1
+            message_id = self._message_id
+            if path.endswith('/sendMessage'):
+                self.received.append((time.monotonic(), str(payload.get('chat_id')), payload.get('text')))
+            elif path.endswith('/editMessageText'):
+                self.edits.append((time.monotonic(), str(payload.get('chat_id')), payload.get('text')))
+            elif path.endswith('/sendPhoto'):
+                self.photos.append((time.monotonic(), str(payload.get('chat_id')), payload.get('photo')))
+        result = {'message_id': message_id, 'chat': {'id': payload.get('chat_id')}}
+        if path.endswith('/sendPhoto'):
+            file_id = payload['photo'] if not payload['photo'].startswith('upload:') else f'file-{message_id}'
+            result['photo'] = [{'file_id': f'{file_id}-small'}, {'file_id': file_id}]
+        return 200, {'Content-Type': 'application/json'}, json.dumps({'ok': True, 'result': result}).encode()
+
+
+class FakeWhapi(FakeServer):
+    """شبیه endpoint messages/text در whapi.cloud"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.received = []
+
+    def handle(self, method, path, headers, body):
+        payload = json.loads(body or b'{}')
+        with self.lock:
+            self.received.append((time.monotonic(), str(payload.get('to')), payload.get('body')))
+            message_id = len(self.received)
+        return 200, {'Content-Type': 'application/json'}, json.dumps({'sent': True, 'message': {'id': str(message_id)}}).encode()
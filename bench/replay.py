@@ -0,0 +1,315 @@
+"""بازپخش روزهای کاری ثبت‌شده با زمان مجازی
+
+اسنپ‌شات‌های تاریخچه قیمت (PriceHistory) با همان زمان‌بند، کش، تحلیل هشدار و قالب پیام ربات
+بازپخش می‌شوند، اما ساعت مجازی است و بدون انتظار از یک کار به کار بعدی می‌پرد؛ پس چند ماه
+تاریخچه در چند ثانیه اجرا می‌شود. هیچ پیامی ارسال نمی‌شود؛ دنباله دقیق پیام‌هایی که ربات
+می‌فرستاد (صف خروجی و ارسال/ویرایش مستقیم کانال) ثبت و گزارش می‌شود.
+
+اجرا از ریشه مخزن:
+    python -m bench.replay --history data/history --from 1404/01/15 --to 1404/04/01
+    python -m bench.replay --history data/history --rule 1800:2 --rule 900:1:2.5 --output messages.jsonl
+    python -m bench.replay --history data/history --edit-in-place --fetch-interval 60
+
+هر --rule به شکل window:percent[:zscore] است (window ثانیه؛ percent یا zscore خالی یعنی بدون آن شرط)
+و جایگزین ALERT_RULES می‌شود تا اثر آستانه‌های جدید روی تاریخچه واقعی دیده شود.
+با --rules هشدارهای اشتراکی مشترکان (روی یک کپی از پایگاه داده آن‌ها) هم بازپخش می‌شوند.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, time as day_time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jdatetime
+
+from history import PriceHistory
+from sources import BrsApiSource
+from tehran_clock import TEHRAN_TZ, VirtualTime
+
+DAY = 86400
+
+
+class HistoryReplaySource(BrsApiSource):
+    """منبع قیمت با قالب پاسخ brsapi که از تاریخچه ثبت‌شده در زمان مجازی clock می‌خواند
+
+    قیمت هر نماد آخرین قیمت ثبت‌شده تا آن لحظه است و change_percent نسبت به آخرین قیمت روز
+    قبل (پایان روز تهران) محاسبه می‌شود، مثل تغییر روزانه در پاسخ API.
+    """
+
+    def __init__(self, name, history, sections, clock):
+        super().__init__(name, f'replay://{history.directory}', sections)
+        self.history = history
+        self.clock = clock
+        self.transport = self._read
+
+    def _read(self, url, headers, timeout):
+        now = self.clock.time()
+        tehran = self.clock.from_timestamp(now)
+        midnight = self.clock.to_timestamp(datetime.combine(tehran.date(), day_time()))
+        data = {}
+        for symbol, section in self.sections.items():
+            price = self.history.at(symbol, now)
+            if price is None:
+                continue
+            previous = self.history.at(symbol, midnight - 1)
+            data.setdefault(section, []).append({
+                'symbol': symbol,
+                'price': round(price) if price > 1000 else round(price, 2),
+                'change_percent': round((price - previous) / previous * 100, 2) if previous else 0,
+                'time': tehran.strftime('%H:%M'),
+            })
+        return 200, {}, json.dumps(data).encode('utf-8')
+
+
+class MessageLog:
+    """ثبت پیام‌هایی که ربات می‌فرستاد؛ جای صف خروجی (outbox) و ماژول delivery در main می‌نشیند
+
+    enqueue مثل Outbox کلید تکراری را برای هر گیرنده نادیده می‌گیرد و پیام را در همان
+    لحظه مجازی «ارسال‌شده» ثبت می‌کند؛ ارسال و ویرایش مستقیم کانال هم موفق فرض می‌شوند.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.messages = []
+        self._keys = set()
+        self._message_id = 0
+
+    def _record(self, kind, provider, chat_id, text, **extra):
+        entry = {'time': self.clock.time(), 'kind': kind, 'provider': provider, 'chat_id': str(chat_id), 'text': text}
+        entry.update(extra)
+        self.messages.append(entry)
+
+    # رابط Outbox
+    def enqueue(self, texts, recipients, kind, dedup_key=None, ttl=None):
+        added = 0
+        for provider, chat_id in recipients:
+            key = f"{dedup_key}:{provider}:{chat_id}" if dedup_key else None
+            if key in self._keys:
+                continue
+            if key:
+                self._keys.add(key)
+            self._record(kind, provider, chat_id, texts[provider] if isinstance(texts, dict) else texts)
+            added += 1
+        return added
+
+    def depth(self):
+        return 0
+
+    def oldest_pending(self):
+        return None
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    # رابط delivery
+    def _result(self, provider, chat_id, **extra):
+        return dict({'provider': provider, 'chat_id': chat_id, 'ok': True, 'status': 200,
+                     'error': None, 'elapsed': 0.0, 'response': None}, **extra)
+
+    def call_limited(self, name, chat_id, request):
+        return request()
+
+    def broadcast(self, text, recipients, tokens):
+        results = []
+        for provider, chat_id in recipients:
+            self._record('direct', provider, chat_id, text[provider] if isinstance(text, dict) else text)
+            results.append(self._result(provider, chat_id))
+        return results
+
+    def send_telegram(self, token, chat_id, text, parse_mode='HTML'):
+        self._message_id += 1
+        self._record('post', 'telegram', chat_id, text, message_id=self._message_id)
+        return self._result('telegram', chat_id, message_id=self._message_id)
+
+    def edit_telegram(self, token, chat_id, message_id, text, parse_mode='HTML'):
+        self._record('edit', 'telegram', chat_id, text, message_id=message_id)
+        return self._result('telegram', chat_id)
+
+    def pin_telegram(self, token, chat_id, message_id):
+        return self._result('telegram', chat_id)
+
+    def send_telegram_photo(self, token, chat_id, photo, caption=None, parse_mode='HTML'):
+        file_id = photo if isinstance(photo, str) else f"chart-{len(self.messages)}"
+        self._record('photo', 'telegram', chat_id, caption, file_id=file_id)
+        return self._result('telegram', chat_id, file_id=file_id)
+
+
+def parse_rule(value):
+    """window:percent[:zscore] -> قانون هشدار"""
+    parts = value.split(':')
+    if len(parts) not in (2, 3) or not parts[0]:
+        raise argparse.ArgumentTypeError(f"قانون نامعتبر: {value} (قالب window:percent[:zscore])")
+    try:
+        rule = {'window': int(parts[0])}
+        if parts[1]:
+            rule['percent'] = float(parts[1])
+        if len(parts) == 3 and parts[2]:
+            rule['zscore'] = float(parts[2])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"قانون نامعتبر: {value}")
+    if len(rule) == 1:
+        raise argparse.ArgumentTypeError(f"قانون {value} هیچ شرطی ندارد")
+    return rule
+
+
+def parse_jalali(value):
+    """تاریخ شمسی 1404/01/15 -> timestamp شروع آن روز به وقت تهران"""
+    try:
+        date = jdatetime.datetime.strptime(value, '%Y/%m/%d').togregorian().date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"تاریخ نامعتبر: {value} (قالب 1404/01/15)")
+    return datetime.combine(date, day_time(), TEHRAN_TZ).timestamp()
+
+
+def recorded_span(history, symbols):
+    """بازه زمانی ثبت‌شده در تاریخچه برای نمادهای دنبال‌شده: (اولین, آخرین) یا None"""
+    first = last = None
+    for symbol in symbols:
+        records = history.range(symbol)
+        if records:
+            first = records[0][0] if first is None else min(first, records[0][0])
+            last = records[-1][0] if last is None else max(last, records[-1][0])
+    return (first, last) if first is not None else None
+
+
+def setup(args, workdir):
+    """تنظیم محیط قبل از import کردن main: داده‌های جانبی در workdir و بدون تماس با بیرون"""
+    defaults = {'API_KEY': 'replay', 'ADMIN_CHAT_ID': '1', 'TELEGRAM_TOKEN': 'replay', 'CHANNEL_ID': '@replay'}
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+    if args.rules:
+        # کپی تا قانون‌های یک‌بار مصرف در پایگاه داده اصلی حذف نشوند
+        shutil.copyfile(args.rules, os.path.join(workdir, 'rules.sqlite3'))
+    os.environ.update({
+        'OUTBOX_PATH': os.path.join(workdir, 'outbox.sqlite3'),
+        'STATE_PATH': os.path.join(workdir, 'state.json'),
+        'HISTORY_DIR': os.path.join(workdir, 'history'),
+        'RULES_PATH': os.path.join(workdir, 'rules.sqlite3'),
+        'FETCH_INTERVAL': str(args.fetch_interval),
+        'EDIT_IN_PLACE': 'true' if args.edit_in_place else 'false',
+        'TRIAL_CHECK': 'true' if args.trial_check else 'false',
+        'METRICS_PORT': '0',
+    })
+
+
+def install(bot, recorded, start, rules):
+    """جایگزینی ساعت، کش، منبع قیمت، وضعیت و خروجی main با نسخه‌های مجازی؛ خروجی (زمان مجازی, لاگ پیام‌ها)"""
+    from analytics import PriceWindow
+    from cache import SingleFlightCache
+    from sources import PriceAggregator
+    from state import StateStore
+
+    virtual = VirtualTime(start)
+    bot.clock.use_time_source(virtual)
+    bot.price_cache = SingleFlightCache(bot.PRICE_CACHE_TTL, bot.PRICE_STALE_TTL, time_source=virtual)
+    source = HistoryReplaySource('replay', recorded, bot.SYMBOL_SECTIONS, bot.clock)
+    bot.price_sources = PriceAggregator([source], tehran_now=bot.clock.now)
+    bot.state = StateStore(None, bot.state.snapshot())
+    if rules:
+        bot.ALERT_RULES[:] = rules
+    bot.price_window = PriceWindow(bot.PRICE_SYMBOLS, span=max(
+        [bot.VOLATILITY_WINDOW] + [rule['window'] for rule in bot.ALERT_RULES]))
+    log = MessageLog(bot.clock)
+    bot.outbox = log
+    bot.delivery = log
+    bot.started_at = start
+    return virtual, log
+
+
+def replay(bot, virtual, end):
+    """اجرای کارهای زمان‌بند با پرش زمان مجازی تا end؛ خروجی تعداد اجرای کارها"""
+    from scheduler import Scheduler
+
+    scheduler = Scheduler(time_source=virtual)
+    bot.add_jobs(scheduler, bot.get_prices, bot.refresh_price_post, bot.run_price_update, bot.run_tenant_update)
+    runs = 0
+    while True:
+        when = scheduler.next_time()
+        if when is None or when >= end:
+            return runs
+        virtual.set(max(when, virtual()))
+        runs += scheduler.run_pending()
+
+
+def summarize(bot, messages, limit):
+    """چاپ دنباله پیام‌ها؛ پیام یکسان برای چند گیرنده یک خط با تعداد گیرندگان است"""
+    grouped = []
+    for message in messages:
+        key = (message['time'], message['kind'], message['text'])
+        if grouped and grouped[-1][0] == key:
+            grouped[-1][1] += 1
+        else:
+            grouped.append([key, 1])
+    for (timestamp, kind, text), count in grouped[:limit] if limit else grouped:
+        moment = jdatetime.datetime.fromgregorian(datetime=bot.clock.from_timestamp(timestamp))
+        headline = next((line.strip() for line in (text or '').splitlines() if line.strip()), '')
+        print(f"{moment.strftime('%Y/%m/%d %H:%M')}  {kind:<9} ×{count:<4} {headline}")
+    if limit and len(grouped) > limit:
+        print(f"... و {len(grouped) - limit} پیام دیگر")
+    return grouped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بازپخش تاریخچه قیمت با زمان مجازی و گزارش پیام‌های ربات")
+    parser.add_argument('--history', required=True, help="پوشه تاریخچه قیمت ضبط‌شده (HISTORY_DIR ربات)")
+    parser.add_argument('--from', dest='start', type=parse_jalali, help="اولین روز (شمسی)؛ پیش‌فرض شروع تاریخچه")
+    parser.add_argument('--to', dest='end', type=parse_jalali, help="روز پایان، خودش شامل نمی‌شود؛ پیش‌فرض پایان تاریخچه")
+    parser.add_argument('--rule', action='append', type=parse_rule, default=[],
+                        help="قانون هشدار window:percent[:zscore]؛ قابل تکرار و جایگزین قوانین پیش‌فرض")
+    parser.add_argument('--rules', help="پایگاه داده قانون‌های هشدار مشترکان (RULES_PATH) برای بازپخش؛ روی کپی آن اجرا می‌شود")
+    parser.add_argument('--fetch-interval', type=int, default=300, help="فاصله دریافت قیمت در زمان مجازی (ثانیه)")
+    parser.add_argument('--edit-in-place', action='store_true', help="بازپخش با پیام ویرایش‌شونده کانال")
+    parser.add_argument('--trial-check', action='store_true', help="اجرای چک تریال هم در بازپخش")
+    parser.add_argument('--output', help="ذخیره همه پیام‌ها به صورت JSONL")
+    parser.add_argument('--limit', type=int, default=50, help="حداکثر خطوط چاپ‌شده؛ 0 یعنی همه")
+    parser.add_argument('--log-level', default='ERROR')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='gold-replay-')
+    setup(args, workdir)
+    import logging
+    import main as bot
+    logging.getLogger().setLevel(args.log_level)
+
+    recorded = PriceHistory(args.history)
+    span = recorded_span(recorded, bot.PRICE_SYMBOLS.values())
+    if span is None:
+        parser.error(f"تاریخچه‌ای برای نمادهای ربات در {args.history} پیدا نشد")
+    if args.start is not None:
+        start = args.start
+    else:
+        # از ابتدای روز اولین رکورد تا کار شروع روز و اولین نوبت قیمت هم بازپخش شوند
+        first_day = bot.clock.from_timestamp(span[0]).date()
+        start = datetime.combine(first_day, day_time(), TEHRAN_TZ).timestamp()
+    end = args.end if args.end is not None else span[1] + 1
+    if end <= start:
+        parser.error("بازه بازپخش خالی است")
+
+    virtual, log = install(bot, recorded, start, args.rule)
+    wall_started = time.perf_counter()
+    runs = replay(bot, virtual, end)
+    elapsed = time.perf_counter() - wall_started
+
+    summarize(bot, log.messages, args.limit)
+    kinds = Counter(message['kind'] for message in log.messages)
+    simulated = end - start
+    print(f"🏁 {simulated / DAY:.1f} روز در {elapsed:.2f} ثانیه ({simulated / max(elapsed, 1e-9):,.0f}x)، "
+          f"{runs} اجرای کار، {len(log.messages)} پیام: " + "، ".join(f"{kind} {count}" for kind, count in sorted(kinds.items())))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for message in log.messages:
+                f.write(json.dumps(message, ensure_ascii=False) + '\n')
+        print(f"💾 پیام‌ها در {args.output} ذخیره شدند")
+
+
+if __name__ == '__main__':
+    main()
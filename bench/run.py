@@ -0,0 +1,234 @@
+"""بنچمارک و تست بار ربات روی سرورهای جعلی محلی
+
+اجرا از ریشه مخزن:
+    python -m bench.run --recipients 200 --iterations 20
+    python -m bench.run --scenario send --unthrottled --latency 0.05 --error-rate 0.01 --rate-limit 50
+    python -m bench.run --scenario day --speed 3600
+    python -m bench.run --scenario post --iterations 10 --rate-limit 1
+
+سناریوها: fetch (get_prices)، render (create_messages)، send (send_message)، e2e (دریافت تا
+تحویل به همه گیرندگان)، post (پیام ویرایش‌شونده کانال در حالت EDIT_IN_PLACE) و day (بازپخش یک روز کاری شبیه‌سازی‌شده با سرعت چند برابر از مسیر صف خروجی).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fake_servers import FakeBrsApi, FakeTelegram, FakeWhapi
+
+SCENARIOS = ('fetch', 'render', 'send', 'e2e', 'post', 'day')
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """صدک‌ها به روش nearest-rank"""
+    if not values:
+        return {point: float('nan') for point in points}
+    ordered = sorted(values)
+    return {point: ordered[min(len(ordered) - 1, max(0, int(round(point / 100 * len(ordered))) - 1))] for point in points}
+
+
+def report(title, values, count=None, elapsed=None):
+    p = percentiles(values)
+    line = f"{title:<8} n={len(values):<6} p50={p[50] * 1000:8.2f}ms p90={p[90] * 1000:8.2f}ms p99={p[99] * 1000:8.2f}ms"
+    if count is not None and elapsed:
+        line += f"  {count / elapsed:8.1f} msg/s"
+    print(line)
+
+
+def setup(args, workdir):
+    """راه‌اندازی سرورهای جعلی و تنظیم محیط قبل از import کردن main"""
+    faults = dict(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                  rate_limit=args.rate_limit, retry_after=args.retry_after, seed=args.seed)
+    brsapi = FakeBrsApi(latency=args.api_latency, seed=args.seed).start()
+    telegram = FakeTelegram(**faults).start()
+    whapi = FakeWhapi(**faults).start()
+
+    telegram_recipients = max(args.recipients - args.whatsapp, 1)
+    env = {
+        'API_KEY': 'bench',
+        'ADMIN_CHAT_ID': '1',
+        'TELEGRAM_TOKEN': 'bench',
+        'CHANNEL_ID': '@bench',
+        'TELEGRAM_RECIPIENTS': ','.join(str(100000 + i) for i in range(telegram_recipients - 1)),
+        'WHATSAPP_PHONE': '989000000000' if args.whatsapp else '',
+        'WHATSAPP_RECIPIENTS': ','.join(str(989000000001 + i) for i in range(max(args.whatsapp - 1, 0))),
+        'BRSAPI_URL': f"{brsapi.url}/Api/Market/Gold_Currency.php",
+        'TELEGRAM_API_URL': telegram.url,
+        'WHAPI_API_URL': whapi.url,
+        'OUTBOX_PATH': os.path.join(workdir, 'outbox.sqlite3'),
+        'STATE_PATH': os.path.join(workdir, 'state.json'),
+        'HISTORY_DIR': os.path.join(workdir, 'history'),
+    }
+    if args.unthrottled:
+        env.update({
+            'TELEGRAM_GLOBAL_RATE': '1000000', 'TELEGRAM_PER_CHAT_RATE': '1000000',
+            'WHATSAPP_GLOBAL_RATE': '1000000', 'WHATSAPP_PER_CHAT_RATE': '1000000',
+        })
+    os.environ.update(env)
+    return brsapi, telegram, whapi
+
+
+def fresh_prices(main, brsapi):
+    """یک قدم بازار و دریافت دوباره (بدون کش)"""
+    brsapi.step()
+    main.price_cache.invalidate()
+    return main.get_prices()
+
+
+def bench_fetch(main, brsapi, args):
+    timings = []
+    for _ in range(args.iterations):
+        started = time.perf_counter()
+        fresh_prices(main, brsapi)
+        timings.append(time.perf_counter() - started)
+    report('fetch', timings)
+
+
+def bench_render(main, brsapi, args):
+    prices = fresh_prices(main, brsapi)
+    timings = []
+    for _ in range(args.iterations):
+        snapshot = dict(prices)  # اسنپ‌شات جدید تا کش رندر دور زده شود
+        started = time.perf_counter()
+        main.create_messages(snapshot)
+        timings.append(time.perf_counter() - started)
+    report('render', timings)
+
+
+def bench_send(main, brsapi, servers, args):
+    messages = main.create_messages(fresh_prices(main, brsapi))
+    timings = []
+    sent = failed = 0
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        results = main.send_message(messages)
+        timings.extend(result['elapsed'] for result in results if result['ok'])
+        sent += sum(1 for result in results if result['ok'])
+        failed += sum(1 for result in results if not result['ok'])
+    elapsed = time.perf_counter() - started
+    report('send', timings, sent, elapsed)
+    print(f"         ارسال موفق {sent}، ناموفق {failed}، " + "، ".join(
+        f"{name}: {server.stats['throttled']} پاسخ 429، {server.stats['errors']} خطای 500"
+        for name, server in servers.items()
+    ))
+
+
+def bench_e2e(main, brsapi, servers, args):
+    latencies = []
+    delivered = 0
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        for server in servers.values():
+            with server.lock:
+                server.received.clear()
+        fetch_started = time.monotonic()
+        prices = fresh_prices(main, brsapi)
+        main.send_message(main.create_messages(prices))
+        for server in servers.values():
+            with server.lock:
+                latencies.extend(received - fetch_started for received, _, _ in server.received)
+                delivered += len(server.received)
+    elapsed = time.perf_counter() - started
+    report('e2e', latencies, delivered, elapsed)
+
+
+def bench_post(main, brsapi, servers, args):
+    """پیام ویرایش‌شونده کانال: یک ارسال و سنجاق و سپس ویرایش در هر قدم بازار (از مسیر محدودکننده نرخ)"""
+    telegram = servers['telegram']
+    main.state.update(price_post={'date': None, 'message_id': None, 'lines': None})
+    posts, edits = len(telegram.received), len(telegram.edits)
+    timings = []
+    for _ in range(args.iterations):
+        prices = fresh_prices(main, brsapi)
+        started = time.perf_counter()
+        main.update_price_post(prices)
+        timings.append(time.perf_counter() - started)
+    report('post', timings)
+    print(f"         {len(telegram.received) - posts} پیام جدید، {len(telegram.edits) - edits} ویرایش، "
+          f"{telegram.stats['throttled']} پاسخ 429، message_id={main.state['price_post']['message_id']}")
+
+
+def bench_day(main, brsapi, servers, args):
+    """بازپخش یک روز کاری: دریافت هر fetch_interval ثانیه و انتشار هر UPDATE_INTERVAL ثانیه شبیه‌سازی‌شده"""
+    fetch_interval = args.fetch_interval or main.UPDATE_INTERVAL
+    main.price_sources.max_staleness = None  # زمان قیمت‌ها شبیه‌سازی‌شده است، نه ساعت واقعی
+    main.outbox.start()
+    start = main.START_HOUR * 3600
+    end = main.END_HOUR * 3600
+    slots = publishes = 0
+    wall_started = time.perf_counter()
+    for second in range(start, end, fetch_interval):
+        hour, minute = divmod(second // 60, 60)
+        slot_started = time.perf_counter()
+        brsapi.step(quote_time=f"{hour:02d}:{minute:02d}")
+        main.price_cache.invalidate()
+        prices = main.get_prices()
+        slots += 1
+        if (second - start) % main.UPDATE_INTERVAL == 0:
+            main.publish_prices(prices, hour, minute)
+            publishes += 1
+        # تا زمان شبیه‌سازی‌شده قدم بعدی با ضریب سرعت صبر می‌کنیم
+        time.sleep(max(0.0, fetch_interval / args.speed - (time.perf_counter() - slot_started)))
+    deadline = time.monotonic() + 60
+    while main.outbox.depth() and time.monotonic() < deadline:
+        time.sleep(0.1)
+    elapsed = time.perf_counter() - wall_started
+    received = sum(len(server.received) for server in servers.values())
+    emergencies = sum(1 for server in servers.values() for _, _, text in server.received if text and 'خبر مهم' in text)
+    print(f"day      {slots} دریافت، {publishes} انتشار، {received} پیام تحویل‌شده ({emergencies} هشدار فوری) "
+          f"در {elapsed:.1f} ثانیه (سرعت {args.speed:g}x)، صف باقیمانده {main.outbox.depth()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک ربات قیمت روی سرورهای جعلی محلی")
+    parser.add_argument('--scenario', choices=SCENARIOS + ('all',), default='all')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--recipients', type=int, default=50, help="تعداد کل گیرندگان")
+    parser.add_argument('--whatsapp', type=int, default=0, help="چند گیرنده از کل، واتس‌اپ باشند")
+    parser.add_argument('--latency', type=float, default=0.02, help="تأخیر سرورهای ارسال (ثانیه)")
+    parser.add_argument('--jitter', type=float, default=0.005)
+    parser.add_argument('--api-latency', type=float, default=0.05, help="تأخیر سرور قیمت (ثانیه)")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=int, default=0, help="درخواست در ثانیه قبل از پاسخ 429؛ 0 یعنی بدون محدودیت")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--unthrottled', action='store_true', help="غیرفعال کردن محدودکننده نرخ خود ربات")
+    parser.add_argument('--speed', type=float, default=3600, help="ضریب سرعت بازپخش روز کاری")
+    parser.add_argument('--fetch-interval', type=int, default=300, help="فاصله دریافت در بازپخش روز (ثانیه شبیه‌سازی‌شده)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='gold-bench-')
+    brsapi, telegram, whapi = setup(args, workdir)
+    import logging
+    import main as bot
+    logging.getLogger().setLevel(args.log_level)
+    servers = {'telegram': telegram, 'whatsapp': whapi}
+
+    print(f"🏁 {len(bot.load_recipients())} گیرنده، {args.iterations} تکرار، داده‌ها در {workdir}")
+    scenarios = SCENARIOS if args.scenario == 'all' else (args.scenario,)
+    try:
+        for scenario in scenarios:
+            if scenario == 'fetch':
+                bench_fetch(bot, brsapi, args)
+            elif scenario == 'render':
+                bench_render(bot, brsapi, args)
+            elif scenario == 'send':
+                bench_send(bot, brsapi, servers, args)
+            elif scenario == 'e2e':
+                bench_e2e(bot, brsapi, servers, args)
+            elif scenario == 'post':
+                bench_post(bot, brsapi, servers, args)
+            elif scenario == 'day':
+                bench_day(bot, brsapi, servers, args)
+    finally:
+        bot.outbox.stop()
+        for server in (brsapi, telegram, whapi):
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """یک درخواست در حال اجرا که فراخوان‌های همزمان منتظر نتیجه‌اش می‌مانند"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlightCache:
+    """کش TTL یک مقداری با ادغام درخواست‌های همزمان (single-flight)
+
+    - تا ttl ثانیه بعد از آخرین بارگذاری موفق، مقدار کش‌شده بدون فراخوانی loader برمی‌گردد.
+    - بعد از آن فقط یک فراخوان loader را اجرا می‌کند؛ بقیه اگر مقدار قدیمی‌تر از stale_ttl
+      نباشد همان را فوراً می‌گیرند و در غیر این صورت منتظر نتیجه همان درخواست می‌مانند.
+    - اگر loader خطا بدهد و مقدار قبلی هنوز در بازه stale_ttl باشد، همان مقدار قبلی برمی‌گردد.
+    """
+
+    def __init__(self, ttl, stale_ttl, time_source=time.monotonic):
+        self._time = time_source
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded_at = None
+        self._flight = None
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'stale': 0, 'errors': 0}
+
+    def _age(self):
+        return self._time() - self._loaded_at if self._loaded_at is not None else None
+
+    def _usable_stale(self):
+        age = self._age()
+        return age is not None and age < self.stale_ttl
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def peek(self, stale=False):
+        """مقدار کش‌شده اگر هنوز تازه باشد (یا با stale=True در بازه stale_ttl)، وگرنه None"""
+        with self._lock:
+            age = self._age()
+            if age is not None and age < (self.stale_ttl if stale else self.ttl):
+                self.stats['stale' if age >= self.ttl else 'hits'] += 1
+                return self._value
+            return None
+
+    def set(self, value):
+        """ذخیره مقداری که بیرون از get (مثلاً در اجرای asyncio) بارگذاری شده است"""
+        with self._lock:
+            self.stats['misses'] += 1
+            self._value = value
+            self._loaded_at = self._time()
+
+    def get(self, loader):
+        with self._lock:
+            age = self._age()
+            if age is not None and age < self.ttl:
+                self.stats['hits'] += 1
+                return self._value
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight()
+                self.stats['misses'] += 1
+            elif self._usable_stale():
+                # درخواستی در جریان است؛ مقدار کمی قدیمی را بدون انتظار برمی‌گردانیم
+                self.stats['stale'] += 1
+                return self._value
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            result = loader()
+            with self._lock:
+                self._value = result
+                self._loaded_at = self._time()
+            flight.result = result
+        except Exception as e:
+            with self._lock:
+                self.stats['errors'] += 1
+                if self._usable_stale():
+                    self.stats['stale'] += 1
+                    flight.result = self._value
+                    logger.warning(f"⚠️ خطا در به‌روزرسانی کش، آخرین مقدار معتبر ({self._age():.0f} ثانیه پیش) استفاده شد: {e}")
+                else:
+                    flight.error = e
+        finally:
+            with self._lock:
+                self._flight = None
+            flight.event.set()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
@@ -0,0 +1,224 @@
+import logging
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# ==================== تنظیمات نمودار ====================
+WIDTH = 800
+HEIGHT = 400
+PADDING = 24
+MAX_CANDLES = 48          # بیشترین تعداد شمع در نمودار شمعی
+CACHE_SIZE = 64           # تعداد تصویرهای نگه‌داشته‌شده در حافظه
+WINDOWS = {'day': 86400, 'week': 7 * 86400}
+STYLES = ('line', 'candle')
+
+BACKGROUND = (255, 255, 255)
+GRID = (232, 232, 232)
+LINE = (33, 100, 200)
+FILL = (222, 234, 250)
+UP = (38, 166, 91)
+DOWN = (220, 53, 69)
+# =========================================================
+
+
+class _Canvas:
+    """بوم RGB ساده روی bytearray با خروجی PNG (فقط zlib، بدون کتابخانه تصویر)"""
+
+    def __init__(self, width, height, background):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(bytes(background) * (width * height))
+
+    def rect(self, x0, y0, x1, y1, color):
+        """پر کردن مستطیل [x0, x1] × [y0, y1] (مختصات شامل دو سر، بریده‌شده به اندازه بوم)"""
+        x0, x1 = max(0, min(x0, x1)), min(self.width - 1, max(x0, x1))
+        y0, y1 = max(0, min(y0, y1)), min(self.height - 1, max(y0, y1))
+        if x0 > x1 or y0 > y1:
+            return
+        row = bytes(color) * (x1 - x0 + 1)
+        for y in range(y0, y1 + 1):
+            start = (y * self.width + x0) * 3
+            self.pixels[start:start + len(row)] = row
+
+    def line(self, x0, y0, x1, y1, color, thickness=2):
+        """خط Bresenham با ضخامت thickness پیکسل"""
+        dx, dy = abs(x1 - x0), -abs(y1 - y0)
+        sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+        error = dx + dy
+        low, high = -(thickness // 2), (thickness - 1) // 2
+        while True:
+            self.rect(x0 + low, y0 + low, x0 + high, y0 + high, color)
+            if x0 == x1 and y0 == y1:
+                return
+            doubled = 2 * error
+            if doubled >= dy:
+                error += dy
+                x0 += sx
+            if doubled <= dx:
+                error += dx
+                y0 += sy
+
+    def png(self):
+        stride = self.width * 3
+        raw = b''.join(b'\x00' + bytes(self.pixels[y * stride:(y + 1) * stride]) for y in range(self.height))
+        header = struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0)
+        return b'\x89PNG\r\n\x1a\n' + _chunk(b'IHDR', header) + _chunk(b'IDAT', zlib.compress(raw, 6)) + _chunk(b'IEND', b'')
+
+
+def _chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+def _candles(points, count):
+    """تقسیم زمانی points به count بازه و محاسبه (باز, بیشترین, کمترین, بسته) بازه‌های دارای داده"""
+    start, end = points[0][0], points[-1][0]
+    span = max(end - start, 1)
+    buckets = [None] * count
+    for timestamp, price in points:
+        index = min(int((timestamp - start) / span * count), count - 1)
+        bucket = buckets[index]
+        if bucket is None:
+            buckets[index] = [price, price, price, price]
+        else:
+            bucket[1] = max(bucket[1], price)
+            bucket[2] = min(bucket[2], price)
+            bucket[3] = price
+    return buckets
+
+
+def render_png(points, style='line', width=WIDTH, height=HEIGHT):
+    """رندر نمودار خطی یا شمعی points (لیست (زمان, قیمت) مرتب) به بایت‌های PNG
+
+    تابع خالص و بدون وابستگی به وضعیت پروسه است تا در process pool اجرا شود.
+    """
+    canvas = _Canvas(width, height, BACKGROUND)
+    left, right, top, bottom = PADDING, width - PADDING - 1, PADDING, height - PADDING - 1
+    prices = [price for _, price in points]
+    low, high = min(prices), max(prices)
+    margin = (high - low) * 0.05 or abs(high) * 0.001 or 1
+    low, high = low - margin, high + margin
+
+    def y_of(price):
+        return int(round(bottom - (price - low) / (high - low) * (bottom - top)))
+
+    for step in range(5):
+        y = top + (bottom - top) * step // 4
+        canvas.rect(left, y, right, y, GRID)
+
+    if style == 'candle':
+        buckets = _candles(points, min(MAX_CANDLES, len(points)))
+        slot = (right - left + 1) / len(buckets)
+        body = max(int(slot * 0.6), 1)
+        for index, bucket in enumerate(buckets):
+            if bucket is None:
+                continue
+            opened, highest, lowest, closed = bucket
+            color = UP if closed >= opened else DOWN
+            center = int(left + slot * (index + 0.5))
+            canvas.rect(center, y_of(highest), center, y_of(lowest), color)
+            canvas.rect(center - body // 2, y_of(max(opened, closed)), center - body // 2 + body - 1, y_of(min(opened, closed)), color)
+        return canvas.png()
+
+    start, end = points[0][0], points[-1][0]
+    span = max(end - start, 1)
+    coordinates = [(int(round(left + (timestamp - start) / span * (right - left))), y_of(price)) for timestamp, price in points]
+    for (x0, y0), (x1, _) in zip(coordinates, coordinates[1:] + [(right + 1, None)]):
+        canvas.rect(x0, y0, max(x0, x1 - 1), bottom, FILL)
+    for (x0, y0), (x1, y1) in zip(coordinates, coordinates[1:]):
+        canvas.line(x0, y0, x1, y1, LINE)
+    return canvas.png()
+
+
+def start_pool(workers=2):
+    """ساخت process pool رندر نمودار و fork کردن همه کارگرهایش همین حالا
+
+    باید پیش از شروع هر نخی (از جمله نخ لاگ) صدا زده شود: fork یک پروسه چندنخی ممکن است
+    قفلی را که نخ دیگری در همان لحظه گرفته، در پروسه فرزند برای همیشه قفل‌شده باقی بگذارد.
+    با context fork کارگرها فقط render_png خالص را اجرا می‌کنند و ماژول اصلی ربات دوباره import نمی‌شود.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+    pool.submit(int)  # با context fork همه کارگرها در اولین submit یک‌جا fork می‌شوند
+    return pool
+
+
+class ChartCache:
+    """رندر نمودارها در process pool با کش تصویر و file_id تلگرام
+
+    کلید هر تصویر (نماد, بازه, سبک, زمان آخرین داده, ابتدای بازه) است؛ تا داده جدیدی ثبت نشود درخواست‌های
+    تکراری و ارسال به چند کانال همان تصویر را می‌گیرند و درخواست‌های همزمان یک رندر مشترک دارند.
+    file_id برگشتی اولین sendPhoto برای همان کلید نگه داشته می‌شود تا تصویر دوباره آپلود نشود.
+    """
+
+    def __init__(self, history, pool, width=WIDTH, height=HEIGHT):
+        self.history = history
+        self.size = (width, height)
+        self._lock = threading.Lock()
+        self._pool = pool               # ساخته‌شده با start_pool پیش از شروع نخ‌ها؛ None یعنی بدون رندر تصویر
+        self._images = OrderedDict()    # کلید -> PNG
+        self._file_ids = OrderedDict()  # کلید -> file_id تلگرام
+        self._pending = {}              # کلید -> Future رندر در جریان
+
+    def key(self, symbol, window, start, style):
+        """کلید کش تصویر یا None اگر تاریخچه‌ای نیست
+
+        start هم بخشی از کلید است: اول روز جدید (یا روز تعطیل) پیش از ثبت داده تازه، زمان آخرین
+        داده همان دیروز است ولی تصویر دیروز نباید برای بازه امروز برگردد.
+        """
+        last = self.history.last(symbol)
+        return (symbol, window, style, last[0][0], start) if last else None
+
+    def image(self, symbol, window, start, style='line'):
+        """خروجی (کلید, Future بایت‌های PNG) یا None اگر داده کافی یا process pool نیست؛ start ابتدای بازه است"""
+        if self._pool is None:
+            return None
+        key = self.key(symbol, window, start, style)
+        if key is None:
+            return None
+        with self._lock:
+            png = self._images.get(key)
+            if png is not None:
+                self._images.move_to_end(key)
+                future = Future()
+                future.set_result(png)
+                return key, future
+            if key in self._pending:
+                return key, self._pending[key]
+        points = self.history.range(symbol, start, key[3] + 1)
+        if len(points) < 2:
+            return None
+        with self._lock:
+            if key in self._pending:
+                return key, self._pending[key]
+            future = self._pool.submit(render_png, points, style, *self.size)
+            self._pending[key] = future
+        future.add_done_callback(lambda done: self._store(key, done))
+        return key, future
+
+    def _store(self, key, future):
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._images[key] = future.result()
+            while len(self._images) > CACHE_SIZE:
+                self._images.popitem(last=False)
+
+    def file_id(self, key):
+        with self._lock:
+            return self._file_ids.get(key)
+
+    def remember(self, key, file_id):
+        with self._lock:
+            self._file_ids[key] = file_id
+            while len(self._file_ids) > CACHE_SIZE * 4:
+                self._file_ids.popitem(last=False)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
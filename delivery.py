@@ -0,0 +1,398 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import logs
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# ==================== تنظیمات ارسال ====================
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', "https://api.telegram.org").rstrip('/')
+WHAPI_API_URL = os.getenv('WHAPI_API_URL', "https://api.whapi.cloud").rstrip('/')
+REQUEST_TIMEOUT = 10     # حداکثر زمان انتظار هر درخواست (ثانیه)
+POOL_SIZE = 16           # تعداد اتصال‌های باز نگه‌داشته‌شده برای هر سرویس
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 30))      # پیام در ثانیه برای کل ربات
+TELEGRAM_PER_CHAT_RATE = float(os.getenv('TELEGRAM_PER_CHAT_RATE', 1))   # پیام در ثانیه برای هر چت
+WHATSAPP_GLOBAL_RATE = float(os.getenv('WHATSAPP_GLOBAL_RATE', 10))
+WHATSAPP_PER_CHAT_RATE = float(os.getenv('WHATSAPP_PER_CHAT_RATE', 1))
+TELEGRAM_WORKERS = int(os.getenv('TELEGRAM_WORKERS', 16))
+WHATSAPP_WORKERS = int(os.getenv('WHATSAPP_WORKERS', 4))
+MAX_RETRIES = 3          # تعداد تلاش دوباره بعد از خطای 429
+MAX_RETRY_AFTER = 60     # بیشترین زمانی که برای retry_after صبر می‌کنیم (ثانیه)
+# =====================================================
+
+# یک سشن keep-alive برای هر سرویس‌دهنده تا اتصال TLS بین ارسال‌ها دوباره ساخته نشود
+_sessions = {}
+_sessions_lock = threading.Lock()
+_providers = {}
+_providers_lock = threading.Lock()
+
+# آمار ارسال‌ها برای گزارش توان عملیاتی و طول صف
+_stats_lock = threading.Lock()
+_stats = {
+    'queued': 0,
+    'sent': 0,
+    'failed': 0,
+    'retried': 0,
+    'last_broadcast': None,
+    'last_success': None,
+}
+
+SEND_SECONDS = metrics.Histogram('bot_send_seconds', 'زمان هر درخواست ارسال به سرویس‌دهنده', ['provider'])
+MESSAGES = metrics.Counter('bot_messages_total', 'تعداد پیام‌های ارسال‌شده به تفکیک نتیجه', ['provider', 'result'])
+RETRIES = metrics.Counter('bot_send_retries_total', 'تعداد تلاش‌های دوباره بعد از 429', ['provider'])
+IN_FLIGHT = metrics.Gauge('bot_send_in_flight', 'تعداد ارسال‌های در صف استخرهای کارگر')
+IN_FLIGHT.set_function(lambda: _stats['queued'])
+SINCE_BROADCAST = metrics.Gauge('bot_seconds_since_last_successful_broadcast', 'ثانیه از آخرین ارسال گروهی موفق')
+SINCE_BROADCAST.set_function(lambda: time.time() - _stats['last_success'] if _stats['last_success'] else None)
+
+
+class TokenBucket:
+    """سطل توکن ساده و thread-safe برای محدود کردن نرخ ارسال"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """صبر تا آزاد شدن یک توکن"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """توقف کامل سطل، مثلاً بعد از دریافت 429 با retry_after"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def get_session(provider):
+    """گرفتن سشن پایدار مخصوص یک سرویس‌دهنده (telegram یا whatsapp)"""
+    with _sessions_lock:
+        session = _sessions.get(provider)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[provider] = session
+        return session
+
+
+def _get_provider(name):
+    """ساخت تنبل استخر کارگر و محدودکننده‌های نرخ هر سرویس‌دهنده"""
+    with _providers_lock:
+        provider = _providers.get(name)
+        if provider is None:
+            if name == 'telegram':
+                send, workers = send_telegram, TELEGRAM_WORKERS
+                rate, per_chat_rate = TELEGRAM_GLOBAL_RATE, TELEGRAM_PER_CHAT_RATE
+            elif name == 'whatsapp':
+                send, workers = send_whatsapp, WHATSAPP_WORKERS
+                rate, per_chat_rate = WHATSAPP_GLOBAL_RATE, WHATSAPP_PER_CHAT_RATE
+            else:
+                raise ValueError(f"سرویس‌دهنده ناشناخته: {name}")
+            provider = {
+                'send': send,
+                'executor': ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"delivery-{name}"),
+                'bucket': TokenBucket(rate),
+                'per_chat_rate': per_chat_rate,
+                'chat_buckets': {},
+                'chat_lock': threading.Lock(),
+            }
+            _providers[name] = provider
+        return provider
+
+
+def _chat_bucket(provider, chat_id):
+    with provider['chat_lock']:
+        bucket = provider['chat_buckets'].get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(provider['per_chat_rate'], capacity=1)
+            provider['chat_buckets'][chat_id] = bucket
+        return bucket
+
+
+def _result(provider, chat_id, started, ok=False, status=None, error=None, response=None):
+    return {
+        'provider': provider,
+        'chat_id': chat_id,
+        'ok': ok,
+        'status': status,
+        'error': error,
+        'response': response,
+        'elapsed': time.monotonic() - started,
+    }
+
+
+def send_telegram(token, chat_id, text, parse_mode='HTML'):
+    """ارسال یک پیام به تلگرام و برگرداندن نتیجه"""
+    started = time.monotonic()
+    url = f"{TELEGRAM_API_URL}/bot{token}/sendMessage"
+    payload = {
+        'chat_id': chat_id,
+        'text': text,
+        'disable_web_page_preview': True
+    }
+    if parse_mode:
+        payload['parse_mode'] = parse_mode
+    try:
+        response = get_session('telegram').post(url, json=payload, timeout=REQUEST_TIMEOUT)
+        logger.debug("📥 پاسخ تلگرام: %s", logs.Payload(response.content), extra={'event': 'telegram.response'})
+        response.raise_for_status()
+        result = _result('telegram', chat_id, started, ok=True, status=response.status_code, response=response)
+        result['message_id'] = _telegram_message_id(response)
+        return result
+    except requests.RequestException as e:
+        status = e.response.status_code if e.response is not None else None
+        return _result('telegram', chat_id, started, status=status, error=str(e), response=e.response)
+
+
+def _telegram_message_id(response):
+    try:
+        return response.json()['result']['message_id']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _telegram_call(token, method, chat_id, payload):
+    """فراخوانی یک متد دیگر Bot API (مثل editMessageText) روی سشن تلگرام"""
+    started = time.monotonic()
+    url = f"{TELEGRAM_API_URL}/bot{token}/{method}"
+    if chat_id is not None:
+        payload = dict(payload, chat_id=chat_id)
+    try:
+        response = get_session('telegram').post(url, json=payload, timeout=REQUEST_TIMEOUT)
+        logger.debug("📥 پاسخ تلگرام (%s): %s", method, logs.Payload(response.content), extra={'event': 'telegram.response'})
+        response.raise_for_status()
+        return _result('telegram', chat_id, started, ok=True, status=response.status_code, response=response)
+    except requests.RequestException as e:
+        status = e.response.status_code if e.response is not None else None
+        return _result('telegram', chat_id, started, status=status, error=str(e), response=e.response)
+
+
+def edit_telegram(token, chat_id, message_id, text, parse_mode='HTML'):
+    """ویرایش متن یک پیام ارسال‌شده؛ پاسخ «message is not modified» موفق حساب می‌شود"""
+    payload = {
+        'message_id': message_id,
+        'text': text,
+        'disable_web_page_preview': True
+    }
+    if parse_mode:
+        payload['parse_mode'] = parse_mode
+    result = _telegram_call(token, 'editMessageText', chat_id, payload)
+    if not result['ok'] and result['status'] == 400 and 'not modified' in _telegram_description(result):
+        result.update(ok=True, error=None)
+    return result
+
+
+def pin_telegram(token, chat_id, message_id):
+    """سنجاق کردن یک پیام در چت، بدون اعلان برای اعضا"""
+    return _telegram_call(token, 'pinChatMessage', chat_id, {
+        'message_id': message_id,
+        'disable_notification': True
+    })
+
+
+def send_telegram_photo(token, chat_id, photo, caption=None, parse_mode='HTML'):
+    """ارسال تصویر با sendPhoto؛ photo بایت‌های تصویر (آپلود multipart) یا file_id قبلی است
+
+    نتیجه file_id بزرگ‌ترین اندازه تصویر را دارد تا ارسال‌های بعدی بدون آپلود دوباره انجام شوند.
+    """
+    started = time.monotonic()
+    url = f"{TELEGRAM_API_URL}/bot{token}/sendPhoto"
+    payload = {'chat_id': chat_id}
+    if caption:
+        payload['caption'] = caption
+        if parse_mode:
+            payload['parse_mode'] = parse_mode
+    try:
+        if isinstance(photo, bytes):
+            files = {'photo': ('chart.png', photo, 'image/png')}
+            response = get_session('telegram').post(url, data=payload, files=files, timeout=REQUEST_TIMEOUT)
+        else:
+            response = get_session('telegram').post(url, json=dict(payload, photo=photo), timeout=REQUEST_TIMEOUT)
+        logger.debug("📥 پاسخ تلگرام (sendPhoto): %s", logs.Payload(response.content), extra={'event': 'telegram.response'})
+        response.raise_for_status()
+        result = _result('telegram', chat_id, started, ok=True, status=response.status_code, response=response)
+        result['file_id'] = _telegram_file_id(response)
+        return result
+    except requests.RequestException as e:
+        status = e.response.status_code if e.response is not None else None
+        return _result('telegram', chat_id, started, status=status, error=str(e), response=e.response)
+
+
+def _telegram_file_id(response):
+    try:
+        return response.json()['result']['photo'][-1]['file_id']
+    except (ValueError, KeyError, TypeError, IndexError):
+        return None
+
+
+def set_telegram_webhook(token, url, secret_token=None):
+    """ثبت آدرس webhook ربات در تلگرام؛ فقط آپدیت‌های message دریافت می‌شوند"""
+    payload = {'url': url, 'allowed_updates': ['message']}
+    if secret_token:
+        payload['secret_token'] = secret_token
+    return _telegram_call(token, 'setWebhook', None, payload)
+
+
+def _telegram_description(result):
+    try:
+        return result['response'].json().get('description', '')
+    except (AttributeError, ValueError):
+        return ''
+
+
+def send_whatsapp(token, to, text):
+    """ارسال یک پیام متنی به واتس‌اپ از طریق whapi.cloud"""
+    started = time.monotonic()
+    url = f"{WHAPI_API_URL}/messages/text"
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "to": to,
+        "body": text  # واتس‌اپ از HTML پشتیبانی نمی‌کنه، متن ساده می‌فرسته
+    }
+    try:
+        response = get_session('whatsapp').post(url, json=payload, headers=headers, timeout=REQUEST_TIMEOUT)
+        logger.debug("📥 پاسخ واتس‌اپ: %s", logs.Payload(response.content), extra={'event': 'whatsapp.response'})
+        response.raise_for_status()
+        return _result('whatsapp', to, started, ok=True, status=response.status_code, response=response)
+    except requests.RequestException as e:
+        status = e.response.status_code if e.response is not None else None
+        return _result('whatsapp', to, started, status=status, error=str(e), response=e.response)
+
+
+def _retry_after(result):
+    """استخراج retry_after از پاسخ 429 (بدنه تلگرام یا هدر Retry-After)"""
+    response = result.get('response')
+    if result['status'] != 429 or response is None:
+        return None
+    try:
+        retry_after = response.json().get('parameters', {}).get('retry_after')
+    except ValueError:
+        retry_after = None
+    if retry_after is None:
+        retry_after = response.headers.get('Retry-After')
+    try:
+        return min(float(retry_after), MAX_RETRY_AFTER)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def call_limited(name, chat_id, request):
+    """اجرای request() با رعایت محدودیت نرخ سراسری و هر چت سرویس‌دهنده name و تلاش دوباره بعد از 429
+
+    request فراخوانی بدون آرگومانی است که دیکشنری نتیجه (مثل send_telegram یا edit_telegram)
+    برمی‌گرداند؛ درخواست‌های بیرون از broadcast (ویرایش و سنجاق پیام کانال) هم از همین مسیر می‌گذرند.
+    """
+    provider = _get_provider(name)
+    chat_bucket = _chat_bucket(provider, chat_id)
+    for attempt in range(MAX_RETRIES + 1):
+        chat_bucket.acquire()
+        provider['bucket'].acquire()
+        result = request()
+        SEND_SECONDS.observe(result['elapsed'], provider=name)
+        retry_after = _retry_after(result)
+        if retry_after is None or attempt == MAX_RETRIES:
+            break
+        logger.warning(f"⏳ محدودیت نرخ {name} برای {chat_id}، {retry_after:.0f} ثانیه صبر می‌کنیم")
+        provider['bucket'].pause(retry_after)
+        chat_bucket.pause(retry_after)
+        with _stats_lock:
+            _stats['retried'] += 1
+        RETRIES.inc(provider=name)
+    result['attempts'] = attempt + 1
+    return result
+
+
+def _deliver(name, token, chat_id, text):
+    """ارسال یک پیام با رعایت محدودیت نرخ سراسری و هر چت، و تلاش دوباره بعد از 429"""
+    send = _get_provider(name)['send']
+    try:
+        result = call_limited(name, chat_id, lambda: send(token, chat_id, text))
+        MESSAGES.inc(provider=name, result='ok' if result['ok'] else 'failed')
+        return result
+    finally:
+        with _stats_lock:
+            _stats['queued'] -= 1
+
+
+def broadcast(text, recipients, tokens):
+    """ارسال یک پیام به لیست گیرندگان از طریق استخرهای کارگر محدود
+
+    recipients لیستی از (سرویس‌دهنده, شناسه چت) و tokens دیکشنری توکن هر سرویس‌دهنده است.
+    text یک رشته یا دیکشنری متن هر سرویس‌دهنده است تا هر کانال قالب مخصوص خودش را بگیرد.
+    همه ارسال‌ها همزمان در صف قرار می‌گیرند و خروجی به همان ترتیب، یک نتیجه برای هر گیرنده است.
+    """
+    started = time.monotonic()
+    futures = []
+    with _stats_lock:
+        _stats['queued'] += len(recipients)
+    for name, chat_id in recipients:
+        executor = _get_provider(name)['executor']
+        body = text[name] if isinstance(text, dict) else text
+        futures.append(executor.submit(_deliver, name, tokens[name], chat_id, body))
+    results = [future.result() for future in futures]
+
+    elapsed = time.monotonic() - started
+    sent = sum(1 for result in results if result['ok'])
+    summary = {
+        'recipients': len(results),
+        'sent': sent,
+        'failed': len(results) - sent,
+        'elapsed': elapsed,
+        'rate': len(results) / elapsed if elapsed > 0 else 0.0,
+    }
+    with _stats_lock:
+        _stats['sent'] += sent
+        _stats['failed'] += len(results) - sent
+        _stats['last_broadcast'] = summary
+        if sent:
+            _stats['last_success'] = time.time()
+    if len(results) > 1:
+        logger.info("📊 ارسال گروهی: %d/%d موفق در %.2f ثانیه (%.1f پیام در ثانیه)",
+                    sent, len(results), elapsed, summary['rate'],
+                    extra={'event': 'broadcast', 'sent': sent, 'failed': summary['failed'], 'elapsed': round(elapsed, 3)})
+    return results
+
+
+def get_broadcast_stats():
+    """آمار تجمعی ارسال‌ها: تعداد موفق/ناموفق، تلاش‌های دوباره، طول صف و آخرین ارسال گروهی"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def close_sessions():
+    """بستن سشن‌ها و استخرهای کارگر هنگام خاموش شدن"""
+    with _providers_lock:
+        for provider in _providers.values():
+            provider['executor'].shutdown(wait=False)
+        _providers.clear()
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,209 @@
+import bisect
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+# هر رکورد: زمان (ثانیه از epoch، uint32) + قیمت (float64) = 12 بایت
+RECORD = struct.Struct('<Id')
+RECORD_SIZE = RECORD.size
+_SYMBOL_RE = re.compile(r'^[A-Za-z0-9_]+$')
+
+
+def valid_symbol(symbol):
+    """آیا symbol می‌تواند نام فایل ستون تاریخچه باشد (فقط حروف لاتین، رقم و _)"""
+    return bool(_SYMBOL_RE.match(symbol))
+
+
+class _Column:
+    """فایل append-only یک نماد؛ رکوردها طول ثابت دارند و بر اساس زمان مرتب‌اند
+
+    چون طول رکوردها ثابت و زمان‌ها صعودی است، خود فایل نقش ایندکس را دارد:
+    رکورد i در بایت i * RECORD_SIZE است و جستجوی بازه با bisect روی mmap انجام می‌شود.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        # رکورد ناقص انتهای فایل (مثلاً بعد از کرش) دور ریخته می‌شود
+        if size % RECORD_SIZE:
+            logger.warning(f"⚠️ رکورد ناقص در انتهای {path} حذف شد")
+            self._file.truncate(size - size % RECORD_SIZE)
+        self._map = None
+        self._mapped_size = 0
+        self.last_timestamp = self._read_last_timestamp()
+
+    def __len__(self):
+        return os.fstat(self._file.fileno()).st_size // RECORD_SIZE
+
+    def _view(self):
+        """mmap فقط‌خواندنی که با رشد فایل دوباره ساخته می‌شود"""
+        size = len(self) * RECORD_SIZE
+        if size != self._mapped_size:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ) if size else None
+            self._mapped_size = size
+        return self._map
+
+    def _read_last_timestamp(self):
+        count = len(self)
+        if not count:
+            return None
+        return RECORD.unpack_from(self._view(), (count - 1) * RECORD_SIZE)[0]
+
+    def append(self, timestamp, price):
+        timestamp = int(timestamp)
+        if self.last_timestamp is not None and timestamp < self.last_timestamp:
+            # ترتیب زمانی باید حفظ شود تا جستجوی دودویی معتبر بماند
+            timestamp = self.last_timestamp
+        self._file.write(RECORD.pack(timestamp, price))
+        self._file.flush()
+        self.last_timestamp = timestamp
+
+    def _bisect(self, view, count, timestamp):
+        """اندیس اولین رکورد با زمان >= timestamp"""
+        keys = _TimestampKeys(view, count)
+        return bisect.bisect_left(keys, timestamp)
+
+    def read(self, start=None, end=None):
+        """رکوردهای بازه [start, end) به صورت لیست (زمان, قیمت)"""
+        count = len(self)
+        if not count:
+            return []
+        view = self._view()
+        first = 0 if start is None else self._bisect(view, count, int(start))
+        last = count if end is None else self._bisect(view, count, int(end))
+        return [RECORD.unpack_from(view, i * RECORD_SIZE) for i in range(first, last)]
+
+    def tail(self, n):
+        """n رکورد آخر"""
+        count = len(self)
+        if not count or n <= 0:
+            return []
+        view = self._view()
+        return [RECORD.unpack_from(view, i * RECORD_SIZE) for i in range(max(0, count - n), count)]
+
+    def at(self, timestamp):
+        """آخرین رکورد با زمان <= timestamp"""
+        count = len(self)
+        if not count:
+            return None
+        view = self._view()
+        index = bisect.bisect_right(_TimestampKeys(view, count), int(timestamp)) - 1
+        if index < 0:
+            return None
+        return RECORD.unpack_from(view, index * RECORD_SIZE)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._mapped_size = 0
+        self._file.close()
+
+
+class _TimestampKeys:
+    """نمای دنباله‌ای از زمان رکوردها برای bisect، بدون خواندن کل فایل"""
+
+    def __init__(self, view, count):
+        self._view = view
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        return RECORD.unpack_from(self._view, index * RECORD_SIZE)[0]
+
+
+class PriceHistory:
+    """ذخیره‌ساز سری زمانی قیمت‌ها: یک فایل ستونی append-only برای هر نماد"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    def _column(self, symbol, create=False):
+        if not valid_symbol(symbol):
+            raise ValueError(f"نماد نامعتبر: {symbol}")
+        column = self._columns.get(symbol)
+        if column is None:
+            path = os.path.join(self.directory, f"{symbol}.bin")
+            if not create and not os.path.exists(path):
+                return None
+            column = _Column(path)
+            self._columns[symbol] = column
+        return column
+
+    def symbols(self):
+        """نمادهایی که تاریخچه دارند"""
+        return sorted(name[:-4] for name in os.listdir(self.directory) if name.endswith('.bin'))
+
+    def append(self, symbol, timestamp, price):
+        with self._lock:
+            self._column(symbol, create=True).append(timestamp, float(price))
+
+    def append_snapshot(self, timestamp, prices):
+        """ثبت یک اسنپ‌شات کامل؛ prices دیکشنری نماد -> قیمت است و مقادیر نامعتبر نادیده گرفته می‌شوند"""
+        with self._lock:
+            for symbol, price in prices.items():
+                try:
+                    price = float(price)
+                except (TypeError, ValueError):
+                    continue
+                self._column(symbol, create=True).append(timestamp, price)
+
+    def range(self, symbol, start=None, end=None):
+        """قیمت‌های یک نماد در بازه [start, end) به صورت لیست (زمان, قیمت)"""
+        with self._lock:
+            column = self._column(symbol)
+            return column.read(start, end) if column else []
+
+    def last(self, symbol, n=1):
+        """n قیمت آخر یک نماد"""
+        with self._lock:
+            column = self._column(symbol)
+            return column.tail(n) if column else []
+
+    def at(self, symbol, timestamp):
+        """آخرین قیمت ثبت‌شده تا لحظه timestamp یا None"""
+        with self._lock:
+            column = self._column(symbol)
+            record = column.at(timestamp) if column else None
+        return record[1] if record else None
+
+    def change(self, symbol, seconds, now):
+        """درصد تغییر قیمت در seconds ثانیه گذشته تا لحظه now"""
+        current = self.at(symbol, now)
+        previous = self.at(symbol, now - seconds)
+        if current is None or not previous:
+            return None
+        return (current - previous) / previous * 100
+
+    def ohlc(self, symbol, start, end):
+        """قیمت باز، بیشترین، کمترین و بسته بازه [start, end) یا None"""
+        records = self.range(symbol, start, end)
+        if not records:
+            return None
+        prices = [price for _, price in records]
+        return {
+            'open': prices[0],
+            'high': max(prices),
+            'low': min(prices),
+            'close': prices[-1],
+            'count': len(prices),
+        }
+
+    def close(self):
+        with self._lock:
+            for column in self._columns.values():
+                column.close()
+            self._columns.clear()
@@ -0,0 +1,156 @@
+import atexit
+import hashlib
+import json
+import logging
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+PAYLOAD_LIMIT = 200  # حداکثر طول بدنه پاسخ‌ها در لاگ (کاراکتر)؛ 0 یعنی فقط طول و هش
+
+# ویژگی‌های استاندارد LogRecord؛ بقیه ویژگی‌ها (extra) فیلدهای ساختاریافته رویداد هستند
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+class Payload:
+    """نمایش تنبل داده بزرگ (بدنه پاسخ، JSON) در لاگ
+
+    متن فقط وقتی رکورد واقعاً نوشته شود ساخته می‌شود و به PAYLOAD_LIMIT کاراکتر کوتاه
+    می‌شود؛ طول کامل و هش sha1 آن برای مقایسه پاسخ‌ها کنارش می‌آید.
+    """
+
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit=None):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        value = self.value
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', 'replace')
+        elif not isinstance(value, str):
+            value = json.dumps(value, ensure_ascii=False, default=str)
+        limit = PAYLOAD_LIMIT if self.limit is None else self.limit
+        if limit and len(value) <= limit:
+            return value
+        digest = hashlib.sha1(value.encode('utf-8')).hexdigest()[:12]
+        return f"{value[:limit]}… ({len(value)} کاراکتر، sha1={digest})"
+
+    __repr__ = __str__
+
+
+def _fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS}
+
+
+def _plain(value):
+    return value if isinstance(value, (int, float, bool, str, type(None))) else str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    """هر رکورد یک خط JSON: ts، level، logger، msg و فیلدهای extra (مثل event)"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update((key, _plain(value)) for key, value in _fields(record).items())
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """قالب متنی همیشگی ربات؛ فیلدهای extra به شکل key=value به انتهای خط اضافه می‌شوند"""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += ' | ' + ' '.join(f"{key}={_plain(value)}" for key, value in fields.items())
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """نمونه‌برداری نرخ برای هر نوع رویداد با سطل توکن
+
+    هر نوع رویداد (فیلد event رکورد یا در نبودش محل فراخوانی) تا burst رکورد پشت سر هم و بعد
+    rate رکورد در ثانیه عبور می‌کند. هشدارها و خطاها هرگز حذف نمی‌شوند و تعداد رکوردهای
+    حذف‌شده در فیلد suppressed اولین رکورد عبوری بعدی همان نوع گزارش می‌شود.
+    """
+
+    def __init__(self, rate, burst=10):
+        super().__init__()
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._buckets = {}  # نوع رویداد -> [توکن‌ها, زمان آخرین به‌روزرسانی, تعداد حذف‌شده]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = getattr(record, 'event', None) or (record.name, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler بدون فرمت کردن در نخ فراخوان؛ پیام در نخ QueueListener ساخته می‌شود
+
+    رکورد همان‌طور که هست در صف می‌رود (داخل یک پروسه نیازی به pickle نیست)، پس آرگومان‌ها
+    نباید بعد از فراخوانی لاگ تغییر کنند.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup(level='INFO', fmt='text', queue=True, sample_rate=0, sample_burst=10, payload_limit=PAYLOAD_LIMIT):
+    """پیکربندی لاگ ریشه؛ خروجی QueueListener (یا None بدون صف)
+
+    fmt برابر json خروجی JSON یک‌خطی می‌دهد. با queue نوشتن روی stderr در یک نخ جدا انجام
+    می‌شود و مسیر دریافت و ارسال فقط رکورد را در صف می‌گذارد. sample_rate (رکورد در ثانیه
+    برای هر نوع رویداد) صفر یعنی بدون نمونه‌برداری.
+    """
+    global PAYLOAD_LIMIT
+    PAYLOAD_LIMIT = payload_limit
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter(TEXT_FORMAT))
+
+    listener = None
+    handler = output
+    if queue:
+        records = SimpleQueue()
+        handler = _DeferredQueueHandler(records)
+        listener = QueueListener(records, output, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+    if sample_rate > 0:
+        handler.addFilter(SamplingFilter(sample_rate, sample_burst))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    return listener
@@ -1,18 +1,36 @@
-import requests
-from datetime import datetime
-import jdatetime
 import time
+BOOT_STARTED = time.perf_counter()  # شروع بارگذاری ماژول؛ مبدأ گزارش زمان راه‌اندازی
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache, partial
+import html
+import jdatetime
 import os
+import sys
+import threading
 import logging
-try:
-    from importlib.metadata import distribution
-except ImportError:
-    logging.error("❌ ماژول importlib.metadata پیدا نشد. لطفاً از پایتون 3.8 یا بالاتر استفاده کنید.")
-    distribution = None
+import delivery
+import metrics
+import logs
+import webhook
+from scheduler import Scheduler
+from history import PriceHistory, valid_symbol
+from analytics import PriceWindow
+from cache import SingleFlightCache
+from market_calendar import MarketCalendar
+from tehran_clock import TehranClock
+from render import PriceRenderer, format_price, get_price_change_emoji, sparkline
+from outbox import Outbox
+from state import StateStore
+from subscriptions import SubscriptionRules
+from charts import ChartCache
+from tenants import load_tenants
+import charts
+from sources import BrsApiSource, PriceAggregator
+# asyncio (در main) و async_runtime (داخل run_async) فقط در اجرای RUNTIME=asyncio import می‌شوند
 
-# تنظیم لاگ‌گذاری
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+startup_marks = [('imports', time.perf_counter())]  # (مرحله, زمان پایان) برای گزارش زمان راه‌اندازی
 
 # ==================== تنظیمات ایمن ====================
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
@@ -21,25 +39,62 @@ API_KEY = os.getenv('API_KEY')
 ADMIN_CHAT_ID = os.getenv('ADMIN_CHAT_ID')
 WHATSAPP_TOKEN = os.getenv('WHATSAPP_TOKEN', 'K4KIIXCfnPrp9pu6rCb8crIo87LYSVyv')
 WHATSAPP_PHONE = os.getenv('WHATSAPP_PHONE')
+TELEGRAM_RECIPIENTS = os.getenv('TELEGRAM_RECIPIENTS', '')  # چت‌های اضافه تلگرام، جدا شده با کاما
+WHATSAPP_RECIPIENTS = os.getenv('WHATSAPP_RECIPIENTS', '')  # شماره‌های اضافه واتس‌اپ، جدا شده با کاما
+EXTRA_SYMBOLS = os.getenv('EXTRA_SYMBOLS', '')  # نمادهای اضافه به شکل "بخش:نماد" جدا شده با کاما، مثلاً cryptocurrency:BTC
+RECIPIENTS_FILE = os.getenv('RECIPIENTS_FILE')              # فایل گیرندگان: هر خط "telegram <chat_id>" یا "whatsapp <phone>"
 UPDATE_INTERVAL = 1800  # هر 30 دقیقه
-CHECK_INTERVAL = 300    # هر 5 دقیقه
+FETCH_INTERVAL = int(os.getenv('FETCH_INTERVAL', 0))  # فاصله دریافت سریع قیمت (ثانیه)؛ 0 یعنی فقط هنگام ارسال
+PRICE_CACHE_TTL = int(os.getenv('PRICE_CACHE_TTL', min(15, max(FETCH_INTERVAL // 2, 1)) if FETCH_INTERVAL else 15))  # عمر کش قیمت‌ها (ثانیه)
+PRICE_STALE_TTL = int(os.getenv('PRICE_STALE_TTL', 900))     # حداکثر عمر اسنپ‌شات قدیمی هنگام خطای API (ثانیه)
 START_HOUR = 11         # ساعت 11 صبح تهران
 END_HOUR = 20           # ساعت 8 شب تهران
-TIME_OFFSET = 3.5       # اختلاف ساعت تهران با UTC (در ساعت)
 CHANGE_THRESHOLD = 3.0  # آستانه تغییر قیمت (3٪)
 MIN_EMERGENCY_INTERVAL = 300  # حداقل فاصله آپدیت فوری
 TRIAL_CHECK_INTERVAL = 21600  # هر 6 ساعت (6 * 60 * 60)
+TRIAL_FAILURE_THRESHOLD = 2   # تعداد چک ناموفق پشت سر هم قبل از هشدار اتمام تریال
+EMERGENCY_TTL = 900           # عمر اعلان فوری در صف خروجی (ثانیه)
+EDIT_IN_PLACE = os.getenv('EDIT_IN_PLACE', '').lower() in ('1', 'true', 'yes')  # ویرایش پیام قیمت روزانه کانال به جای پیام جدید
+EDIT_INTERVAL = int(os.getenv('EDIT_INTERVAL', 60))  # فاصله بررسی برای ویرایش پیام قیمت کانال (ثانیه)
+PIN_PRICE_POST = os.getenv('PIN_PRICE_POST', 'true').lower() in ('1', 'true', 'yes')  # سنجاق کردن پیام قیمت روزانه
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', 'data/outbox.sqlite3')  # صف پایدار پیام‌های خروجی
+VOLATILITY_WINDOW = 86400     # بازه محاسبه نوسان برای z-score (24 ساعت)
+HISTORY_DIR = os.getenv('HISTORY_DIR', 'data/history')  # محل ذخیره تاریخچه قیمت‌ها
+RULES_PATH = os.getenv('RULES_PATH', 'data/rules.sqlite3')  # قانون‌های هشدار اشتراکی مشترکان
+STATE_PATH = os.getenv('STATE_PATH', 'data/state.json')  # فایل وضعیت اجرا برای بازیابی بعد از ری‌استارت
+BRSAPI_URL = os.getenv('BRSAPI_URL', 'https://brsapi.ir/Api/Market/Gold_Currency.php')  # آدرس API قیمت (برای تست و بنچمارک قابل تغییر)
+PRICE_SOURCES = os.getenv('PRICE_SOURCES', '')               # منابع اضافه با قالب brsapi به شکل "نام=آدرس" جدا شده با کاما
+PRICE_SOURCE_MODE = os.getenv('PRICE_SOURCE_MODE', 'fastest')  # fastest (اولین پاسخ معتبر) یا median (میانه منابع)
+MAX_QUOTE_AGE = int(os.getenv('MAX_QUOTE_AGE', 1800))         # قیمتی که زمانش از این قدیمی‌تر باشد کهنه است (ثانیه)
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))  # پورت /metrics و /healthz؛ 0 یعنی غیرفعال
+TRIAL_CHECK = os.getenv('TRIAL_CHECK', 'auto').lower()  # پیام تست تریال: auto یعنی فقط وقتی /healthz فعال نیست
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 0))  # پورت webhook تلگرام (همراه /metrics و /healthz)؛ 0 یعنی غیرفعال
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')  # مسیر webhook روی سرور
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')        # آدرس عمومی کامل webhook که هنگام شروع با setWebhook ثبت می‌شود
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # مقدار هدر X-Telegram-Bot-Api-Secret-Token
+TENANTS_FILE = os.getenv('TENANTS_FILE')      # فایل JSON مشتری‌ها (حالت چندمشتری): کانال‌ها، نمادها، ساعات و آستانه هر مشتری
+OUTBOX_STUCK_AFTER = 900      # پیامی که این مدت در صف مانده باشد یعنی ارسال مختل است (ثانیه)
+RUNTIME = os.getenv('RUNTIME', 'thread').lower()  # thread (پیش‌فرض) یا asyncio
+JOB_TIMEOUT = int(os.getenv('JOB_TIMEOUT', 120))    # سقف زمان اجرای هر کار در اجرای asyncio (ثانیه)
+CHARTS = os.getenv('CHARTS', '')  # نمودارهای پایان روز به شکل "نماد:day|week[:line|candle]" جدا شده با کاما، مثلاً gold_18k:day:candle
+CHART_WORKERS = int(os.getenv('CHART_WORKERS', 2))  # تعداد پروسه‌های رندر نمودار
+CHART_TIMEOUT = 60            # حداکثر انتظار برای رندر یک نمودار (ثانیه)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # text یا json (یک رویداد JSON در هر خط)
+LOG_QUEUE = os.getenv('LOG_QUEUE', 'true').lower() in ('1', 'true', 'yes')  # نوشتن لاگ در نخ جدا، بیرون از مسیر دریافت و ارسال
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0))    # حداکثر لاگ INFO/DEBUG در ثانیه برای هر نوع رویداد؛ 0 یعنی همه
+LOG_SAMPLE_BURST = int(os.getenv('LOG_SAMPLE_BURST', 10))   # تعداد لاگ پشت سر هم مجاز قبل از نمونه‌برداری
+LOG_PAYLOAD_LIMIT = int(os.getenv('LOG_PAYLOAD_LIMIT', 200))  # حداکثر طول بدنه پاسخ‌ها در لاگ؛ 0 یعنی فقط طول و هش
 # =====================================================
 
-# لاگ نسخه‌های پکیج‌ها
-if distribution:
-    try:
-        jdatetime_version = distribution('jdatetime').version
-        logger.info(f"📦 نسخه پکیج‌ها: jdatetime={jdatetime_version}")
-    except Exception as e:
-        logger.error(f"❌ خطا در بررسی نسخه پکیج‌ها: {e}")
-else:
-    logger.warning("⚠️ importlib.metadata در دسترس نیست، نسخه پکیج‌ها بررسی نشد")
+# پروسه‌های رندر نمودار فقط وقتی نمودار تصویری لازم است (CHARTS یا دستور /chart از webhook یا gunicorn)
+# ساخته می‌شوند و باید پیش از نخ لاگ و هر نخ دیگری fork شوند؛ بدون آن‌ها /chart نمودار متنی می‌دهد
+CHART_IMAGES = bool(TELEGRAM_TOKEN) and bool(CHARTS.strip() or WEBHOOK_PORT or 'gunicorn' in sys.modules)
+chart_pool = charts.start_pool(CHART_WORKERS) if CHART_IMAGES else None
+
+# تنظیم لاگ‌گذاری
+logs.setup(LOG_LEVEL, LOG_FORMAT, queue=LOG_QUEUE, sample_rate=LOG_SAMPLE_RATE,
+           sample_burst=LOG_SAMPLE_BURST, payload_limit=LOG_PAYLOAD_LIMIT)
 
 # چک کردن متغیرهای محیطی
 if not all([API_KEY, ADMIN_CHAT_ID]):
@@ -48,129 +103,319 @@ if not all([API_KEY, ADMIN_CHAT_ID]):
     logger.error(error_message)
     raise EnvironmentError(error_message)
 
-# لیست تعطیلات 1404 (جمعه‌ها + تعطیلات رسمی)
-HOLIDAYS = [
-    "01/01", "01/02", "01/03", "01/04",  # نوروز
-    "01/07", "01/14", "01/21", "01/28",  # جمعه‌ها
-    "01/12",  # روز جمهوری اسلامی
-    "01/13",  # سیزده‌به‌در
-    "02/03", "02/04",  # عید فطر
-    "02/05", "02/12", "02/19", "02/26",  # جمعه‌ها
-    "03/02", "03/09", "03/16", "03/23", "03/30",  # جمعه‌ها (03/16 عید قربان هم هست)
-    "03/14",  # رحلت امام خمینی
-    "03/15",  # قیام 15 خرداد
-    "03/24",  # عید غدیر خم
-    "04/06", "04/13", "04/20", "04/27",  # جمعه‌ها
-    "04/14",  # تاسوعا
-    "04/15",  # عاشورا
-    "05/03", "05/10", "05/17", "05/24", "05/31",  # جمعه‌ها (05/31 رحلت رسول و شهادت امام حسن هم هست)
-    "05/23",  # اربعین
-    "06/02",  # شهادت امام رضا
-    "06/07", "06/14", "06/21", "06/28",  # جمعه‌ها
-    "06/10",  # شهادت امام حسن عسکری
-    "06/19",  # میلاد رسول اکرم و امام جعفر صادق
-    "07/05", "07/12", "07/19", "07/26",  # جمعه‌ها
-    "08/03", "08/10", "08/17", "08/24",  # جمعه‌ها
-    "09/01", "09/08", "09/15", "09/22", "09/29",  # جمعه‌ها
-    "09/03",  # شهادت حضرت فاطمه
-    "10/06", "10/13", "10/20", "10/27",  # جمعه‌ها (10/13 ولادت امام علی، 10/27 مبعث هم هست)
-    "11/04", "11/11", "11/18", "11/25",  # جمعه‌ها
-    "11/15",  # ولادت حضرت قائم
-    "11/22",  # پیروزی انقلاب اسلامی
-    "12/02", "12/09", "12/16", "12/23",  # جمعه‌ها
-    "12/20",  # شهادت امام علی
-    "12/29",  # روز ملی شدن صنعت نفت
-]
+# تقویم تعطیلات بازار (فایل‌های holidays/<سال>.json) و ساعت تهران
+market_calendar = MarketCalendar()
+clock = TehranClock(START_HOUR, END_HOUR)
+
+# نماد API برای هر کلید قیمت
+PRICE_SYMBOLS = {
+    'gold_ounce': 'XAUUSD',
+    'gold_18k': 'IR_GOLD_18K',
+    'coin_new': 'IR_COIN_BAHAR',
+    'coin_old': 'IR_COIN_EMAMI',
+    'half_coin': 'IR_COIN_HALF',
+    'quarter_coin': 'IR_COIN_QUARTER',
+    'gram_coin': 'IR_COIN_1G',
+    'usd': 'USD',
+    'eur': 'EUR',
+    'gbp': 'GBP',
+    'aed': 'AED',
+    'usdt': 'USDT_IRT',
+}
+
+# بخش پاسخ API که هر نماد در آن قرار دارد
+SYMBOL_SECTIONS = {
+    'XAUUSD': 'gold',
+    'IR_GOLD_18K': 'gold',
+    'IR_COIN_BAHAR': 'gold',
+    'IR_COIN_EMAMI': 'gold',
+    'IR_COIN_HALF': 'gold',
+    'IR_COIN_QUARTER': 'gold',
+    'IR_COIN_1G': 'gold',
+    'USD': 'currency',
+    'EUR': 'currency',
+    'GBP': 'currency',
+    'AED': 'currency',
+    'USDT_IRT': 'currency',
+}
+
+# نام فارسی کلیدهای قیمت
+PRICE_NAMES = {
+    'gold_ounce': 'انس جهانی',
+    'gold_18k': 'طلای 18 عیار',
+    'coin_new': 'سکه بهار',
+    'coin_old': 'سکه امامی',
+    'half_coin': 'نیم سکه',
+    'quarter_coin': 'ربع سکه',
+    'gram_coin': 'سکه گرمی',
+    'usd': 'دلار',
+    'eur': 'یورو',
+    'gbp': 'پوند',
+    'aed': 'درهم',
+    'usdt': 'تتر'
+}
 
-# لیست استثناها (روزهایی که نباید تعطیل باشند)
-NON_HOLIDAYS = [
-    "02/10",  # 10 اردیبهشت
-    "02/14",  # 14 اردیبهشت
+def load_extra_symbols():
+    """اضافه کردن نمادهای EXTRA_SYMBOLS به لیست نمادهای دنبال‌شده"""
+    for entry in EXTRA_SYMBOLS.split(','):
+        section, _, symbol = entry.strip().rpartition(':')
+        if not symbol:
+            continue
+        if not valid_symbol(symbol):
+            # نام نامعتبر بعداً وسط ثبت اسنپ‌شات در تاریخچه خطا می‌داد
+            logger.warning(f"⚠️ نماد نامعتبر در EXTRA_SYMBOLS نادیده گرفته شد: {entry.strip()}")
+            continue
+        PRICE_SYMBOLS.setdefault(symbol.lower(), symbol)
+        SYMBOL_SECTIONS[symbol] = section or 'currency'
+
+load_extra_symbols()
+
+# نام‌های کوتاه نمادها در دستورهای /price و /chart و فایل مشتری‌ها
+PRICE_ALIASES = {
+    '18k': 'gold_18k', 'gold': 'gold_18k', 'طلا': 'gold_18k',
+    'ounce': 'gold_ounce', 'انس': 'gold_ounce',
+    'coin': 'coin_new', 'bahar': 'coin_new', 'سکه': 'coin_new', 'بهار': 'coin_new',
+    'emami': 'coin_old', 'امامی': 'coin_old',
+    'half': 'half_coin', 'نیم': 'half_coin',
+    'quarter': 'quarter_coin', 'ربع': 'quarter_coin',
+    'gram': 'gram_coin', 'گرمی': 'gram_coin',
+    'dollar': 'usd', 'دلار': 'usd',
+    'euro': 'eur', 'یورو': 'eur',
+    'pound': 'gbp', 'پوند': 'gbp',
+    'dirham': 'aed', 'درهم': 'aed',
+    'tether': 'usdt', 'تتر': 'usdt',
+}
+PRICE_LOOKUP = {
+    **{symbol.lower(): key for key, symbol in PRICE_SYMBOLS.items()},
+    **{key: key for key in PRICE_SYMBOLS},
+    **PRICE_ALIASES,
+}
+
+def load_price_sources():
+    """ساخت منابع قیمت: brsapi.ir و منابع اضافه PRICE_SOURCES (آینه‌ها یا پراکسی‌هایی با همان قالب پاسخ)"""
+    sources = [BrsApiSource('brsapi', f'{BRSAPI_URL}?key={API_KEY}', SYMBOL_SECTIONS)]
+    for entry in PRICE_SOURCES.split(','):
+        name, _, url = entry.strip().partition('=')
+        if name and url:
+            sources.append(BrsApiSource(name.strip(), url.strip(), SYMBOL_SECTIONS))
+    return sources
+
+# دریافت موازی از همه منابع قیمت و ترکیب نتیجه طبق PRICE_SOURCE_MODE
+price_sources = PriceAggregator(load_price_sources(), mode=PRICE_SOURCE_MODE,
+                                max_staleness=MAX_QUOTE_AGE, tehran_now=clock.now)
+
+# رندر پیام قیمت با قالب‌های از پیش ساخته‌شده برای هر کانال
+price_renderer = PriceRenderer(
+    CHANNEL_ID if CHANNEL_ID else WHATSAPP_PHONE,
+    [(key, symbol) for key, symbol in PRICE_SYMBOLS.items() if key not in PRICE_NAMES]
+)
+
+# قوانین هشدار فوری؛ window بازه زمانی (ثانیه) است و اگر percent و zscore هر دو باشند باید هر دو برقرار باشند
+ALERT_RULES = [
+    {'window': UPDATE_INTERVAL, 'percent': CHANGE_THRESHOLD},  # تغییر بیش از 3٪ در 30 دقیقه
+    {'window': 900, 'zscore': 2.0, 'percent': 1.0},           # حرکت بیش از 2σ (و دست‌کم 1٪) در 15 دقیقه
 ]
 
+# مشتری‌های حالت چندمشتری؛ همه از همان دریافت و کش قیمت تغذیه می‌شوند
+tenants = load_tenants(
+    TENANTS_FILE, PRICE_LOOKUP.get,
+    extras=[(key, symbol) for key, symbol in PRICE_SYMBOLS.items() if key not in PRICE_NAMES],
+    defaults={'start_hour': START_HOUR, 'end_hour': END_HOUR,
+              'update_interval': UPDATE_INTERVAL, 'change_threshold': CHANGE_THRESHOLD},
+    providers=[provider for provider, token in (('telegram', TELEGRAM_TOKEN), ('whatsapp', WHATSAPP_TOKEN)) if token],
+) if TENANTS_FILE else []
+
 # ذخیره قیمت‌ها و متغیرهای جهانی
-last_prices = None
-last_emergency_update = 0
-last_holiday_notification = None
-start_notification_sent = False
-end_notification_sent = False
-last_suspicious_holiday_alert = None
-last_update_time = 0
-last_trial_check_time = 0
-trial_alert_sent = False
+outbox = Outbox(OUTBOX_PATH, lambda body, recipients: deliver(body, recipients))
+price_history = PriceHistory(HISTORY_DIR)
+subscription_rules = SubscriptionRules(RULES_PATH)
+chart_cache = ChartCache(price_history, chart_pool)  # رندر نمودارها در process pool جدا
+chart_sender = ThreadPoolExecutor(max_workers=2, thread_name_prefix="charts")  # انتظار رندر و آپلود بیرون از زمان‌بند
+price_cache = SingleFlightCache(ttl=PRICE_CACHE_TTL, stale_ttl=PRICE_STALE_TTL)
+http = None        # کلاینت مشترک aiohttp در اجرای asyncio (در run_async ساخته می‌شود)
+asyncio = None     # ماژول asyncio فقط در اجرای asyncio و یک بار در main import می‌شود
+price_task = None   # task دریافت قیمت در حال اجرا در اجرای asyncio
+started_at = clock.time()
+
+# متریک‌های مسیرهای پرتکرار
+FETCH_SECONDS = metrics.Histogram('bot_price_fetch_seconds', 'زمان دریافت قیمت‌ها از منابع')
+FETCHES = metrics.Counter('bot_price_fetches_total', 'تعداد دریافت قیمت‌ها به تفکیک نتیجه', ['result'])
+RENDER_SECONDS = metrics.Histogram('bot_render_seconds', 'زمان ساخت پیام قیمت', ['format'])
+SEND_MESSAGE_SECONDS = metrics.Histogram('bot_send_message_seconds', 'زمان ارسال فوری پیام (بدون صف)')
+OUTBOX_DEPTH = metrics.Gauge('bot_outbox_depth', 'تعداد پیام‌های در انتظار در صف خروجی')
+OUTBOX_DEPTH.set_function(lambda: outbox.depth())
+SINCE_FETCH = metrics.Gauge('bot_seconds_since_last_price_fetch', 'ثانیه از آخرین دریافت موفق قیمت‌ها')
+SINCE_FETCH.set_function(lambda: clock.time() - last_fetch_time if last_fetch_time else None)
+CHART_SENDS = metrics.Counter('bot_chart_sends_total', 'تعداد ارسال نمودار به تفکیک آپلود، file_id یا خطا', ['result'])
+SOURCE_LATENCY = metrics.Gauge('bot_price_source_latency_seconds', 'میانگین نمایی تأخیر هر منبع قیمت', ['source'])
+SOURCE_LATENCY.set_function(lambda: {
+    (name,): stats['latency'] for name, stats in price_sources.stats.items() if stats['latency'] is not None
+})
+SOURCE_STALENESS = metrics.Gauge('bot_price_source_staleness_seconds', 'فاصله زمان آخرین قیمت هر منبع تا الان', ['source'])
+SOURCE_STALENESS.set_function(lambda: {
+    (name,): stats['staleness'] for name, stats in price_sources.stats.items() if stats['staleness'] is not None
+})
+SOURCE_DEMOTED = metrics.Gauge('bot_price_source_demoted', 'آیا منبع قیمت موقتاً کنار گذاشته شده است', ['source'])
+SOURCE_DEMOTED.set_function(lambda: {
+    (name,): int(stats['demoted_until'] > time.time()) for name, stats in price_sources.stats.items()
+})
+price_window = PriceWindow(PRICE_SYMBOLS, span=max([VOLATILITY_WINDOW] + [
+    rule['window'] for rules in [ALERT_RULES] + [tenant.alert_rules for tenant in tenants] for rule in rules
+]))
+last_fetch_time = 0  # فقط برای گزارش؛ ذخیره نمی‌شود
+wsgi_mode = False    # اجرا زیر gunicorn (سرور HTTP بیرونی)
+
+# وضعیت اجرا که بعد از ری‌استارت بازیابی می‌شود؛ پرچم‌های روزانه تاریخ (ISO) روز ارسال را نگه می‌دارند
+state = StateStore(STATE_PATH, {
+    'last_prices': None,
+    'last_emergency_update': 0,
+    'last_update_time': 0,
+    'last_trial_check_time': 0,
+    'trial_check_failures': 0,
+    'trial_alert_date': None,
+    'start_notification_date': None,
+    'end_notification_date': None,
+    'holiday_notification_date': None,
+    'suspicious_holiday_alert_date': None,
+    'price_post': {'date': None, 'message_id': None, 'lines': None},  # پیام قیمت روزانه کانال در حالت ویرایش
+    'tenant_emergency': {},  # نام مشتری -> زمان آخرین اعلان فوری
+})
 
 def get_tehran_time():
-    """محاسبه ساعت و دقیقه تهران با اعمال TIME_OFFSET"""
-    current_time = datetime.now()
-    total_minutes = current_time.hour * 60 + current_time.minute + int(TIME_OFFSET * 60)
-    tehran_hour = total_minutes // 60 % 24
-    tehran_minute = total_minutes % 60
-    logger.info(f"⏰ زمان سرور: {current_time.strftime('%H:%M')} | زمان تهران: {tehran_hour:02d}:{tehran_minute:02d}")
-    return tehran_hour, tehran_minute
+    """ساعت و دقیقه فعلی تهران (از اسنپ‌شات دقیقه‌ای ساعت)"""
+    snapshot = clock.snapshot()
+    return snapshot.hour, snapshot.minute
 
-def send_message(text, chat_id=None):
-    """ارسال پیام به تلگرام و واتس‌اپ به صورت همزمان"""
-    success = False
-    
-    # ارسال به تلگرام (اگه توکن تنظیم شده باشه)
+# گیرندگان کش‌شده و زمان تغییر فایل گیرندگانی که از آن خوانده شده‌اند
+_recipients_cache = {'mtime': None, 'recipients': None}
+
+def load_recipients():
+    """لیست گیرندگان پیام قیمت؛ فایل گیرندگان فقط وقتی دوباره خوانده می‌شود که تغییر کرده باشد"""
+    mtime = None
+    if RECIPIENTS_FILE:
+        try:
+            mtime = os.stat(RECIPIENTS_FILE).st_mtime_ns
+        except OSError:
+            pass  # خطا هنگام خواندن فایل در read_recipients لاگ می‌شود
+    if _recipients_cache['recipients'] is None or _recipients_cache['mtime'] != mtime:
+        _recipients_cache['recipients'] = read_recipients()
+        _recipients_cache['mtime'] = mtime
+    return list(_recipients_cache['recipients'])
+
+def read_recipients():
+    """ساخت لیست گیرندگان پیام قیمت از کانال اصلی، متغیرهای محیطی و فایل گیرندگان"""
+    recipients = []
     if TELEGRAM_TOKEN and CHANNEL_ID:
+        recipients.append(('telegram', CHANNEL_ID))
+    if WHATSAPP_TOKEN and WHATSAPP_PHONE:
+        recipients.append(('whatsapp', WHATSAPP_PHONE))
+    
+    extra = [('telegram', chat_id) for chat_id in TELEGRAM_RECIPIENTS.split(',')]
+    extra += [('whatsapp', phone) for phone in WHATSAPP_RECIPIENTS.split(',')]
+    if RECIPIENTS_FILE:
         try:
-            url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-            payload = {
-                'chat_id': CHANNEL_ID if not chat_id else chat_id,
-                'text': text,
-                'parse_mode': 'HTML',
-                'disable_web_page_preview': True
-            }
-            logger.info(f"📤 در حال ارسال پیام به تلگرام: {CHANNEL_ID if not chat_id else chat_id}")
-            response = requests.post(url, json=payload, timeout=10)
-            logger.info(f"📥 پاسخ تلگرام: {response.text}")
-            response.raise_for_status()
-            logger.info("✅ پیام به تلگرام ارسال شد")
-            success = True
-        except Exception as e:
-            logger.error(f"❌ ارسال پیام به تلگرام ناموفق: {e}")
+            with open(RECIPIENTS_FILE, encoding='utf-8') as f:
+                for line in f:
+                    line = line.split('#', 1)[0].split()
+                    if len(line) == 2:
+                        extra.append((line[0].lower(), line[1]))
+        except OSError as e:
+            logger.error(f"❌ خواندن فایل گیرندگان ناموفق: {e}")
+    
+    tokens = {'telegram': TELEGRAM_TOKEN, 'whatsapp': WHATSAPP_TOKEN}
+    for provider, chat_id in extra:
+        chat_id = chat_id.strip()
+        if chat_id and tokens.get(provider):
+            recipients.append((provider, chat_id))
     
-    # ارسال به واتس‌اپ (اگه توکن و شماره تنظیم شده باشه)
+    # حذف گیرندگان تکراری با حفظ ترتیب
+    return list(dict.fromkeys(recipients))
+
+def resolve_recipients(chat_id=None):
+    """گیرندگان یک پیام: با chat_id همان چت روی سرویس‌های فعال، وگرنه همه گیرندگان load_recipients"""
+    if not chat_id:
+        return load_recipients()
+    recipients = []
+    if TELEGRAM_TOKEN and CHANNEL_ID:
+        recipients.append(('telegram', chat_id))
     if WHATSAPP_TOKEN and WHATSAPP_PHONE:
-        try:
-            url = f"https://api.whapi.cloud/messages/text"
-            headers = {
-                "Authorization": f"Bearer {WHATSAPP_TOKEN}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "to": WHATSAPP_PHONE if not chat_id else chat_id,
-                "body": text  # واتس‌اپ از HTML پشتیبانی نمی‌کنه، متن ساده می‌فرسته
-            }
-            logger.info(f"📤 در حال ارسال پیام به واتس‌اپ: {WHATSAPP_PHONE if not chat_id else chat_id}")
-            response = requests.post(url, json=payload, headers=headers, timeout=10)
-            logger.info(f"📥 پاسخ واتس‌اپ: {response.text}")
-            response.raise_for_status()
-            logger.info("✅ پیام به واتس‌اپ ارسال شد")
-            success = True
-        except Exception as e:
-            logger.error(f"❌ ارسال پیام به واتس‌اپ ناموفق: {e}")
+        recipients.append(('whatsapp', chat_id))
+    return recipients
+
+def send_message(text, chat_id=None):
+    """ارسال فوری پیام به تلگرام و واتس‌اپ به صورت همزمان (بدون صف)
+
+    بدون chat_id پیام به همه گیرندگان load_recipients ارسال می‌شود.
+    text می‌تواند یک رشته یا دیکشنری متن هر سرویس‌دهنده ({'telegram': ..., 'whatsapp': ...}) باشد.
+    خروجی لیستی از نتیجه‌ها است، یکی برای هر گیرنده؛ برای موفقیت کلی از delivered استفاده کنید.
+    """
+    recipients = resolve_recipients(chat_id)
+    
+    if not recipients:
+        logger.warning("⚠️ هیچ گیرنده‌ای تنظیم نشده، پیام ارسال نشد")
+        return []
+    
+    logger.info("📤 در حال ارسال پیام به %d گیرنده", len(recipients), extra={'event': 'send'})
+    with SEND_MESSAGE_SECONDS.time():
+        results = deliver(text, recipients)
+    for result in results:
+        name = 'تلگرام' if result['provider'] == 'telegram' else 'واتس‌اپ'
+        if result['ok']:
+            logger.debug("✅ پیام به %s (%s) ارسال شد (%.2f ثانیه)", name, result['chat_id'], result['elapsed'],
+                         extra={'event': 'send.result'})
+        else:
+            logger.error(f"❌ ارسال پیام به {name} ({result['chat_id']}) ناموفق: {result['error']}")
+    if delivered(results):
+        logger.info("✅ پیام ارسال شد")
     
-    return success
+    return results
+
+def deliver(text, recipients):
+    """ارسال مستقیم یک متن به لیست گیرندگان از طریق موتور ارسال گروهی"""
+    tokens = {'telegram': TELEGRAM_TOKEN, 'whatsapp': WHATSAPP_TOKEN}
+    return delivery.broadcast(text, recipients, tokens)
+
+def queue_message(text, chat_id=None, kind='admin', dedup_key=None, ttl=None, recipients=None):
+    """قرار دادن پیام در صف پایدار خروجی؛ بلافاصله برمی‌گردد و ارسال با تلاش دوباره انجام می‌شود
+
+    dedup_key جلوی ارسال دوباره همان پیام را (مثلاً بعد از ری‌استارت) می‌گیرد و
+    ttl (ثانیه) باعث می‌شود پیامی که به موقع نرسیده، دیرهنگام ارسال نشود.
+    recipients اگر داده شود به جای گیرندگان پیش‌فرض استفاده می‌شود.
+    """
+    if recipients is None:
+        recipients = resolve_recipients(chat_id)
+    if not recipients:
+        logger.warning("⚠️ هیچ گیرنده‌ای تنظیم نشده، پیام در صف قرار نگرفت")
+        return 0
+    added = outbox.enqueue(text, recipients, kind, dedup_key=dedup_key, ttl=ttl)
+    logger.info("📥 پیام %s برای %d گیرنده در صف خروجی قرار گرفت", kind, added,
+                extra={'event': 'outbox.enqueue', 'kind': kind, 'recipients': added})
+    return added
+
+def delivered(results):
+    """آیا پیام دست‌کم به یکی از کانال‌ها رسید؟"""
+    return any(result['ok'] for result in results)
+
+def today_key():
+    """تاریخ امروز تهران به شکل ISO؛ کلید پرچم‌های روزانه در وضعیت"""
+    return clock.snapshot().tehran.date().isoformat()
 
 def get_jalali_date():
-    """گرفتن تاریخ شمسی بدون منطقه زمانی"""
-    return jdatetime.datetime.now().strftime("%Y/%m/%d")
+    """گرفتن تاریخ شمسی امروز به وقت تهران"""
+    return clock.snapshot().jalali.strftime("%Y/%m/%d")
+
+def is_trading_day(tehran_time):
+    """آیا روز مربوط به یک زمان تهران روز کاری بازار است؟"""
+    return not market_calendar.is_holiday(tehran_time.date())
 
 def is_holiday():
     """چک کردن اینکه امروز تعطیل است یا نه"""
-    today = jdatetime.datetime.now()
-    month_day = today.strftime("%m/%d")
-    gregorian_date = datetime.now().strftime("%Y-%m-%d")
-    logger.info(f"📅 تاریخ شمسی: {get_jalali_date()} | تاریخ میلادی: {gregorian_date}")
+    today = market_calendar.day(clock.snapshot().tehran.date())
+    month_day = today.jalali.strftime("%m/%d")
+    logger.info(f"📅 تاریخ شمسی: {today.jalali.strftime('%Y/%m/%d')} | تاریخ میلادی: {today.date.isoformat()}")
 
-    if month_day in NON_HOLIDAYS:
-        logger.info(f"📅 {month_day} در لیست استثناها - تعطیل نیست")
-        return False
-    
-    if month_day in HOLIDAYS:
-        logger.info(f"📅 {month_day} در لیست تعطیلات یافت شد")
+    if today.is_holiday:
+        logger.info(f"📅 {month_day} در لیست تعطیلات یافت شد ({today.occasion})")
         send_suspicious_holiday_alert(today)
         return True
     
@@ -179,96 +424,43 @@ def is_holiday():
 
 def send_suspicious_holiday_alert(today):
     """ارسال اعلان برای تعطیلات مشکوک به ادمین"""
-    global last_suspicious_holiday_alert
     if not ADMIN_CHAT_ID:
         logger.warning("⚠️ ADMIN_CHAT_ID تنظیم نشده، اعلان تعطیلات مشکوک ارسال نشد")
         return
     
-    current_date = today.date()
-    if last_suspicious_holiday_alert and last_suspicious_holiday_alert.date() == current_date:
+    if state['suspicious_holiday_alert_date'] == today.date.isoformat():
         logger.info("⏭️ اعلان تعطیلات مشکوک قبلاً امروز ارسال شده، صرف‌نظر شد")
         return
     
-    month_day = today.strftime("%m/%d")
-    event_text = {
-        "01/01": "نوروز", "01/02": "نوروز", "01/03": "نوروز", "01/04": "نوروز",
-        "01/07": "جمعه", "01/14": "جمعه", "01/21": "جمعه", "01/28": "جمعه",
-        "01/12": "روز جمهوری اسلامی", "01/13": "سیزده‌به‌در",
-        "02/03": "عید فطر", "02/04": "عید فطر",
-        "02/05": "جمعه", "02/12": "جمعه", "02/19": "جمعه", "02/26": "جمعه",
-        "03/02": "جمعه", "03/09": "جمعه", "03/16": "عید قربان", "03/23": "جمعه", "03/30": "جمعه",
-        "03/14": "رحلت امام خمینی", "03/15": "قیام 15 خرداد", "03/24": "عید غدیر خم",
-        "04/06": "جمعه", "04/13": "جمعه", "04/20": "جمعه", "04/27": "جمعه",
-        "04/14": "تاسوعا", "04/15": "عاشورا",
-        "05/03": "جمعه", "05/10": "جمعه", "05/17": "جمعه", "05/24": "جمعه", "05/31": "رحلت رسول و شهادت امام حسن",
-        "05/23": "اربعین",
-        "06/02": "شهادت امام رضا",
-        "06/07": "جمعه", "06/14": "جمعه", "06/21": "جمعه", "06/28": "جمعه",
-        "06/10": "شهادت امام حسن عسکری", "06/19": "میلاد رسول اکرم و امام جعفر صادق",
-        "07/05": "جمعه", "07/12": "جمعه", "07/19": "جمعه", "07/26": "جمعه",
-        "08/03": "جمعه", "08/10": "جمعه", "08/17": "جمعه", "08/24": "جمعه",
-        "09/01": "جمعه", "09/08": "جمعه", "09/15": "جمعه", "09/22": "جمعه", "09/29": "جمعه",
-        "09/03": "شهادت حضرت فاطمه",
-        "10/06": "جمعه", "10/13": "ولادت امام علی", "10/20": "جمعه", "10/27": "مبعث",
-        "11/04": "جمعه", "11/11": "جمعه", "11/18": "جمعه", "11/25": "جمعه",
-        "11/15": "ولادت حضرت قائم", "11/22": "پیروزی انقلاب اسلامی",
-        "12/02": "جمعه", "12/09": "جمعه", "12/16": "جمعه", "12/23": "جمعه",
-        "12/20": "شهادت امام علی", "12/29": "روز ملی شدن صنعت نفت"
-    }.get(month_day, "نامشخص")
-    
     message = f"""
 ⚠️ هشدار تعطیلات مشکوک!
 📅 تاریخ: {get_jalali_date()}
-🔔 روز {today.strftime('%Y/%m/%d')} به عنوان تعطیل تشخیص داده شد
-مناسبت: {event_text}
+🔔 روز {today.jalali.strftime('%Y/%m/%d')} به عنوان تعطیل تشخیص داده شد
+مناسبت: {today.occasion or "نامشخص"}
 لطفاً بررسی کنید که آیا این روز واقعاً تعطیل است!
 ▫️ {CHANNEL_ID if CHANNEL_ID else WHATSAPP_PHONE}
 """
     logger.info(f"📤 در حال ارسال اعلان تعطیلات مشکوک به ADMIN_CHAT_ID={ADMIN_CHAT_ID}")
-    send_message(message, chat_id=ADMIN_CHAT_ID)
-    last_suspicious_holiday_alert = today
-    logger.info("✅ اعلان تعطیلات مشکوک ارسال شد")
+    queue_message(message, chat_id=ADMIN_CHAT_ID, dedup_key=f"suspicious-holiday:{today.date}")
+    state.update(suspicious_holiday_alert_date=today.date.isoformat())
+    logger.info("✅ اعلان تعطیلات مشکوک در صف ارسال قرار گرفت")
 
 def send_holiday_notification():
     """ارسال اعلان تعطیلات به ادمین"""
-    today = jdatetime.datetime.now()
-    month_day = today.strftime("%m/%d")
-    event_text = {
-        "01/01": "نوروز", "01/02": "نوروز", "01/03": "نوروز", "01/04": "نوروز",
-        "01/07": "جمعه", "01/14": "جمعه", "01/21": "جمعه", "01/28": "جمعه",
-        "01/12": "روز جمهوری اسلامی", "01/13": "سیزده‌به‌در",
-        "02/03": "عید فطر", "02/04": "عید فطر",
-        "02/05": "جمعه", "02/12": "جمعه", "02/19": "جمعه", "02/26": "جمعه",
-        "03/02": "جمعه", "03/09": "جمعه", "03/16": "عید قربان", "03/23": "جمعه", "03/30": "جمعه",
-        "03/14": "رحلت امام خمینی", "03/15": "قیام 15 خرداد", "03/24": "عید غدیر خم",
-        "04/06": "جمعه", "04/13": "جمعه", "04/20": "جمعه", "04/27": "جمعه",
-        "04/14": "تاسوعا", "04/15": "عاشورا",
-        "05/03": "جمعه", "05/10": "جمعه", "05/17": "جمعه", "05/24": "جمعه", "05/31": "رحلت رسول و شهادت امام حسن",
-        "05/23": "اربعین",
-        "06/02": "شهادت امام رضا",
-        "06/07": "جمعه", "06/14": "جمعه", "06/21": "جمعه", "06/28": "جمعه",
-        "06/10": "شهادت امام حسن عسکری", "06/19": "میلاد رسول اکرم و امام جعفر صادق",
-        "07/05": "جمعه", "07/12": "جمعه", "07/19": "جمعه", "07/26": "جمعه",
-        "08/03": "جمعه", "08/10": "جمعه", "08/17": "جمعه", "08/24": "جمعه",
-        "09/01": "جمعه", "09/08": "جمعه", "09/15": "جمعه", "09/22": "جمعه", "09/29": "جمعه",
-        "09/03": "شهادت حضرت فاطمه",
-        "10/06": "جمعه", "10/13": "ولادت امام علی", "10/20": "جمعه", "10/27": "مبعث",
-        "11/04": "جمعه", "11/11": "جمعه", "11/18": "جمعه", "11/25": "جمعه",
-        "11/15": "ولادت حضرت قائم", "11/22": "پیروزی انقلاب اسلامی",
-        "12/02": "جمعه", "12/09": "جمعه", "12/16": "جمعه", "12/23": "جمعه",
-        "12/20": "شهادت امام علی", "12/29": "روز ملی شدن صنعت نفت"
-    }.get(month_day, "تعطیل رسمی")
+    today = market_calendar.day(clock.snapshot().tehran.date())
+    event_text = today.occasion or "تعطیل رسمی"
+    next_day = jdatetime.date.fromgregorian(date=market_calendar.next_trading_day(today.date))
     
     message = f"""
 📢 امروز تعطیله!
 📅 تاریخ: {get_jalali_date()}
 🔔 مناسبت: {event_text}
-بازار بسته‌ست و آپدیت قیمت نداریم. روز کاری بعدی ساعت 11 صبح شروع می‌کنیم!
+بازار بسته‌ست و آپدیت قیمت نداریم. روز کاری بعدی ({next_day.strftime('%Y/%m/%d')}) ساعت 11 صبح شروع می‌کنیم!
 ▫️ {CHANNEL_ID if CHANNEL_ID else WHATSAPP_PHONE}
 """
     logger.info(f"📤 در حال ارسال اعلان تعطیلات به ADMIN_CHAT_ID={ADMIN_CHAT_ID}")
-    send_message(message, chat_id=ADMIN_CHAT_ID)
-    logger.info("✅ اعلان تعطیلات ارسال شد")
+    queue_message(message, chat_id=ADMIN_CHAT_ID, dedup_key=f"holiday:{today.date}")
+    logger.info("✅ اعلان تعطیلات در صف ارسال قرار گرفت")
 
 def send_immediate_test_message():
     """ارسال پیام تست فوری به ادمین"""
@@ -291,8 +483,7 @@ def send_immediate_test_message():
 
 def send_trial_expiry_alert():
     """ارسال پیام هشدار اتمام تریال به ادمین"""
-    global trial_alert_sent
-    if trial_alert_sent:
+    if state['trial_alert_date'] == today_key():
         logger.info("⏭️ پیام هشدار اتمام تریال قبلاً ارسال شده، صرف‌نظر شد")
         return
     
@@ -305,20 +496,20 @@ def send_trial_expiry_alert():
 لطفاً به Railway مراجعه کنید و وضعیت اکانت را بررسی کنید!
 """
     logger.info(f"📤 در حال ارسال پیام هشدار اتمام تریال به ADMIN_CHAT_ID={ADMIN_CHAT_ID}")
-    if send_message(message, chat_id=ADMIN_CHAT_ID):
-        trial_alert_sent = True
-        logger.info("✅ پیام هشدار اتمام تریال ارسال شد")
+    # از طریق صف ارسال می‌شود تا اگر سرویس‌دهنده فعلاً در دسترس نیست، بعداً دوباره تلاش شود
+    if queue_message(message, chat_id=ADMIN_CHAT_ID, dedup_key=f"trial-expiry:{today_key()}"):
+        state.update(trial_alert_date=today_key())
+        logger.info("✅ پیام هشدار اتمام تریال در صف ارسال قرار گرفت")
     else:
         logger.error("❌ ارسال پیام هشدار اتمام تریال ناموفق بود")
 
 def check_trial_status():
-    """چک کردن وضعیت اکانت Railway با ارسال پیام تست"""
-    global last_trial_check_time
-    current_time = time.time()
-    
-    if current_time - last_trial_check_time < TRIAL_CHECK_INTERVAL:
-        logger.info("⏳ فاصله چک وضعیت اکانت کمتر از 6 ساعت است، منتظر می‌مانیم")
-        return
+    """چک کردن وضعیت اکانت Railway با ارسال پیام تست
+
+    هشدار اتمام تریال فقط بعد از TRIAL_FAILURE_THRESHOLD چک ناموفق پشت سر هم ارسال می‌شود
+    تا یک خطای گذرای شبکه به اشتباه اتمام تریال تعبیر نشود.
+    """
+    current_time = clock.time()
     
     tehran_hour, tehran_minute = get_tehran_time()
     test_message = f"""
@@ -328,28 +519,30 @@ def check_trial_status():
 این پیام برای چک کردن وضعیت سرور ارسال شده است.
 """
     logger.info(f"📤 در حال ارسال پیام تست وضعیت به ADMIN_CHAT_ID={ADMIN_CHAT_ID}")
-    if not send_message(test_message, chat_id=ADMIN_CHAT_ID):
-        logger.warning("⚠️ ارسال پیام تست وضعیت ناموفق بود، احتمالاً اکانت تریال تمام شده است")
-        send_trial_expiry_alert()
+    if not delivered(send_message(test_message, chat_id=ADMIN_CHAT_ID)):
+        trial_check_failures = state['trial_check_failures'] + 1
+        state.update(trial_check_failures=trial_check_failures, last_trial_check_time=current_time)
+        logger.warning(f"⚠️ ارسال پیام تست وضعیت ناموفق بود ({trial_check_failures} بار پشت سر هم)")
+        if trial_check_failures >= TRIAL_FAILURE_THRESHOLD:
+            logger.warning("⚠️ احتمالاً اکانت تریال تمام شده است")
+            send_trial_expiry_alert()
     else:
+        state.update(trial_check_failures=0, last_trial_check_time=current_time)
         logger.info("✅ پیام تست وضعیت با موفقیت ارسال شد، سرور فعال است")
-    
-    last_trial_check_time = current_time
 
 def send_start_notification():
     """ارسال پیام شروع به ادمین"""
-    global start_notification_sent
     tehran_hour, tehran_minute = get_tehran_time()
     
-    if ADMIN_CHAT_ID and not start_notification_sent:
+    if ADMIN_CHAT_ID and state['start_notification_date'] != today_key():
         admin_message = f"""
 ✅ امروز پیام ارسال شد در روز {get_jalali_date()}
 ⏰ ساعت: {tehran_hour:02d}:{tehran_minute:02d}
 """
         logger.info(f"📤 در حال ارسال پیام شروع روز به ADMIN_CHAT_ID={ADMIN_CHAT_ID}")
-        send_message(admin_message, chat_id=ADMIN_CHAT_ID)
+        queue_message(admin_message, chat_id=ADMIN_CHAT_ID, dedup_key=f"day-start:{today_key()}")
         logger.info("✅ پیام شروع روز به ادمین ارسال شد")
-        start_notification_sent = True
+        state.update(start_notification_date=today_key())
 
 def send_test_admin_message():
     """ارسال پیام تست به ADMIN_CHAT_ID برای اطمینان از تنظیمات"""
@@ -371,185 +564,656 @@ def send_test_admin_message():
 
 def send_end_notification():
     """ارسال پیام پایان به ادمین"""
-    global end_notification_sent
     tehran_hour, tehran_minute = get_tehran_time()
     
-    if ADMIN_CHAT_ID and not end_notification_sent:
+    if ADMIN_CHAT_ID and state['end_notification_date'] != today_key():
         admin_message = f"""
 ✅ روز کاری به پایان رسید در تاریخ {get_jalali_date()}
 ⏰ ساعت: {tehran_hour:02d}:{tehran_minute:02d}
 """
         logger.info(f"📤 در حال ارسال پیام پایان روز به ADMIN_CHAT_ID={ADMIN_CHAT_ID}")
-        send_message(admin_message, chat_id=ADMIN_CHAT_ID)
+        queue_message(admin_message, chat_id=ADMIN_CHAT_ID, dedup_key=f"day-end:{today_key()}")
         logger.info("✅ پیام پایان روز به ادمین ارسال شد")
-        end_notification_sent = True
-
-def get_price_change_emoji(change_percent):
-    """تعیین ایموجی تغییر قیمت"""
-    if change_percent > 0:
-        return "🔺"
-    elif change_percent < 0:
-        return "🔻"
-    return "➖"
-
-def find_item_by_symbol(items, symbol):
-    for item in items:
-        if item['symbol'] == symbol:
-            return item
-    return None
+        state.update(end_notification_date=today_key())
+
+def extract_prices(index, update_time=None):
+    """ساخت اسنپ‌شات قیمت‌ها از ایندکس نماد -> آیتم منابع قیمت"""
+    prices = {'update_time': update_time or clock.snapshot().tehran.strftime("%H:%M")}
+    for key, symbol in PRICE_SYMBOLS.items():
+        prices[key] = index.get(symbol) or {'price': 'N/A', 'change_percent': 0}
+    return prices
+
+def http_get(url, headers, timeout):
+    """درخواست GET با سشن keep-alive منابع قیمت؛ خروجی (کد وضعیت, هدرها, بدنه)"""
+    response = delivery.get_session('prices').get(url, headers=headers, timeout=timeout)
+    return response.status_code, response.headers, response.content
+
+def fetch_prices():
+    """دریافت موازی از منابع قیمت؛ خروجی (ایندکس, زمان قیمت) یا None اگر تغییری نکرده باشد
+
+    پاسخ تکراری هر منبع (304 یا بدنه هم‌هش) نه دیکود می‌شود و نه به تحلیل و تاریخچه می‌رسد.
+    """
+    global last_fetch_time
+    logger.info("📡 ارسال درخواست به منابع قیمت", extra={'event': 'price.fetch'})
+    started = time.monotonic()
+    try:
+        data = price_sources.fetch(http_get)
+    except Exception:
+        FETCHES.inc(result='error')
+        raise
+    finally:
+        FETCH_SECONDS.observe(time.monotonic() - started)
+    FETCHES.inc(result='unchanged' if data is None else 'ok')
+    last_fetch_time = clock.time()
+    return data
+
+async def fetch_prices_async():
+    """نسخه غیرمسدودکننده fetch_prices روی کلاینت مشترک aiohttp"""
+    global last_fetch_time
+    logger.info("📡 ارسال درخواست به منابع قیمت", extra={'event': 'price.fetch'})
+    started = time.monotonic()
+    try:
+        data = await price_sources.fetch_async(http.get)
+    except Exception:
+        FETCHES.inc(result='error')
+        raise
+    finally:
+        FETCH_SECONDS.observe(time.monotonic() - started)
+    FETCHES.inc(result='unchanged' if data is None else 'ok')
+    last_fetch_time = clock.time()
+    return data
 
 def get_prices():
-    global last_prices, last_emergency_update
+    """گرفتن قیمت‌های فعلی از کش؛ فراخوان‌های همزمان یک درخواست مشترک به API می‌فرستند"""
     try:
-        url = f'https://brsapi.ir/Api/Market/Gold_Currency.php?key={API_KEY}'
-        logger.info(f"📡 ارسال درخواست به API: {url}")
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        logger.info(f"📥 داده‌های API دریافت شد: {data}")
-
-        update_time = data['gold'][0]['time'] if data['gold'] else datetime.now().strftime("%H:%M")
-
-        prices = {
-            'update_time': update_time,
-            'gold_ounce': find_item_by_symbol(data['gold'], 'XAUUSD') or {'price': 'N/A', 'change_percent': 0},
-            'gold_18k': find_item_by_symbol(data['gold'], 'IR_GOLD_18K') or {'price': 'N/A', 'change_percent': 0},
-            'coin_new': find_item_by_symbol(data['gold'], 'IR_COIN_BAHAR') or {'price': 'N/A', 'change_percent': 0},
-            'coin_old': find_item_by_symbol(data['gold'], 'IR_COIN_EMAMI') or {'price': 'N/A', 'change_percent': 0},
-            'half_coin': find_item_by_symbol(data['gold'], 'IR_COIN_HALF') or {'price': 'N/A', 'change_percent': 0},
-            'quarter_coin': find_item_by_symbol(data['gold'], 'IR_COIN_QUARTER') or {'price': 'N/A', 'change_percent': 0},
-            'gram_coin': find_item_by_symbol(data['gold'], 'IR_COIN_1G') or {'price': 'N/A', 'change_percent': 0},
-            'usd': find_item_by_symbol(data['currency'], 'USD') or {'price': 'N/A', 'change_percent': 0},
-            'eur': find_item_by_symbol(data['currency'], 'EUR') or {'price': 'N/A', 'change_percent': 0},
-            'gbp': find_item_by_symbol(data['currency'], 'GBP') or {'price': 'N/A', 'change_percent': 0},
-            'aed': find_item_by_symbol(data['currency'], 'AED') or {'price': 'N/A', 'change_percent': 0},
-            'usdt': find_item_by_symbol(data['currency'], 'USDT_IRT') or {'price': 'N/A', 'change_percent': 0},
-        }
-
-        if last_prices:
-            current_time = time.time()
-            significant_changes = []
-            for key in prices:
-                if key == 'update_time':
-                    continue
-                new_price = prices[key]['price']
-                old_price = last_prices[key]['price']
-                if new_price != 'N/A' and old_price != 'N/A':
-                    try:
-                        new_price = float(new_price)
-                        old_price = float(old_price)
-                        change_percent = ((new_price - old_price) / old_price) * 100
-                        if abs(change_percent) > CHANGE_THRESHOLD and (current_time - last_emergency_update) > MIN_EMERGENCY_INTERVAL:
-                            significant_changes.append((key, change_percent, new_price))
-                    except (ValueError, TypeError):
-                        continue
-
-            if significant_changes:
-                tehran_hour, tehran_minute = get_tehran_time()
-                emergency_message = f"""
-📢 خبر مهم از بازار!
-📅 تاریخ: {get_jalali_date()}
-⏰ زمان: {tehran_hour:02d}:{tehran_minute:02d}
-"""
-                for key, change_percent, new_price in significant_changes:
-                    name = {
-                        'gold_ounce': 'انس جهانی',
-                        'gold_18k': 'طلای 18 عیار',
-                        'coin_new': 'سکه بهار',
-                        'coin_old': 'سکه امامی',
-                        'half_coin': 'نیم سکه',
-                        'quarter_coin': 'ربع سکه',
-                        'gram_coin': 'سکه گرمی',
-                        'usd': 'دلار',
-                        'eur': 'یورو',
-                        'gbp': 'پوند',
-                        'aed': 'درهم',
-                        'usdt': 'تتر'
-                    }.get(key, key)
-                    emergency_message += f"{get_price_change_emoji(change_percent)} {name} به {format_price(new_price)} تومان رسید\n"
-                emergency_message += f"▫️ {CHANNEL_ID if CHANNEL_ID else WHATSAPP_PHONE}"
-                logger.info(f"📤 در حال ارسال اعلان تغییر قیمت مهم")
-                send_message(emergency_message)
-                last_emergency_update = current_time
-
-        last_prices = prices
+        return price_cache.get(refresh_prices)
+    except Exception as e:
+        logger.error(f"❌ خطا در دریافت داده قیمت‌ها: {e}")
+        return None
+
+async def get_prices_async():
+    """نسخه asyncio از get_prices؛ فراخوان‌های همزمان منتظر یک task مشترک دریافت می‌مانند"""
+    global price_task
+    prices = price_cache.peek()
+    if prices is not None:
         return prices
+    if price_task is None or price_task.done():
+        price_task = asyncio.ensure_future(refresh_prices_async())
+    try:
+        # shield: لغو شدن یک فراخوان (timeout کارش) دریافت مشترک را لغو نمی‌کند
+        return await asyncio.shield(price_task)
     except Exception as e:
+        prices = price_cache.peek(stale=True)
+        if prices is not None:
+            logger.warning(f"⚠️ خطا در دریافت قیمت‌ها، آخرین مقدار معتبر استفاده شد: {e}")
+            return prices
         logger.error(f"❌ خطا در دریافت داده قیمت‌ها: {e}")
         return None
 
-def create_message(prices):
-    """ایجاد پیام قیمت‌ها"""
+async def refresh_prices_async():
+    """دریافت غیرمسدودکننده و پردازش قیمت‌ها (پردازش و ثبت روی دیسک در نخ کارگر)"""
+    data = await fetch_prices_async()
+    prices = await asyncio.to_thread(process_prices, data)
+    price_cache.set(prices)
+    return prices
+
+def refresh_prices():
+    """دریافت قیمت‌ها، بررسی تغییرات مهم و ثبت در تاریخچه؛ خروجی آخرین اسنپ‌شات است"""
+    return process_prices(fetch_prices())
+
+def process_prices(data):
+    """بررسی تغییرات مهم و ثبت در تاریخچه برای داده دریافت‌شده؛ data برابر None یعنی بدون تغییر"""
+    if data is None:
+        return state['last_prices']
+
+    prices = extract_prices(*data)
+
+    # تحلیل برداری همه نمادها روی همه بازه‌های قوانین هشدار
+    current_time = clock.time()
+    price_window.push(current_time, [prices[key]['price'] for key in PRICE_SYMBOLS])
+    significant_changes = []
+    # در حالت چندمشتری بدون کانال پیش‌فرض، فقط هشدارهای مشتری‌ها بررسی می‌شوند
+    if (current_time - state['last_emergency_update']) > MIN_EMERGENCY_INTERVAL and (not tenants or load_recipients()):
+        significant_changes = [
+            (key, change_percent, new_price)
+            for key, change_percent, new_price, _ in price_window.check(ALERT_RULES, VOLATILITY_WINDOW)
+        ]
+
+    if significant_changes:
+        logger.info("📤 در حال ارسال اعلان تغییر قیمت مهم", extra={'event': 'emergency'})
+        queue_message(emergency_message(prices, significant_changes, CHANNEL_ID if CHANNEL_ID else WHATSAPP_PHONE),
+                      kind='emergency', dedup_key=f"emergency:{int(current_time)}", ttl=EMERGENCY_TTL)
+        state.update(last_emergency_update=current_time)
+    if tenants:
+        check_tenant_alerts(prices, current_time)
+
+    previous = state['last_prices']
+    if previous:
+        check_subscriptions(previous, prices)
+
+    record_history(prices)
+    state.update(last_prices=prices)
+    return prices
+
+def emergency_message(prices, changes, signature):
+    """متن اعلان فوری برای لیست (کلید, درصد تغییر, قیمت جدید)"""
     tehran_hour, tehran_minute = get_tehran_time()
-    return f"""
+    message = f"""
+📢 خبر مهم از بازار!
 📅 تاریخ: {get_jalali_date()}
-⏰ آخرین آپدیت: {tehran_hour:02d}:{tehran_minute:02d}
+⏰ زمان: {tehran_hour:02d}:{tehran_minute:02d}
+"""
+    for key, change_percent, new_price in changes:
+        name = PRICE_NAMES.get(key) or prices[key].get('name') or key
+        message += f"{get_price_change_emoji(change_percent)} {name} به {format_price(new_price)} تومان رسید\n"
+    return message + f"▫️ {signature}"
 
-📊 قیمت‌های لحظه‌ای بازار
+def check_tenant_alerts(prices, current_time):
+    """اعلان فوری هر مشتری با قوانین و نمادهای خودش
 
-طلا
-{get_price_change_emoji(prices['gold_ounce']['change_percent'])} انس جهانی: {prices['gold_ounce']['price']}
-{get_price_change_emoji(prices['gold_18k']['change_percent'])} 18 عیار: {format_price(prices['gold_18k']['price'])} تومان
+    مشتری‌هایی که قوانین یکسان دارند یک ارزیابی مشترک روی پنجره قیمت دارند، پس هزینه
+    تحلیل با تعداد قوانین متفاوت رشد می‌کند نه با تعداد مشتری‌ها.
+    """
+    last_alerts = state['tenant_emergency']
+    evaluated = {}
+    alerted = {}
+    for tenant in tenants:
+        if current_time - last_alerts.get(tenant.name, 0) <= MIN_EMERGENCY_INTERVAL:
+            continue
+        if tenant.rules_key not in evaluated:
+            evaluated[tenant.rules_key] = price_window.check(tenant.alert_rules, VOLATILITY_WINDOW)
+        changes = [
+            (key, change_percent, new_price)
+            for key, change_percent, new_price, _ in evaluated[tenant.rules_key]
+            if tenant.keys is None or key in tenant.keys
+        ]
+        if not changes:
+            continue
+        message = emergency_message(prices, changes, tenant.renderer.signature)
+        queue_message(message, kind='emergency', recipients=tenant.recipients, ttl=EMERGENCY_TTL,
+                      dedup_key=f"emergency:{tenant.name}:{int(current_time)}")
+        alerted[tenant.name] = current_time
+    if alerted:
+        logger.info("📤 اعلان تغییر قیمت مهم برای %d مشتری در صف قرار گرفت", len(alerted),
+                    extra={'event': 'emergency.tenants'})
+        state.update(tenant_emergency=dict(last_alerts, **alerted))
 
-سکه
-{get_price_change_emoji(prices['coin_old']['change_percent'])} تمام امامی: {format_price(prices['coin_old']['price'])} تومان
-{get_price_change_emoji(prices['coin_new']['change_percent'])} تمام بهار: {format_price(prices['coin_new']['price'])} تومان
-{get_price_change_emoji(prices['half_coin']['change_percent'])} نیم سکه: {format_price(prices['half_coin']['price'])} تومان
-{get_price_change_emoji(prices['quarter_coin']['change_percent'])} ربع سکه: {format_price(prices['quarter_coin']['price'])} تومان
-{get_price_change_emoji(prices['gram_coin']['change_percent'])} سکه گرمی: {format_price(prices['gram_coin']['price'])} تومان
+def numeric_prices(prices):
+    """کلید قیمت -> قیمت عددی؛ قیمت‌های نامعتبر (N/A) کنار گذاشته می‌شوند"""
+    values = {}
+    for key in PRICE_SYMBOLS:
+        try:
+            values[key] = float(prices[key]['price'])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return values
 
-ارزها
-{get_price_change_emoji(prices['usd']['change_percent'])} دلار: {format_price(prices['usd']['price'])} تومان
-{get_price_change_emoji(prices['usdt']['change_percent'])} تتر: {format_price(prices['usdt']['price'])} تومان
-{get_price_change_emoji(prices['eur']['change_percent'])} یورو: {format_price(prices['eur']['price'])} تومان
-{get_price_change_emoji(prices['gbp']['change_percent'])} پوند: {format_price(prices['gbp']['price'])} تومان
-{get_price_change_emoji(prices['aed']['change_percent'])} درهم: {format_price(prices['aed']['price'])} تومان
+def describe_rule(rule):
+    """متن کوتاه یک قانون هشدار اشتراکی"""
+    name = PRICE_NAMES.get(rule['symbol']) or rule['symbol']
+    if rule['kind'] == 'level':
+        relation = {'up': 'بالاتر از', 'down': 'پایین‌تر از'}.get(rule['direction'], 'عبور از')
+        return f"{name} {relation} {format_price(rule['value'])}"
+    relation = {'up': 'افزایش', 'down': 'کاهش'}.get(rule['direction'], 'تغییر')
+    return f"{name} {relation} {rule['value']:g}٪"
 
-▫️ {CHANNEL_ID if CHANNEL_ID else WHATSAPP_PHONE}
-"""
+def check_subscriptions(previous, prices):
+    """قرار دادن هشدار قانون‌های مشترکان که بین دو اسنپ‌شات فعال شده‌اند؛ یک پیام برای هر گیرنده"""
+    triggered = subscription_rules.check(numeric_prices(previous), numeric_prices(prices))
+    if not triggered:
+        return
+    by_recipient = {}
+    for rule, price in triggered:
+        name = PRICE_NAMES.get(rule['symbol']) or rule['symbol']
+        if rule['kind'] == 'level':
+            crossed = 'بالاتر از' if price >= rule['value'] else 'پایین‌تر از'
+            line = f"{get_price_change_emoji(price - rule['value'])} {name} {crossed} {format_price(rule['value'])}: {format_price(price)} تومان"
+        else:
+            change = (price - rule['reference']) / rule['reference'] * 100
+            line = f"{get_price_change_emoji(change)} {name} {change:+.2f}٪ تغییر کرد: {format_price(price)} تومان"
+        by_recipient.setdefault((rule['provider'], rule['chat_id']), []).append((rule['id'], line))
+    logger.info("🔔 %d قانون هشدار اشتراکی برای %d گیرنده فعال شد", len(triggered), len(by_recipient),
+                extra={'event': 'subscription.triggered'})
+    for recipient, entries in by_recipient.items():
+        text = "🔔 هشدار قیمت\n" + "\n".join(line for _, line in entries) + f"\n⏰ {prices['update_time']}"
+        queue_message(text, kind='alert', recipients=[recipient], ttl=EMERGENCY_TTL,
+                      dedup_key=f"alert:{int(clock.time())}:" + "-".join(str(rule_id) for rule_id, _ in entries))
 
-def format_price(price):
+def record_history(prices, timestamp=None):
+    """ثبت اسنپ‌شات قیمت‌ها در تاریخچه دائمی"""
     try:
-        return f"{int(float(price)):,}"
-    except:
-        return "نامشخص"
+        price_history.append_snapshot(
+            timestamp or clock.time(),
+            {symbol: prices[key]['price'] for key, symbol in PRICE_SYMBOLS.items()}
+        )
+    except Exception as e:
+        logger.error(f"❌ خطا در ثبت تاریخچه قیمت‌ها: {e}")
+
+def create_message(prices, fmt='telegram'):
+    """ایجاد پیام قیمت‌ها در قالب یک کانال (telegram، whatsapp یا json)"""
+    tehran_hour, tehran_minute = get_tehran_time()
+    with RENDER_SECONDS.time(format=fmt):
+        return price_renderer.render(prices, fmt, get_jalali_date(), f"{tehran_hour:02d}:{tehran_minute:02d}")
+
+def create_messages(prices):
+    """پیام قیمت‌ها برای همه کانال‌ها؛ هر قالب یک بار رندر و بین همه گیرندگان آن کانال مشترک است"""
+    return {provider: create_message(prices, provider) for provider in ('telegram', 'whatsapp')}
+
+def update_price_post(prices):
+    """به‌روزرسانی پیام قیمت روزانه کانال؛ editMessageText فقط وقتی یکی از مقادیر نمایشی تغییر کرده باشد
+
+    اولین بار در هر روز پیام جدیدی ارسال (و سنجاق) می‌شود و بعد از آن همان پیام ویرایش می‌شود.
+    """
+    if not (TELEGRAM_TOKEN and CHANNEL_ID) or not prices:
+        return
+    today = today_key()
+    lines = list(price_renderer.lines(prices, 'telegram'))
+    price_post = state['price_post']
+    
+    if price_post['date'] == today and price_post['message_id']:
+        if lines == price_post['lines']:
+            logger.debug("⏭️ قیمت‌های نمایشی تغییری نکرده، ویرایش لازم نیست", extra={'event': 'price_post.unchanged'})
+            return
+        result = delivery.call_limited('telegram', CHANNEL_ID, partial(
+            delivery.edit_telegram, TELEGRAM_TOKEN, CHANNEL_ID, price_post['message_id'], create_message(prices)))
+        if result['ok']:
+            state.update(price_post=dict(price_post, lines=lines))
+            logger.info("✏️ پیام قیمت کانال ویرایش شد", extra={'event': 'price_post.edit'})
+            return
+        logger.error(f"❌ ویرایش پیام قیمت کانال ناموفق: {result['error']}")
+        if result['status'] != 400:
+            return  # خطای گذرا؛ دفعه بعد دوباره تلاش می‌شود
+    
+    # پیام امروز وجود ندارد یا دیگر قابل ویرایش نیست: ارسال پیام جدید
+    result = delivery.call_limited('telegram', CHANNEL_ID, partial(delivery.send_telegram, TELEGRAM_TOKEN, CHANNEL_ID, create_message(prices)))
+    if not result['ok']:
+        logger.error(f"❌ ارسال پیام قیمت روزانه کانال ناموفق: {result['error']}")
+        return
+    state.update(price_post={'date': today, 'message_id': result['message_id'], 'lines': lines})
+    logger.info(f"📌 پیام قیمت روزانه کانال ارسال شد (message_id={result['message_id']})")
+    if PIN_PRICE_POST and result['message_id']:
+        delivery.call_limited('telegram', CHANNEL_ID, partial(delivery.pin_telegram, TELEGRAM_TOKEN, CHANNEL_ID, result['message_id']))
+
+def refresh_price_post():
+    """کار زمان‌بندی‌شده حالت ویرایش: گرفتن قیمت‌ها و ویرایش پیام کانال در صورت تغییر"""
+    update_price_post(get_prices())
+
+async def refresh_price_post_async():
+    prices = await get_prices_async()
+    await asyncio.to_thread(update_price_post, prices)
 
 def is_within_update_hours():
     """چک کردن بازه آپدیت با ساعت تهران"""
-    tehran_hour, tehran_minute = get_tehran_time()
-    is_within_hours = START_HOUR <= tehran_hour < END_HOUR
-    logger.info(f"⏰ زمان تهران: {tehran_hour:02d}:{tehran_minute:02d} - {'در بازه آپدیت' if is_within_hours else 'خارج از بازه آپدیت'}")
-    return is_within_hours
+    snapshot = clock.snapshot()
+    logger.debug("⏰ زمان تهران: %02d:%02d - %s", snapshot.hour, snapshot.minute,
+                 'در بازه آپدیت' if snapshot.is_trading_hours else 'خارج از بازه آپدیت', extra={'event': 'clock'})
+    return snapshot.is_trading_hours
 
 def test_holiday(date_str):
     """تابع تست برای چک کردن تعطیلی یک تاریخ خاص"""
     try:
-        date = jdatetime.datetime.strptime(date_str, "%Y/%m/%d")
-        month_day = date.strftime("%m/%d")
-        gregorian_date = datetime.strptime(date_str, "%Y/%m/%d").strftime("%Y-%m-%d")
-        logger.info(f"تست تعطیلی | تاریخ شمسی: {date_str} | تاریخ میلادی: {gregorian_date}")
-        
-        if month_day in NON_HOLIDAYS:
-            logger.info(f"📅 {month_day} در لیست استثناها - تعطیل نیست")
-            return False
+        date = jdatetime.datetime.strptime(date_str, "%Y/%m/%d").togregorian().date()
+        logger.info(f"تست تعطیلی | تاریخ شمسی: {date_str} | تاریخ میلادی: {date.isoformat()}")
         
-        if month_day in HOLIDAYS:
-            logger.info(f"📅 {month_day} در لیست تعطیلات یافت شد")
+        occasion = market_calendar.occasion(date)
+        if occasion:
+            logger.info(f"📅 {date_str} در لیست تعطیلات یافت شد ({occasion})")
             return True
         
-        logger.info(f"📅 {month_day} تعطیل نیست")
+        logger.info(f"📅 {date_str} تعطیل نیست")
         return False
     except Exception as e:
         logger.error(f"❌ خطا در تست تعطیلی: {e}")
         return None
 
-def main():
-    global last_holiday_notification, start_notification_sent, end_notification_sent
-    global last_suspicious_holiday_alert, last_update_time, trial_alert_sent
+def next_daily_run(hour, minute=0, trading_days_only=False):
+    """ساخت تابع زمان اجرای روزانه در ساعت مشخص تهران برای زمان‌بند"""
+    def next_run(after):
+        current = clock.from_timestamp(after)
+        candidate = current.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= current:
+            candidate += timedelta(days=1)
+        while trading_days_only and not is_trading_day(candidate):
+            candidate += timedelta(days=1)
+        return clock.to_timestamp(candidate)
+    return next_run
+
+def next_trading_slot(interval, start_hour=START_HOUR, end_hour=END_HOUR):
+    """ساخت تابع زمان اجرا روی شبکه interval ثانیه‌ای ساعات کاری (start_hour تا end_hour) روزهای غیرتعطیل"""
+    def next_run(after):
+        current = clock.from_timestamp(after)
+        day_start = current.replace(hour=start_hour, minute=0, second=0, microsecond=0)
+        for _ in range(366):
+            if is_trading_day(day_start):
+                slot = day_start
+                if current >= slot:
+                    steps = int((current - day_start).total_seconds() // interval) + 1
+                    slot = day_start + timedelta(seconds=steps * interval)
+                if slot < day_start.replace(hour=end_hour):
+                    return clock.to_timestamp(slot)
+            day_start += timedelta(days=1)
+        return None
+    return next_run
+
+def run_price_update():
+    """کار زمان‌بندی‌شده: دریافت و ارسال قیمت‌ها"""
+    tehran_hour, tehran_minute = get_tehran_time()
+    # در حالت دریافت سریع، کار price_fetch در همین نوبت کش را تازه کرده است
+    publish_prices(get_prices(), tehran_hour, tehran_minute)
+
+async def run_price_update_async():
+    tehran_hour, tehran_minute = get_tehran_time()
+    prices = await get_prices_async()
+    await asyncio.to_thread(publish_prices, prices, tehran_hour, tehran_minute)
+
+def publish_prices(prices, tehran_hour, tehran_minute):
+    """قرار دادن پیام قیمت نوبت tehran_hour:tehran_minute در صف ارسال همه گیرندگان"""
+    if prices:
+        recipients = load_recipients()
+        if EDIT_IN_PLACE:
+            # کانال اصلی پیام روزانه ویرایش‌شونده دارد و پیام جدید نمی‌گیرد
+            update_price_post(prices)
+            recipients = [recipient for recipient in recipients if recipient != ('telegram', CHANNEL_ID)]
+        # ارسال همزمان به تلگرام و واتس‌اپ، هر کدام در قالب خودش؛ پیام قیمتی که تا نوبت بعد نرسد منقضی می‌شود
+        queue_message(create_messages(prices), kind='price', ttl=UPDATE_INTERVAL, recipients=recipients,
+                      dedup_key=f"price:{today_key()}:{tehran_hour:02d}:{tehran_minute:02d}")
+        logger.info("✅ قیمت‌ها در %02d:%02d در صف ارسال قرار گرفتند", tehran_hour, tehran_minute,
+                    extra={'event': 'price.publish'})
+        state.update(last_update_time=clock.time())
+    else:
+        logger.error("❌ خطا در دریافت قیمت‌ها")
+
+def run_tenant_update(tenant):
+    """کار زمان‌بندی‌شده یک مشتری؛ قیمت‌ها از کش مشترک همه مشتری‌ها خوانده می‌شوند"""
+    publish_tenant(tenant, get_prices())
+
+async def run_tenant_update_async(tenant):
+    prices = await get_prices_async()
+    await asyncio.to_thread(publish_tenant, tenant, prices)
+
+def publish_tenant(tenant, prices):
+    """قرار دادن پیام قیمت یک مشتری (فقط نمادهای خودش، با امضای خودش) در صف ارسال گیرندگانش"""
+    if not prices:
+        logger.error(f"❌ خطا در دریافت قیمت‌ها برای مشتری {tenant.name}")
+        return
+    tehran_hour, tehran_minute = get_tehran_time()
+    slot = f"{tehran_hour:02d}:{tehran_minute:02d}"
+    texts = {}
+    for provider in {provider for provider, _ in tenant.recipients}:
+        with RENDER_SECONDS.time(format=provider):
+            texts[provider] = tenant.renderer.render(prices, provider, get_jalali_date(), slot)
+    queue_message(texts, kind='price', ttl=tenant.update_interval, recipients=tenant.recipients,
+                  dedup_key=f"price:{tenant.name}:{today_key()}:{slot}")
+
+def fetch_hours():
+    """بازه ساعت‌هایی که دست‌کم یک مشتری (یا کانال پیش‌فرض) در آن فعال است"""
+    return (min([START_HOUR] + [tenant.start_hour for tenant in tenants]),
+            max([END_HOUR] + [tenant.end_hour for tenant in tenants]))
+
+def run_day_start():
+    """کار زمان‌بندی‌شده شروع روز: اعلان تعطیلی یا پیام شروع به ادمین"""
+    if is_holiday():
+        today = today_key()
+        if state['holiday_notification_date'] != today:
+            send_holiday_notification()
+            state.update(holiday_notification_date=today)
+        logger.info(f"📅 امروز: {get_jalali_date()} - روز تعطیل، آپدیت انجام نمی‌شود")
+    else:
+        send_start_notification()
+
+def register_health_checks(scheduler):
+    """بررسی‌های /healthz: زمان‌بند عقب نیفتاده، صف خروجی گیر نکرده و قیمت‌ها در ساعات کاری تازه‌اند"""
+    def scheduler_check():
+        jobs = scheduler.jobs()
+        overdue = clock.time() - jobs[0][0] if jobs else 0
+        return overdue < JOB_TIMEOUT + 60, f"{jobs[0][1] if jobs else '-'}: {max(overdue, 0):.0f} ثانیه تأخیر"
+    
+    def outbox_check():
+        oldest = outbox.oldest_pending()
+        age = clock.time() - oldest if oldest else 0
+        return age < OUTBOX_STUCK_AFTER, f"{outbox.depth()} پیام در صف، قدیمی‌ترین {age:.0f} ثانیه"
     
+    def prices_check():
+        if not clock.snapshot().is_trading_hours or not is_trading_day(clock.now()):
+            return True, "خارج از ساعات کاری"
+        interval = min(i for i in (FETCH_INTERVAL, EDIT_INTERVAL if EDIT_IN_PLACE else 0, UPDATE_INTERVAL) if i)
+        age = clock.time() - max(last_fetch_time, started_at)
+        return age < 2 * interval + 60, f"آخرین دریافت {age:.0f} ثانیه پیش"
+    
+    metrics.add_health_check('scheduler', scheduler_check)
+    metrics.add_health_check('outbox', outbox_check)
+    metrics.add_health_check('prices', prices_check)
+
+HELP_TEXT = """🤖 دستورهای ربات قیمت:
+/price - همه قیمت‌ها
+/price usd - قیمت یک نماد (مثلاً 18k، coin، usd، usdt، eur)
+/chart 18k - نمودار امروز یک نماد (/chart 18k week candle برای نمودار شمعی هفته)
+/alert 18k >7000000 - هشدار عبور قیمت (> بالاتر، < پایین‌تر، بدون علامت هر دو جهت)
+/alert usdt 1% - هشدار تغییر درصدی
+/alerts - فهرست هشدارها
+/unalert 12 - حذف هشدار"""
+
+PERSIAN_DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹٫', '0123456789.')
+
+def lookup_price_key(args):
+    """کلید قیمت برای آرگومان‌های دستور یا None"""
+    return PRICE_LOOKUP.get(' '.join(args).lower())
+
+def unknown_symbol(args):
+    return f"❓ نماد «{html.escape(' '.join(args))}» شناخته نشد\n\n{HELP_TEXT}"
+
+def answer_price(args, message):
+    """دستور /price [نماد] از آخرین اسنپ‌شات حافظه؛ هیچ درخواستی به منابع قیمت فرستاده نمی‌شود"""
+    prices = state['last_prices']
+    if not prices:
+        return "⏳ هنوز قیمتی دریافت نشده، کمی بعد دوباره امتحان کنید"
+    if not args:
+        return create_message(prices)
+    key = lookup_price_key(args)
+    line = price_renderer.line(prices, key, 'telegram') if key else None
+    if line is None:
+        return unknown_symbol(args)
+    return f"{line}\n⏰ آخرین آپدیت: {prices['update_time']}"
+
+CHART_WORDS = {
+    'day': 'day', 'today': 'day', 'امروز': 'day', 'روز': 'day',
+    'week': 'week', 'هفته': 'week',
+    'line': 'line', 'خطی': 'line',
+    'candle': 'candle', 'شمعی': 'candle',
+}
+
+def answer_chart(args, message):
+    """دستور /chart [نماد] [day|week] [line|candle]: تصویر نمودار از تاریخچه قیمت (پیش‌فرض طلای 18 عیار، امروز)
+
+    اگر file_id همان تصویر قبلاً گرفته شده باشد در همان پاسخ webhook فرستاده می‌شود؛ وگرنه رندر
+    و آپلود در پس‌زمینه انجام می‌شود. بدون process pool رندر (مثلاً بدون TELEGRAM_TOKEN) نمودار متنی برگردانده می‌شود.
+    """
+    options = {'window': 'day', 'style': 'line'}
+    while args and args[-1].lower() in CHART_WORDS:
+        word = CHART_WORDS[args[-1].lower()]
+        options['window' if word in charts.WINDOWS else 'style'] = word
+        args = args[:-1]
+    key = lookup_price_key(args) if args else 'gold_18k'
+    if key is None:
+        return unknown_symbol(args)
+    if chart_pool is None:
+        # last_fetch_time نسخه نمودار را مشخص می‌کند؛ تا دریافت بعدی همان متن از کش برمی‌گردد
+        return render_chart(key, clock.snapshot().tehran.date(), last_fetch_time)
+    chart = chart_image(key, options['window'], options['style'])
+    if chart is None:
+        return f"📉 برای {html.escape(PRICE_NAMES.get(key) or key)} هنوز داده کافی ثبت نشده"
+    image, caption = chart
+    file_id = chart_cache.file_id(image[0])
+    if file_id:
+        CHART_SENDS.inc(result='file_id')
+        return {'method': 'sendPhoto', 'photo': file_id, 'caption': caption, 'parse_mode': 'HTML'}
+    chart_sender.submit(deliver_chart, image, caption, [message['chat']['id']])
+    return None
+
+@lru_cache(maxsize=64)
+def render_chart(key, day, version):
+    name = html.escape(PRICE_NAMES.get(key) or key)
+    start = clock.to_timestamp(datetime.combine(day, datetime.min.time()))
+    points = price_history.range(PRICE_SYMBOLS[key], start)
+    if len(points) < 2:
+        return f"📉 برای {name} امروز هنوز داده کافی ثبت نشده"
+    values = [price for _, price in points]
+    change = (values[-1] - values[0]) / values[0] * 100 if values[0] else 0
+    first, last = (clock.from_timestamp(points[i][0]).strftime('%H:%M') for i in (0, -1))
+    return (
+        f"📈 <b>{name}</b> امروز ({first} تا {last})\n"
+        f"{sparkline(values)}\n"
+        f"کمترین: {format_price(min(values))} | بیشترین: {format_price(max(values))}\n"
+        f"{get_price_change_emoji(change)} آخرین: {format_price(values[-1])} ({change:+.2f}٪)"
+    )
+
+def load_charts():
+    """نمودارهای پایان روز از CHARTS به شکل لیست (کلید قیمت, بازه, سبک)"""
+    entries = []
+    for entry in CHARTS.split(','):
+        name, _, rest = entry.strip().partition(':')
+        if not name:
+            continue
+        window, _, style = rest.partition(':')
+        key, window, style = PRICE_LOOKUP.get(name.lower()), window or 'day', style or 'line'
+        if key is None or window not in charts.WINDOWS or style not in charts.STYLES:
+            logger.warning(f"⚠️ نمودار نامعتبر در CHARTS نادیده گرفته شد: {entry}")
+            continue
+        entries.append((key, window, style))
+    return entries
+
+CHART_JOBS = load_charts()
+
+def chart_start(window):
+    """ابتدای بازه نمودار: نیمه‌شب امروز تهران، یا شش روز قبل از آن برای نمودار هفتگی"""
+    today = clock.snapshot().tehran.date()
+    if window == 'week':
+        today -= timedelta(days=6)
+    return clock.to_timestamp(datetime.combine(today, datetime.min.time()))
+
+def chart_image(key, window, style):
+    """رندر (یا تصویر کش‌شده) نمودار؛ خروجی ((کلید کش, Future بایت‌های PNG), کپشن) یا None"""
+    start = chart_start(window)
+    image = chart_cache.image(PRICE_SYMBOLS[key], window, start, style)
+    if image is None:
+        return None
+    summary = price_history.ohlc(PRICE_SYMBOLS[key], start, image[0][3] + 1)
+    if summary is None:
+        return None
+    change = (summary['close'] - summary['open']) / summary['open'] * 100 if summary['open'] else 0
+    caption = (
+        f"📈 <b>{html.escape(PRICE_NAMES.get(key) or key)}</b> {'امروز' if window == 'day' else 'هفت روز اخیر'}\n"
+        f"کمترین: {format_price(summary['low'])} | بیشترین: {format_price(summary['high'])}\n"
+        f"{get_price_change_emoji(change)} آخرین: {format_price(summary['close'])} ({change:+.2f}٪)"
+    )
+    return image, caption
+
+def deliver_chart(image, caption, chat_ids):
+    """ارسال یک نمودار به چت‌های تلگرام؛ فقط اولین ارسال تصویر را آپلود می‌کند و بقیه file_id آن را می‌فرستند"""
+    cache_key, future = image
+    for chat_id in chat_ids:
+        file_id = chart_cache.file_id(cache_key)
+        if file_id is None:
+            try:
+                photo = future.result(timeout=CHART_TIMEOUT)
+            except Exception as e:
+                logger.error(f"❌ خطا در رندر نمودار {cache_key[0]}: {e}")
+                CHART_SENDS.inc(len(chat_ids), result='failed')
+                return
+        result = delivery.call_limited('telegram', chat_id, partial(
+            delivery.send_telegram_photo, TELEGRAM_TOKEN, chat_id, file_id or photo, caption))
+        if not result['ok']:
+            logger.error(f"❌ ارسال نمودار {cache_key[0]} به {chat_id} ناموفق: {result['error']}")
+            CHART_SENDS.inc(result='failed')
+            continue
+        CHART_SENDS.inc(result='file_id' if file_id else 'upload')
+        if file_id is None and result.get('file_id'):
+            chart_cache.remember(cache_key, result['file_id'])
+
+def is_last_trading_day_of_week(date):
+    """آیا بعد از date دست‌کم یک روز تعطیل (آخر هفته) می‌آید"""
+    return (market_calendar.next_trading_day(date) - date).days > 1
+
+def publish_charts():
+    """کار زمان‌بندی‌شده پایان روز: ارسال نمودارهای CHARTS به گیرندگان تلگرام
+
+    نمودار هفتگی فقط در آخرین روز کاری قبل از تعطیلی فرستاده می‌شود. این کار فقط رندر را
+    شروع می‌کند؛ انتظار برای رندر و آپلود در نخ‌های chart_sender انجام می‌شود.
+    """
+    chat_ids = [chat_id for provider, chat_id in load_recipients() if provider == 'telegram']
+    if not TELEGRAM_TOKEN or not chat_ids:
+        return
+    today = clock.snapshot().tehran.date()
+    for key, window, style in CHART_JOBS:
+        if window == 'week' and not is_last_trading_day_of_week(today):
+            continue
+        chart = chart_image(key, window, style)
+        if chart is None:
+            logger.warning(f"⚠️ برای نمودار {key} ({window}) داده کافی نیست")
+            continue
+        chart_sender.submit(deliver_chart, *chart, chat_ids)
+    logger.info("🖼️ %d نمودار برای %d چت تلگرام در صف رندر قرار گرفت", len(CHART_JOBS), len(chat_ids),
+                extra={'event': 'chart.publish'})
+
+def answer_alert(args, message):
+    """دستور /alert نماد [>|<]مقدار[%]: ثبت قانون هشدار اشتراکی برای همین چت"""
+    if len(args) < 2:
+        return HELP_TEXT
+    key = lookup_price_key(args[:-1])
+    if key is None:
+        return unknown_symbol(args[:-1])
+    spec = args[-1].translate(PERSIAN_DIGITS).replace(',', '').replace('٬', '')
+    direction = {'>': 'up', '<': 'down'}.get(spec[:1], 'any')
+    spec = spec.lstrip('<>')
+    kind = 'move' if spec.endswith(('%', '٪')) else 'level'
+    number = spec.rstrip('%٪')
+    if not (number.isascii() and number.replace('.', '', 1).isdigit()):
+        return f"❓ مقدار «{html.escape(args[-1])}» معتبر نیست؛ مثلاً >7000000 یا 1%\n\n{HELP_TEXT}"
+    value = float(number)
+    try:
+        reference = numeric_prices(state['last_prices']).get(key) if kind == 'move' and state['last_prices'] else None
+        rule = subscription_rules.add('telegram', message['chat']['id'], key, kind, value, direction, reference)
+    except ValueError as e:
+        return f"❌ {html.escape(str(e))}"
+    return f"✅ هشدار #{rule['id']} ثبت شد: {html.escape(describe_rule(rule))}"
+
+def answer_alerts(args, message):
+    rules = subscription_rules.rules_for('telegram', message['chat']['id'])
+    if not rules:
+        return "🔕 هشداری ثبت نکرده‌اید"
+    return "🔔 هشدارهای شما:\n" + "\n".join(f"#{rule['id']} {html.escape(describe_rule(rule))}" for rule in rules)
+
+def answer_unalert(args, message):
+    try:
+        rule_id = int(args[0].translate(PERSIAN_DIGITS).lstrip('#'))
+    except (IndexError, ValueError):
+        return HELP_TEXT
+    if subscription_rules.remove(rule_id, 'telegram', message['chat']['id']):
+        return f"🗑️ هشدار #{rule_id} حذف شد"
+    return f"❓ هشدار #{rule_id} پیدا نشد"
+
+webhook.add_command('price', answer_price)
+webhook.add_command('alert', answer_alert)
+webhook.add_command('alerts', answer_alerts)
+webhook.add_command('unalert', answer_unalert)
+webhook.add_command('chart', answer_chart)
+webhook.add_command('start', lambda args, message: HELP_TEXT)
+webhook.add_command('help', lambda args, message: HELP_TEXT)
+webhook_app = webhook.make_app(WEBHOOK_PATH, WEBHOOK_SECRET, fallback=metrics.app)
+
+def register_webhook():
+    """ثبت WEBHOOK_URL در تلگرام تا آپدیت‌ها (دستورها) به سرور webhook فرستاده شوند"""
+    if not TELEGRAM_TOKEN:
+        logger.warning("⚠️ TELEGRAM_TOKEN تنظیم نشده، webhook ثبت نشد")
+        return
+    result = delivery.set_telegram_webhook(TELEGRAM_TOKEN, WEBHOOK_URL, WEBHOOK_SECRET)
+    if result['ok']:
+        logger.info(f"🔗 webhook تلگرام روی {WEBHOOK_URL} ثبت شد")
+    else:
+        logger.error(f"❌ ثبت webhook تلگرام ناموفق: {result['error']}")
+
+def run_self_tests():
+    """تست‌های تشخیصی: پیام‌های تست به ادمین و تست تقویم تعطیلات (شبکه‌ای و کند؛ فقط با --self-test)"""
     # ارسال پیام تست فوری به ادمین
     logger.info("🚨 ارسال پیام تست فوری به ADMIN_CHAT_ID")
     send_immediate_test_message()
@@ -564,63 +1228,130 @@ def main():
     logger.info("🔍 تست تعطیلی برای 1404/02/12")
     is_holiday_friday = test_holiday("1404/02/12")
     logger.info(f"نتیجه تست: 1404/02/12 {'تعطیل است' if is_holiday_friday else 'تعطیل نیست'}")
-    
-    while True:
+
+def run_diagnostics():
+    """فرمان تشخیصی python main.py --self-test: نسخه پکیج‌ها و تست‌های run_self_tests
+
+    این بررسی‌ها در شروع عادی اجرا نمی‌شوند تا اولین ارسال قیمت منتظر درخواست‌های شبکه نماند.
+    """
+    from importlib.metadata import PackageNotFoundError, version
+    for package in ('jdatetime', 'requests', 'numpy'):
         try:
-            tehran_hour, tehran_minute = get_tehran_time()
-            
-            # چک کردن وضعیت اکانت Railway
-            check_trial_status()
-            
-            if tehran_hour == 0 and tehran_minute < 30:
-                start_notification_sent = False
-                end_notification_sent = False
-                last_holiday_notification = None
-                last_suspicious_holiday_alert = None
-                trial_alert_sent = False
-                logger.info("🔄 پرچم‌ها برای روز جدید ریست شدند")
-            
-            if is_holiday():
-                if (tehran_hour == START_HOUR and tehran_minute < 30 and 
-                    (last_holiday_notification is None or 
-                     last_holiday_notification.date() != datetime.now().date())):
-                    send_holiday_notification()
-                    last_holiday_notification = datetime.now()
-                logger.info(f"📅 امروز: {get_jalali_date()} - روز تعطیل، آپدیت انجام نمی‌شود")
-                time.sleep(CHECK_INTERVAL)
-            elif is_within_update_hours():
-                if tehran_hour == START_HOUR and tehran_minute < 30 and not start_notification_sent:
-                    send_start_notification()
-                
-                if time.time() - last_update_time >= UPDATE_INTERVAL:
-                    logger.info(f"⏰ زمان تهران: {tehran_hour:02d}:{tehran_minute:02d} - در بازه آپدیت")
-                    prices = get_prices()
-                    if prices:
-                        message = create_message(prices)
-                        send_message(message)  # ارسال همزمان به تلگرام و واتس‌اپ
-                        logger.info(f"✅ قیمت‌ها در {tehran_hour:02d}:{tehran_minute:02d} ارسال شدند")
-                        last_update_time = time.time()
-                    else:
-                        logger.error("❌ خطا در دریافت قیمت‌ها")
-                else:
-                    logger.info(f"⏳ منتظر فاصله 30 دقیقه‌ای برای آپدیت بعدی")
-                time.sleep(CHECK_INTERVAL)
-            else:
-                if tehran_hour == END_HOUR and tehran_minute < 30 and not end_notification_sent:
-                    send_end_notification()
-                
-                logger.info(f"⏰ زمان تهران: {tehran_hour:02d}:{tehran_minute:02d} - خارج از بازه آپدیت")
-                time.sleep(CHECK_INTERVAL)
-        except Exception as e:
-            logger.error(f"❌ خطای غیرمنتظره در حلقه اصلی: {e}")
-            time.sleep(CHECK_INTERVAL)
+            logger.info(f"📦 نسخه {package}: {version(package)}")
+        except PackageNotFoundError:
+            logger.error(f"❌ پکیج {package} نصب نیست؛ pip install -r requirements.txt")
+    run_self_tests()
 
-if __name__ == "__main__":
-    try:
-        import jdatetime
-    except ImportError:
-        import os
-        os.system("pip install jdatetime")
-        import jdatetime
+def mark_startup(phase):
+    """ثبت پایان یک مرحله راه‌اندازی برای report_startup"""
+    startup_marks.append((phase, time.perf_counter()))
+
+def startup_phases():
+    """مدت هر مرحله راه‌اندازی (ثانیه) از BOOT_STARTED به ترتیب"""
+    phases, previous = [], BOOT_STARTED
+    for phase, finished in startup_marks:
+        phases.append((phase, finished - previous))
+        previous = finished
+    return phases
+
+STARTUP_SECONDS = metrics.Gauge('bot_startup_seconds', 'مدت هر مرحله راه‌اندازی تا آماده شدن زمان‌بند', ['phase'])
+STARTUP_SECONDS.set_function(lambda: {(phase,): seconds for phase, seconds in startup_phases()})
+
+def report_startup():
+    """گزارش زمان راه‌اندازی (از بارگذاری ماژول تا آماده شدن زمان‌بند) به تفکیک مرحله"""
+    mark_startup('scheduler')
+    phases = startup_phases()
+    total = sum(seconds for _, seconds in phases)
+    logger.info("⏱️ زمان‌بند %.0f میلی‌ثانیه بعد از شروع آماده شد (%s)", total * 1000,
+                ', '.join(f"{phase}={seconds * 1000:.0f}ms" for phase, seconds in phases),
+                extra={'event': 'startup', 'seconds': round(total, 3)})
+
+def main(serve_http=True):
+    mark_startup('setup')
+    # شروع نخ ارسال صف خروجی؛ پیام‌های ارسال‌نشده اجرای قبلی هم ارسال می‌شوند
+    outbox.start()
+    
+    # پر کردن پنجره تحلیل از تاریخچه تا مبنای مقایسه بعد از ری‌استارت از دست نرود
+    price_window.seed(price_history, PRICE_SYMBOLS, clock.time())
+    mark_startup('history')
     
-    main()
+    if serve_http:
+        if WEBHOOK_PORT:
+            metrics.serve(WEBHOOK_PORT, application=webhook_app)
+        if METRICS_PORT and METRICS_PORT != WEBHOOK_PORT:
+            metrics.serve(METRICS_PORT)
+    if WEBHOOK_URL:
+        # ثبت webhook درخواست شبکه است و نباید شروع زمان‌بند را عقب بیندازد
+        threading.Thread(target=register_webhook, name="webhook-register", daemon=True).start()
+    mark_startup('http')
+    
+    if RUNTIME == 'asyncio':
+        global asyncio
+        import asyncio
+        asyncio.run(run_async())
+        return
+    
+    # هر کار زمان دقیق اجرای بعدی‌اش را به وقت تهران محاسبه می‌کند؛ ترتیب اضافه شدن،
+    # ترتیب اجرای کارهای هم‌زمان را تعیین می‌کند (پیام شروع روز قبل از اولین قیمت)
+    scheduler = Scheduler()
+    add_jobs(scheduler, get_prices, refresh_price_post, run_price_update, run_tenant_update)
+    register_health_checks(scheduler)
+    report_startup()
+    scheduler.run()
+
+def wsgi():
+    """نقطه ورود gunicorn: gunicorn -w 1 --threads 8 -b 0.0.0.0:8080 'main:wsgi()'
+
+    ربات در یک نخ پس‌زمینه همین پروسه اجرا می‌شود تا webhook از اسنپ‌شات حافظه همان پروسه
+    پاسخ بدهد؛ برای همین فقط یک worker (و چند thread) باید اجرا شود.
+    """
+    global wsgi_mode
+    wsgi_mode = True
+    threading.Thread(target=main, kwargs={'serve_http': False}, name="bot", daemon=True).start()
+    return webhook_app
+
+async def run_async():
+    """اجرای asyncio: هر کار task مستقل با سقف زمان JOB_TIMEOUT دارد و دریافت قیمت‌ها غیرمسدودکننده است"""
+    from async_runtime import AsyncHttp, AsyncScheduler
+    global http
+    http = AsyncHttp()
+    scheduler = AsyncScheduler(timeout=JOB_TIMEOUT)
+    add_jobs(scheduler, get_prices_async, refresh_price_post_async, run_price_update_async, run_tenant_update_async)
+    register_health_checks(scheduler)
+    report_startup()
+    try:
+        await scheduler.run()
+    finally:
+        await http.close()
+
+def add_jobs(scheduler, price_fetch, price_post, price_update, tenant_update):
+    """ثبت کارهای ربات در زمان‌بند؛ کارهای قیمت برای هر نوع اجرا نسخه خودشان را دارند
+
+    هر مشتری کار ارسال جداگانه با ساعات و فاصله خودش دارد؛ کارهای هم‌زمان از یک دریافت
+    مشترک (کش قیمت) استفاده می‌کنند.
+    """
+    # با /healthz، مانیتور بیرونی جای پیام تست تریال را می‌گیرد
+    if TRIAL_CHECK == 'true' or (TRIAL_CHECK == 'auto' and not (METRICS_PORT or WEBHOOK_PORT or wsgi_mode)):
+        # چک تریال از زمان آخرین چک ذخیره‌شده ادامه پیدا می‌کند تا ری‌استارت پیام تست اضافه نفرستد
+        scheduler.add_job('trial_check', check_trial_status, lambda after: after + TRIAL_CHECK_INTERVAL,
+                          first_run=max(clock.time(), state['last_trial_check_time'] + TRIAL_CHECK_INTERVAL))
+    scheduler.add_job('day_start', run_day_start, next_daily_run(START_HOUR))
+    if FETCH_INTERVAL:
+        scheduler.add_job('price_fetch', price_fetch, next_trading_slot(FETCH_INTERVAL, *fetch_hours()))
+    if EDIT_IN_PLACE:
+        scheduler.add_job('price_post', price_post, next_trading_slot(EDIT_INTERVAL))
+    if not tenants or load_recipients():
+        scheduler.add_job('price_update', price_update, next_trading_slot(UPDATE_INTERVAL))
+    for tenant in tenants:
+        scheduler.add_job(f'price_update:{tenant.name}', partial(tenant_update, tenant),
+                          next_trading_slot(tenant.update_interval, tenant.start_hour, tenant.end_hour))
+    scheduler.add_job('day_end', send_end_notification, next_daily_run(END_HOUR, trading_days_only=True))
+    if CHART_JOBS:
+        scheduler.add_job('charts', publish_charts, next_daily_run(END_HOUR, trading_days_only=True))
+
+if __name__ == "__main__":
+    # وابستگی‌ها از requirements.txt نصب می‌شوند؛ هیچ نصبی هنگام اجرا انجام نمی‌شود
+    if '--self-test' in sys.argv[1:]:
+        run_diagnostics()
+    else:
+        main()
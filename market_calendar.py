@@ -0,0 +1,137 @@
+import glob
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+from datetime import timedelta
+from types import MappingProxyType
+
+import jdatetime
+
+logger = logging.getLogger(__name__)
+
+HOLIDAYS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'holidays')
+
+CalendarDay = namedtuple('CalendarDay', ['date', 'jalali', 'is_holiday', 'occasion'])
+
+
+class MarketCalendar:
+    """تقویم تعطیلات بازار که از فایل‌های سالانه (holidays/<سال>.json) ساخته می‌شود
+
+    همه روزهای سال‌های بارگذاری‌شده یک بار پیش‌پردازش می‌شوند و ایندکس‌های فقط‌خواندنی
+    (ordinal میلادی -> مناسبت و ordinal -> روز کاری بعدی) ساخته می‌شود،
+    پس is_holiday و next_trading_day هر کدام فقط یک جستجوی دیکشنری هستند.
+    برای اضافه کردن سال جدید کافی است فایل آن سال کنار بقیه قرار بگیرد.
+    """
+
+    def __init__(self, directory=HOLIDAYS_DIR):
+        self.directory = directory
+        self._today = None
+        self._today_lock = threading.Lock()
+        self._warned_years = set()
+        self._load()
+
+    def _load(self):
+        holidays = {}
+        covered = []
+        years = []
+        for path in sorted(glob.glob(os.path.join(self.directory, '*.json'))):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    spec = json.load(f)
+                holidays.update(_compile_year(spec))
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"❌ خطا در خواندن فایل تعطیلات {path}: {e}")
+                continue
+            years.append(spec['year'])
+            first = jdatetime.date(spec['year'], 1, 1).togregorian().toordinal()
+            last = jdatetime.date(spec['year'] + 1, 1, 1).togregorian().toordinal()
+            covered.append((first, last))
+
+        self._holidays = MappingProxyType(holidays)
+        self._covered = tuple(covered)
+
+        # روز کاری بعدی برای هر روز پوشش‌داده‌شده، از آخر به اول ساخته می‌شود
+        next_trading = {}
+        if covered:
+            start = min(first for first, _ in covered)
+            end = max(last for _, last in covered)
+            following = None
+            for ordinal in range(end + 7, start - 1, -1):
+                if ordinal < end:
+                    next_trading[ordinal] = following
+                if not self._is_closed(ordinal):
+                    following = ordinal
+
+        self.years = tuple(years)
+        self._next_trading = MappingProxyType(next_trading)
+        logger.info(f"📅 تقویم تعطیلات برای سال‌های {', '.join(map(str, years)) or '-'} بارگذاری شد ({len(holidays)} روز تعطیل)")
+
+    def _is_covered(self, ordinal):
+        return any(first <= ordinal < last for first, last in self._covered)
+
+    def _is_closed(self, ordinal):
+        if ordinal in self._holidays:
+            return True
+        return not self._is_covered(ordinal) and _is_weekly_holiday(ordinal)
+
+    def occasion(self, date):
+        """مناسبت تعطیلی یک تاریخ میلادی (date) یا None اگر تعطیل نباشد"""
+        ordinal = date.toordinal()
+        occasion = self._holidays.get(ordinal)
+        if occasion is None and not self._is_covered(ordinal):
+            # برای سال‌های بدون فایل فقط جمعه‌ها تعطیل در نظر گرفته می‌شوند
+            year = jdatetime.date.fromgregorian(date=date).year
+            if year not in self._warned_years:
+                self._warned_years.add(year)
+                logger.warning(f"⚠️ فایل تعطیلات سال {year} وجود ندارد، فقط جمعه‌ها تعطیل حساب می‌شوند")
+            if _is_weekly_holiday(ordinal):
+                return "جمعه"
+        return occasion
+
+    def is_holiday(self, date):
+        return self.occasion(date) is not None
+
+    def next_trading_day(self, date):
+        """اولین روز کاری بعد از date (تاریخ میلادی)"""
+        ordinal = self._next_trading.get(date.toordinal())
+        if ordinal is not None:
+            return date.fromordinal(ordinal)
+        following = date + timedelta(days=1)
+        while self.is_holiday(following):
+            following += timedelta(days=1)
+        return following
+
+    def day(self, date):
+        """اطلاعات یک روز؛ نتیجه آخرین روز پرسیده‌شده (معمولاً امروز) کش می‌شود"""
+        with self._today_lock:
+            if self._today is not None and self._today.date == date:
+                return self._today
+            occasion = self.occasion(date)
+            self._today = CalendarDay(date, jdatetime.date.fromgregorian(date=date), occasion is not None, occasion)
+            return self._today
+
+
+def _is_weekly_holiday(ordinal):
+    # ordinal 1 (0001-01-01) دوشنبه است؛ جمعه یعنی باقیمانده 5
+    return ordinal % 7 == 5
+
+
+def _compile_year(spec):
+    """تبدیل مشخصات یک سال به دیکشنری ordinal میلادی -> مناسبت"""
+    year = spec['year']
+    weekly = {int(weekday): name for weekday, name in spec.get('weekly', {}).items()}
+    specials = spec.get('holidays', {})
+    working_days = set(spec.get('working_days', []))
+
+    holidays = {}
+    day = jdatetime.date(year, 1, 1)
+    while day.year == year:
+        month_day = day.strftime("%m/%d")
+        if month_day not in working_days:
+            occasion = specials.get(month_day) or weekly.get(day.weekday())
+            if occasion:
+                holidays[day.togregorian().toordinal()] = occasion
+        day += timedelta(days=1)
+    return holidays
@@ -0,0 +1,205 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from socketserver import ThreadingMixIn
+
+logger = logging.getLogger(__name__)
+
+# مرزهای پیش‌فرض هیستوگرام زمان (ثانیه)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+_health_checks = {}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """شمارنده افزایشی"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """مقدار لحظه‌ای؛ با set_function هنگام هر بار خواندن محاسبه می‌شود"""
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._function = None
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function):
+        """function بدون ورودی یک عدد یا دیکشنری {مقادیر برچسب (تاپل): عدد} برمی‌گرداند"""
+        self._function = function
+
+    def render(self):
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception as e:
+                logger.error(f"❌ خطا در محاسبه متریک {self.name}: {e}")
+                value = None
+            with self._lock:
+                if isinstance(value, dict):
+                    self._values = dict(value)
+                elif value is not None:
+                    self._values = {(): value}
+                else:
+                    self._values = {}
+        return super().render()
+
+
+class Histogram(_Metric):
+    """هیستوگرام تجمعی با مرزهای ثابت"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """اندازه‌گیری زمان اجرای یک بلوک with"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labels, key, [('le', _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total!r}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+def render():
+    """همه متریک‌ها در قالب متنی Prometheus"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def add_health_check(name, check):
+    """ثبت یک بررسی سلامت؛ check بدون ورودی (سالم؟, توضیح) برمی‌گرداند"""
+    _health_checks[name] = check
+
+
+def health():
+    """اجرای همه بررسی‌های سلامت؛ خروجی (سالم؟, {نام: {'ok', 'detail'}})"""
+    results = {}
+    for name, check in list(_health_checks.items()):
+        try:
+            ok, detail = check()
+        except Exception as e:
+            ok, detail = False, f"خطا: {e}"
+        results[name] = {'ok': bool(ok), 'detail': detail}
+    return all(result['ok'] for result in results.values()), results
+
+
+def app(environ, start_response):
+    """برنامه WSGI برای /metrics و /healthz"""
+    path = environ.get('PATH_INFO', '/')
+    if path == '/metrics':
+        body = render().encode('utf-8')
+        status, content_type = '200 OK', 'text/plain; version=0.0.4; charset=utf-8'
+    elif path == '/healthz':
+        ok, checks = health()
+        body = json.dumps({'ok': ok, 'checks': checks}, ensure_ascii=False).encode('utf-8')
+        status, content_type = ('200 OK' if ok else '503 Service Unavailable'), 'application/json; charset=utf-8'
+    else:
+        body = b'not found\n'
+        status, content_type = '404 Not Found', 'text/plain; charset=utf-8'
+    start_response(status, [('Content-Type', content_type), ('Content-Length', str(len(body)))])
+    return [body]
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug("🌐 %s - " + format, self.address_string(), *args, extra={'event': 'http.request'})
+
+
+def serve(port, host='0.0.0.0', application=None):
+    """اجرای app (یا application، مثلاً webhook با fallback به app) در یک نخ پس‌زمینه داخل همین پروسه
+
+    متریک‌ها و اسنپ‌شات قیمت در حافظه همین پروسه هستند، پس سرور باید داخل پروسه ربات باشد.
+    """
+    server = make_server(host, port, application or app, server_class=_ThreadingWSGIServer, handler_class=_QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    logger.info(f"📈 متریک‌ها روی http://{host}:{port}/metrics و /healthz در دسترس است")
+    return server
@@ -0,0 +1,209 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# ==================== تنظیمات صف خروجی ====================
+MAX_ATTEMPTS = 8          # بیشترین تعداد تلاش برای هر پیام
+BASE_BACKOFF = 5          # تأخیر پایه تلاش دوباره (ثانیه)
+MAX_BACKOFF = 900         # سقف تأخیر تلاش دوباره (ثانیه)
+BATCH_SIZE = 500          # بیشترین تعداد پیام در هر دور ارسال
+RETENTION = 7 * 86400     # نگه‌داری پیام‌های تمام‌شده (ثانیه)
+GROUP_WORKERS = 8         # تعداد گروه پیام (متن متفاوت، مثلاً مشتری‌های مختلف) که همزمان ارسال می‌شوند
+# =========================================================
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedup_key TEXT UNIQUE,
+    kind TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    body TEXT NOT NULL,
+    created REAL NOT NULL,
+    expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt);
+"""
+
+
+def backoff(attempts):
+    """تأخیر نمایی با jitter کامل برای تلاش شماره attempts"""
+    return random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempts))
+
+
+class Outbox:
+    """صف پایدار پیام‌های خروجی روی SQLite بین تولیدکننده‌ها و ارسال‌کننده‌ها
+
+    هر پیام برای هر گیرنده یک سطر جداگانه دارد. تولیدکننده‌ها فقط سطر اضافه می‌کنند و
+    بلافاصله برمی‌گردند؛ نخ کارگر سطرهای سررسیده را دسته‌ای با send(body, recipients)
+    ارسال می‌کند، خطاها را با backoff نمایی دوباره تلاش می‌کند و پیام‌های تاریخ‌گذشته را
+    کنار می‌گذارد. سطرهای ارسال‌نشده بعد از ری‌استارت دوباره پردازش می‌شوند.
+    """
+
+    def __init__(self, path, send):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._send = send
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._groups = None
+        self._last_cleanup = 0
+
+    def enqueue(self, texts, recipients, kind, dedup_key=None, ttl=None):
+        """اضافه کردن یک پیام برای لیست گیرندگان (سرویس‌دهنده, شناسه چت)
+
+        texts رشته یا دیکشنری متن هر سرویس‌دهنده است. اگر dedup_key داده شود، پیام تکراری
+        با همان کلید برای همان گیرنده نادیده گرفته می‌شود. ttl (ثانیه) عمر پیام است.
+        خروجی تعداد سطرهای جدید است.
+        """
+        now = time.time()
+        expires = now + ttl if ttl else None
+        rows = []
+        for provider, chat_id in recipients:
+            body = texts[provider] if isinstance(texts, dict) else texts
+            key = f"{dedup_key}:{provider}:{chat_id}" if dedup_key else None
+            rows.append((key, kind, provider, str(chat_id), body, now, expires, now))
+        with self._lock:
+            before = self._db.total_changes
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT OR IGNORE INTO outbox (dedup_key, kind, provider, chat_id, body, created, expires, next_attempt) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._db.execute("COMMIT")
+            added = self._db.total_changes - before
+        if added < len(rows):
+            logger.info("⏭️ %d پیام تکراری (%s) نادیده گرفته شد", len(rows) - added, dedup_key,
+                        extra={'event': 'outbox.duplicate'})
+        self._wakeup.set()
+        return added
+
+    def depth(self):
+        """تعداد پیام‌های در انتظار ارسال"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+    def oldest_pending(self):
+        """زمان ایجاد قدیمی‌ترین پیام در انتظار یا None"""
+        with self._lock:
+            return self._db.execute("SELECT MIN(created) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+    def start(self):
+        pending = self.depth()
+        if pending:
+            logger.info(f"♻️ {pending} پیام ارسال‌نشده از اجرای قبلی در صف است")
+        self._thread = threading.Thread(target=self.run, name="outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def _next_due(self):
+        with self._lock:
+            row = self._db.execute("SELECT MIN(next_attempt) FROM outbox WHERE status = 'pending'").fetchone()
+        return row[0]
+
+    def run(self):
+        """حلقه کارگر: ارسال پیام‌های سررسیده و خوابیدن تا سررسید بعدی"""
+        while not self._stopped:
+            try:
+                self.process_due()
+            except Exception as e:
+                logger.error(f"❌ خطای غیرمنتظره در صف خروجی: {e}")
+            due = self._next_due()
+            timeout = None if due is None else max(0.0, due - time.time())
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+    def process_due(self):
+        """یک دور ارسال همه پیام‌های سررسیده؛ خروجی تعداد پیام‌های پردازش‌شده"""
+        now = time.time()
+        with self._lock:
+            expired = self._db.execute(
+                "UPDATE outbox SET status = 'expired' WHERE status = 'pending' AND expires IS NOT NULL AND expires < ?",
+                (now,)
+            ).rowcount
+            rows = self._db.execute(
+                "SELECT id, provider, chat_id, body, attempts FROM outbox "
+                "WHERE status = 'pending' AND next_attempt <= ? ORDER BY next_attempt, id LIMIT ?",
+                (now, BATCH_SIZE)
+            ).fetchall()
+        if expired:
+            logger.warning(f"⌛ {expired} پیام تاریخ‌گذشته از صف حذف شد")
+        if not rows:
+            self._cleanup(now)
+            return 0
+
+        # پیام‌های با متن یکسان با هم و از طریق یک ارسال گروهی فرستاده می‌شوند؛ گروه‌های
+        # متن‌های متفاوت همزمان ارسال می‌شوند تا گیرندگان یک متن منتظر گروه قبلی نمانند
+        groups = {}
+        for row in rows:
+            groups.setdefault(row[3], []).append(row)
+        if len(groups) > 1:
+            if self._groups is None:
+                self._groups = ThreadPoolExecutor(max_workers=GROUP_WORKERS, thread_name_prefix="outbox-group")
+            sent = self._groups.map(self._send_group, groups.items())
+        else:
+            sent = map(self._send_group, groups.items())
+        updates = []
+        for group, results in zip(groups.values(), sent):
+            for (row_id, _, _, _, attempts), result in zip(group, results):
+                attempts += 1
+                if result['ok']:
+                    updates.append(('sent', attempts, now, None, row_id))
+                elif attempts >= MAX_ATTEMPTS:
+                    updates.append(('failed', attempts, now, result['error'], row_id))
+                else:
+                    updates.append(('pending', attempts, time.time() + backoff(attempts), result['error'], row_id))
+
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                updates
+            )
+            self._db.execute("COMMIT")
+        failed = sum(1 for update in updates if update[0] != 'sent')
+        if failed:
+            logger.warning(f"🔁 {failed} پیام از {len(updates)} ارسال نشد و دوباره تلاش می‌شود یا کنار گذاشته شد")
+        return len(rows)
+
+    def _send_group(self, item):
+        body, group = item
+        return self._send(body, [(provider, chat_id) for _, provider, chat_id, _, _ in group])
+
+    def _cleanup(self, now):
+        """حذف دوره‌ای سطرهای تمام‌شده قدیمی"""
+        if now - self._last_cleanup < 3600:
+            return
+        self._last_cleanup = now
+        with self._lock:
+            self._db.execute("DELETE FROM outbox WHERE status != 'pending' AND created < ?", (now - RETENTION,))
+
+    def close(self):
+        self.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._groups is not None:
+            self._groups.shutdown(wait=False)
+        with self._lock:
+            self._db.close()
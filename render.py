@@ -0,0 +1,209 @@
+import html
+import json
+import threading
+from functools import lru_cache
+
+# چیدمان پیام قیمت: (عنوان بخش, ((کلید قیمت, برچسب, واحد), ...))؛ واحد None یعنی قیمت خام نمایش داده شود
+LAYOUT = (
+    ('طلا', (
+        ('gold_ounce', 'انس جهانی', None),
+        ('gold_18k', '18 عیار', 'تومان'),
+    )),
+    ('سکه', (
+        ('coin_old', 'تمام امامی', 'تومان'),
+        ('coin_new', 'تمام بهار', 'تومان'),
+        ('half_coin', 'نیم سکه', 'تومان'),
+        ('quarter_coin', 'ربع سکه', 'تومان'),
+        ('gram_coin', 'سکه گرمی', 'تومان'),
+    )),
+    ('ارزها', (
+        ('usd', 'دلار', 'تومان'),
+        ('usdt', 'تتر', 'تومان'),
+        ('eur', 'یورو', 'تومان'),
+        ('gbp', 'پوند', 'تومان'),
+        ('aed', 'درهم', 'تومان'),
+    )),
+)
+
+# قالب هر کانال: عنوان بخش و تابع escape متن
+FORMATS = {
+    'telegram': {'section': '<b>{}</b>', 'escape': html.escape},  # parse_mode=HTML
+    'whatsapp': {'section': '*{}*', 'escape': str},               # مارک‌داون واتس‌اپ
+}
+
+
+def get_price_change_emoji(change_percent):
+    """تعیین ایموجی تغییر قیمت"""
+    try:
+        change_percent = float(change_percent)
+    except (TypeError, ValueError, OverflowError):
+        return "➖"
+    if change_percent > 0:
+        return "🔺"
+    elif change_percent < 0:
+        return "🔻"
+    return "➖"
+
+
+@lru_cache(maxsize=1024)
+def _format_price(price):
+    try:
+        return f"{int(float(price)):,}"
+    except (TypeError, ValueError, OverflowError):
+        return "نامشخص"
+
+
+def format_price(price):
+    """قالب‌بندی قیمت با جداکننده هزارگان؛ نتیجه برای قیمت‌های تکراری کش می‌شود"""
+    try:
+        return _format_price(price)
+    except TypeError:  # مقدار غیرقابل hash
+        return "نامشخص"
+
+
+SPARK_BLOCKS = '▁▂▃▄▅▆▇█'
+
+
+def sparkline(values, width=24):
+    """نمودار متنی یک‌خطی؛ values به width بازه تقسیم و آخرین مقدار هر بازه رسم می‌شود"""
+    if not values:
+        return ''
+    step = max(len(values) / width, 1)
+    points = [values[min(int((i + 1) * step) - 1, len(values) - 1)] for i in range(min(width, len(values)))]
+    low, high = min(points), max(points)
+    scale = (len(SPARK_BLOCKS) - 1) / (high - low) if high > low else 0
+    return ''.join(SPARK_BLOCKS[int(round((value - low) * scale))] for value in points)
+
+
+@lru_cache(maxsize=4096)
+def _price_line(fmt, label, unit, price, change_percent):
+    """یک خط قیمت در قالب یک کانال؛ برای هر نماد تا وقتی قیمتش عوض نشده از کش خوانده می‌شود"""
+    escape = FORMATS[fmt]['escape']
+    if unit is None:
+        value = escape(str(price))
+    else:
+        value = f"{format_price(price)} {unit}" if unit else format_price(price)
+    return f"{get_price_change_emoji(change_percent)} {escape(label)}: {value}"
+
+
+def _select_layout(keys):
+    """LAYOUT محدود به کلیدهای keys (بخش‌های خالی حذف می‌شوند)؛ keys برابر None یعنی همه"""
+    if keys is None:
+        return LAYOUT
+    keys = set(keys)
+    layout = []
+    for title, rows in LAYOUT:
+        rows = tuple(row for row in rows if row[0] in keys)
+        if rows:
+            layout.append((title, rows))
+    return tuple(layout)
+
+
+def _compile_template(fmt, signature, layout=LAYOUT):
+    """ساخت یک بار قالب کامل پیام برای یک کانال؛ هر خط قیمت یک جای‌خالی {line_<کلید>} است"""
+    spec = FORMATS[fmt]
+    parts = [
+        "",
+        "📅 تاریخ: {date}",
+        "⏰ آخرین آپدیت: {time}",
+        "",
+        "📊 قیمت‌های لحظه‌ای بازار",
+        "",
+    ]
+    for title, rows in layout:
+        parts.append(spec['section'].format(title))
+        parts.extend(f"{{line_{key}}}" for key, _, _ in rows)
+        parts.append("")
+    parts[-1] = "{extras}"
+    parts.append(f"▫️ {spec['escape'](signature or '')}".replace('{', '{{').replace('}', '}}'))
+    parts.append("")
+    return "\n".join(parts)
+
+
+class PriceRenderer:
+    """رندر پیام قیمت برای هر کانال با قالب‌های از پیش ساخته‌شده
+
+    هر اسنپ‌شات قیمت برای هر قالب و هر (تاریخ, ساعت) سرتیتر فقط یک بار رندر می‌شود و همه
+    گیرندگان آن کانال همان متن را دریافت می‌کنند. extras لیست (کلید, نماد) قیمت‌هایی است که در LAYOUT نیستند.
+    keys اگر داده شود فقط همین کلیدهای LAYOUT نمایش داده می‌شوند (زیرمجموعه نمادهای یک مشتری).
+    """
+
+    def __init__(self, signature, extras=(), keys=None):
+        self.signature = signature
+        self.extras = tuple(extras)
+        self.layout = _select_layout(keys)
+        self._templates = {fmt: _compile_template(fmt, signature, self.layout) for fmt in FORMATS}
+        self._lock = threading.Lock()
+        self._snapshot = None   # (اسنپ‌شات, تاریخ, ساعت) متن‌های کش‌شده
+        self._rendered = {}
+
+    def render(self, prices, fmt, date, time):
+        """رندر اسنپ‌شات prices در قالب fmt (telegram، whatsapp یا json)"""
+        with self._lock:
+            # اسنپ‌شات بدون تغییر (304 یا بدنه هم‌هش) همان شیء است، پس ساعت و تاریخ هم بخشی از کلید هستند
+            snapshot = self._snapshot
+            if snapshot is None or prices is not snapshot[0] or (date, time) != snapshot[1:]:
+                self._snapshot = (prices, date, time)
+                self._rendered = {}
+            text = self._rendered.get(fmt)
+            if text is None:
+                text = self._render_json(prices, date, time) if fmt == 'json' else self._render_text(prices, fmt, date, time)
+                self._rendered[fmt] = text
+            return text
+
+    def lines(self, prices, fmt):
+        """خطوط قیمت نمایش‌داده‌شده یک اسنپ‌شات؛ برای تشخیص تغییر مقادیر نمایشی بدون توجه به ساعت پیام"""
+        lines = [
+            _price_line(fmt, label, unit, prices[key]['price'], prices[key]['change_percent'])
+            for _, rows in self.layout for key, label, unit in rows
+        ]
+        lines.extend(
+            _price_line(fmt, prices[key].get('name') or symbol, '', prices[key]['price'], prices[key]['change_percent'])
+            for key, symbol in self.extras
+        )
+        return tuple(lines)
+
+    def line(self, prices, key, fmt):
+        """خط قیمت یک کلید (از LAYOUT یا extras) در قالب fmt؛ کلید ناشناخته None می‌دهد"""
+        item = prices.get(key)
+        if not isinstance(item, dict):
+            return None
+        for _, rows in LAYOUT:
+            for row_key, label, unit in rows:
+                if row_key == key:
+                    return _price_line(fmt, label, unit, item['price'], item['change_percent'])
+        return _price_line(fmt, item.get('name') or key, '', item['price'], item['change_percent'])
+
+    def _render_text(self, prices, fmt, date, time):
+        values = {'date': date, 'time': time}
+        for _, rows in self.layout:
+            for key, label, unit in rows:
+                item = prices[key]
+                values[f"line_{key}"] = _price_line(fmt, label, unit, item['price'], item['change_percent'])
+        extras = [
+            _price_line(fmt, prices[key].get('name') or symbol, '', prices[key]['price'], prices[key]['change_percent'])
+            for key, symbol in self.extras
+        ]
+        if extras:
+            title = FORMATS[fmt]['section'].format('سایر')
+            values['extras'] = "\n" + "\n".join([title] + extras) + "\n"
+        else:
+            values['extras'] = ""
+        return self._templates[fmt].format_map(values)
+
+    def _render_json(self, prices, date, time):
+        labels = {key: label for _, rows in LAYOUT for key, label, _ in rows}
+        return json.dumps({
+            'date': date,
+            'time': time,
+            'update_time': prices.get('update_time'),
+            'prices': {
+                key: {
+                    'symbol': item.get('symbol'),
+                    'name': labels.get(key) or item.get('name'),
+                    'price': item.get('price'),
+                    'change_percent': item.get('change_percent'),
+                }
+                for key, item in prices.items() if key != 'update_time'
+            },
+        }, ensure_ascii=False)
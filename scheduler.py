@@ -0,0 +1,115 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+JOB_SECONDS = metrics.Histogram('bot_job_seconds', 'زمان اجرای هر کار زمان‌بندی‌شده', ['job'])
+JOB_ERRORS = metrics.Counter('bot_job_errors_total', 'تعداد کارهای ناموفق یا لغوشده', ['job'])
+RESCHEDULE_DELAY = 60   # اگر محاسبه زمان بعدی کار خطا بدهد، کار این مدت بعد دوباره اجرا می‌شود (ثانیه)
+
+
+def next_following(name, next_run, when, now):
+    """زمان اجرای بعدی کاری که در when اجرا شد
+
+    زمان بعدی روی همان شبکه زمانی محاسبه می‌شود تا تأخیر اجرا روی برنامه اثر نگذارد. خطای
+    next_run (مثلاً در تقویم تعطیلات) نباید حلقه زمان‌بند و همه کارهای دیگر را متوقف کند؛
+    کار بعد از RESCHEDULE_DELAY ثانیه دوباره اجرا و زمان بعدی‌اش دوباره محاسبه می‌شود.
+    """
+    after = max(when, now)
+    try:
+        return next_run(after)
+    except Exception as e:
+        JOB_ERRORS.inc(job=name)
+        logger.error(f"❌ خطا در محاسبه زمان بعدی کار {name}، {RESCHEDULE_DELAY} ثانیه بعد دوباره اجرا می‌شود: {e}")
+        return after + RESCHEDULE_DELAY
+
+
+class Scheduler:
+    """زمان‌بند مبتنی بر heap: هر کار زمان اجرای بعدی خودش را محاسبه می‌کند
+
+    next_run(after) برای هر کار اولین timestamp (ثانیه از epoch) بعد از after یا None برمی‌گرداند؛
+    None یعنی کار دیگر زمان‌بندی نمی‌شود. حلقه run دقیقاً تا زمان نزدیک‌ترین کار می‌خوابد.
+    """
+
+    def __init__(self, time_source=time.time):
+        self._time = time_source
+        self._heap = []
+        self._counter = itertools.count()  # حفظ ترتیب اضافه شدن برای کارهای هم‌زمان
+        self._cond = threading.Condition()
+        self._stopped = False
+
+    def add_job(self, name, func, next_run, first_run=None):
+        """اضافه کردن یک کار؛ first_run اگر داده شود زمان اولین اجرا است"""
+        when = first_run if first_run is not None else next_run(self._time())
+        if when is None:
+            logger.warning(f"⚠️ کار {name} زمان اجرایی ندارد و زمان‌بندی نشد")
+            return
+        with self._cond:
+            heapq.heappush(self._heap, (when, next(self._counter), name, func, next_run))
+            self._cond.notify()
+        logger.info(f"🗓️ کار {name} برای {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(when))} زمان‌بندی شد")
+
+    def jobs(self):
+        """لیست (زمان اجرا, نام) کارهای در انتظار به ترتیب اجرا"""
+        with self._cond:
+            return [(when, name) for when, _, name, _, _ in sorted(self._heap)]
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _pop_due(self):
+        """صبر تا رسیدن زمان نزدیک‌ترین کار و برداشتن آن از heap"""
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                delay = self._heap[0][0] - self._time()
+                if delay <= 0:
+                    return heapq.heappop(self._heap)
+                self._cond.wait(delay)
+            return None
+
+    def next_time(self):
+        """زمان نزدیک‌ترین کار یا None"""
+        with self._cond:
+            return self._heap[0][0] if self._heap else None
+
+    def run_pending(self):
+        """اجرای بدون انتظار همه کارهای سررسیده در زمان فعلی time_source (برای زمان مجازی)"""
+        count = 0
+        while True:
+            with self._cond:
+                if not self._heap or self._heap[0][0] > self._time():
+                    return count
+                entry = heapq.heappop(self._heap)
+            self._run_entry(entry)
+            count += 1
+
+    def run(self):
+        """حلقه اصلی: اجرای کارها در زمان دقیق و زمان‌بندی دوباره آن‌ها"""
+        while True:
+            entry = self._pop_due()
+            if entry is None:
+                return
+            self._run_entry(entry)
+
+    def _run_entry(self, entry):
+        when, _, name, func, next_run = entry
+        try:
+            with JOB_SECONDS.time(job=name):
+                func()
+        except Exception as e:
+            JOB_ERRORS.inc(job=name)
+            logger.error(f"❌ خطای غیرمنتظره در کار {name}: {e}")
+        following = next_following(name, next_run, when, self._time())
+        if following is not None:
+            with self._cond:
+                heapq.heappush(self._heap, (following, next(self._counter), name, func, next_run))
@@ -0,0 +1,328 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+# ==================== تنظیمات منابع قیمت ====================
+SOURCE_TIMEOUT = 10            # حداکثر زمان انتظار پاسخ هر منبع (ثانیه)
+LATENCY_ALPHA = 0.3            # وزن آخرین نمونه در میانگین نمایی تأخیر
+DEMOTE_AFTER_FAILURES = 3      # تعداد خطا/داده کهنه پشت سر هم تا کنار گذاشتن موقت منبع
+DEMOTE_LATENCY_FACTOR = 3.0    # منبعی که تأخیرش چند برابر سریع‌ترین منبع باشد کنار گذاشته می‌شود
+DEMOTE_COOLDOWN = 300          # مدت کنار گذاشتن منبع (ثانیه)
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+# ============================================================
+
+MODES = ('fastest', 'median')
+
+
+class SourceError(Exception):
+    """خطای دریافت یا تفسیر پاسخ یک منبع قیمت"""
+
+
+class PriceSource:
+    """پایه منبع قیمت: درخواست شرطی، تشخیص پاسخ تکراری و تبدیل پاسخ به ایندکس نماد -> آیتم
+
+    هر آداپتور request و parse را پیاده می‌کند؛ parse خروجی (ایندکس, زمان قیمت "HH:MM") دارد.
+    ارسال درخواست بیرون از منبع انجام می‌شود تا همان آداپتور در اجرای نخ‌محور و asyncio کار کند؛
+    منبعی که HTTP نیست (مثل بازپخش تاریخچه) transport(url, headers, timeout) خودش را دارد.
+    """
+
+    transport = None
+
+    def __init__(self, name):
+        self.name = name
+        self.etag = None
+        self.modified = None
+        self.payload_hash = None
+        self.index = None
+        self.quote_time = None
+
+    def request(self):
+        """آدرس و هدرهای درخواست؛ هدرهای شرطی فقط وقتی پاسخ قبلی در حافظه هست اضافه می‌شوند"""
+        url, headers = self.endpoint()
+        if self.index is not None:
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.modified:
+                headers['If-Modified-Since'] = self.modified
+        return url, headers
+
+    def endpoint(self):
+        raise NotImplementedError
+
+    def parse(self, data):
+        raise NotImplementedError
+
+    def handle(self, status, headers, content):
+        """تفسیر پاسخ HTTP؛ پاسخ تکراری (304 یا بدنه هم‌هش) بدون دیکود، ایندکس قبلی را برمی‌گرداند"""
+        if status == 304 and self.index is not None:
+            return self.index, self.quote_time
+        if status >= 400:
+            raise SourceError(f"HTTP {status}")
+        payload_hash = hashlib.blake2b(content, digest_size=16).digest()
+        self.etag = headers.get('ETag')
+        self.modified = headers.get('Last-Modified')
+        if self.index is not None and payload_hash == self.payload_hash:
+            return self.index, self.quote_time
+        try:
+            index, quote_time = self.parse(json.loads(content))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise SourceError(f"پاسخ نامعتبر: {e}") from e
+        self.index, self.quote_time, self.payload_hash = index, quote_time, payload_hash
+        return index, quote_time
+
+
+class BrsApiSource(PriceSource):
+    """آداپتور brsapi.ir (و آینه‌هایی با همان قالب پاسخ)
+
+    sections نگاشت نماد -> بخش پاسخ (gold، currency، ...) است؛ فقط همان بخش‌ها پیمایش می‌شوند.
+    """
+
+    def __init__(self, name, url, sections):
+        super().__init__(name)
+        self.url = url
+        self.sections = sections
+
+    def endpoint(self):
+        return self.url, {'User-Agent': USER_AGENT}
+
+    def parse(self, data):
+        index = {}
+        for section in set(self.sections.values()):
+            for item in data.get(section) or ():
+                symbol = item.get('symbol')
+                if self.sections.get(symbol) == section:
+                    index[symbol] = item
+        gold = data.get('gold') or []
+        return index, (gold[0].get('time') if gold else None)
+
+
+class PriceAggregator:
+    """دریافت موازی از چند منبع قیمت و ترکیب نتیجه
+
+    حالت fastest اولین پاسخ معتبر (بدون خطا و تازه‌تر از max_staleness) را برمی‌گرداند و
+    حالت median برای هر نماد آیتمی با قیمت میانه بین منابع معتبر را انتخاب می‌کند.
+    تأخیر، خطا و کهنگی هر منبع ثبت می‌شود؛ منبعی که پشت سر هم خطا یا داده کهنه بدهد یا
+    خیلی کندتر از بقیه باشد به مدت DEMOTE_COOLDOWN کنار گذاشته می‌شود (همیشه دست‌کم یک منبع فعال می‌ماند).
+
+    get(url, headers, timeout) در fetch و نسخه async آن در fetch_async خروجی
+    (کد وضعیت, هدرها, بدنه) دارد. خروجی هر دو (ایندکس, زمان قیمت) یا None اگر تغییری نبوده است.
+    """
+
+    def __init__(self, sources, mode='fastest', max_staleness=None, tehran_now=None, timeout=SOURCE_TIMEOUT):
+        if not sources:
+            raise ValueError("دست‌کم یک منبع قیمت لازم است")
+        if mode not in MODES:
+            raise ValueError(f"حالت نامعتبر منابع قیمت: {mode} (مجاز: {', '.join(MODES)})")
+        self.sources = list(sources)
+        self.mode = mode
+        self.max_staleness = max_staleness
+        self.tehran_now = tehran_now
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._executor = None
+        self._last = None
+        self.stats = {
+            source.name: {
+                'latency': None, 'last_latency': None, 'staleness': None, 'successes': 0,
+                'failures': 0, 'consecutive_failures': 0, 'demoted_until': 0, 'last_error': None,
+            }
+            for source in self.sources
+        }
+
+    # ---------- انتخاب و آمار منابع ----------
+
+    def active_sources(self):
+        """منابعی که الان کنار گذاشته نشده‌اند، سریع‌ترین اول"""
+        now = time.time()
+        with self._lock:
+            active = [source for source in self.sources if self.stats[source.name]['demoted_until'] <= now]
+            if not active:
+                active = list(self.sources)
+            return sorted(active, key=lambda source: self.stats[source.name]['latency'] or 0)
+
+    def _staleness(self, quote_time):
+        """فاصله زمان قیمت ("HH:MM" به وقت تهران) تا الان به ثانیه یا None اگر نامشخص باشد"""
+        if not quote_time or self.tehran_now is None:
+            return None
+        try:
+            hour, minute = map(int, str(quote_time).split(':')[:2])
+        except ValueError:
+            return None
+        now = self.tehran_now()
+        quoted = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if quoted > now + timedelta(minutes=5):
+            quoted -= timedelta(days=1)  # زمان قیمت مربوط به دیروز است
+        return max(0.0, (now - quoted).total_seconds())
+
+    def _is_stale(self, staleness):
+        return self.max_staleness is not None and staleness is not None and staleness > self.max_staleness
+
+    def _record(self, source, elapsed, staleness=None, error=None):
+        now = time.time()
+        with self._lock:
+            stats = self.stats[source.name]
+            stats['last_latency'] = elapsed
+            stats['staleness'] = staleness
+            # داده کهنه فقط وقتی خطا حساب می‌شود که منبع دیگری داده تازه داشته باشد (بازار باز است)
+            stale = self._is_stale(staleness) and any(
+                other['staleness'] is not None and not self._is_stale(other['staleness'])
+                for name, other in self.stats.items() if name != source.name
+            )
+            if error is None and not stale:
+                stats['successes'] += 1
+                stats['consecutive_failures'] = 0
+                stats['last_error'] = None
+                latency = stats['latency']
+                stats['latency'] = elapsed if latency is None else latency + LATENCY_ALPHA * (elapsed - latency)
+                others = [
+                    other['latency'] for name, other in self.stats.items()
+                    if name != source.name and other['latency'] is not None and other['demoted_until'] <= now
+                ]
+                reason = None
+                if others and stats['latency'] > DEMOTE_LATENCY_FACTOR * min(others):
+                    reason = f"تأخیر {stats['latency']:.2f} ثانیه"
+            else:
+                stats['failures'] += 1
+                stats['consecutive_failures'] += 1
+                stats['last_error'] = str(error) if error is not None else f"داده کهنه ({staleness:.0f} ثانیه)"
+                reason = None
+                if stats['consecutive_failures'] >= DEMOTE_AFTER_FAILURES:
+                    reason = f"{stats['consecutive_failures']} خطای پشت سر هم ({stats['last_error']})"
+            if reason and stats['demoted_until'] <= now and self._others_active(source.name, now):
+                stats['demoted_until'] = now + DEMOTE_COOLDOWN
+                logger.warning(f"⬇️ منبع قیمت {source.name} به مدت {DEMOTE_COOLDOWN} ثانیه کنار گذاشته شد: {reason}")
+
+    def _others_active(self, name, now):
+        return any(other != name and stats['demoted_until'] <= now for other, stats in self.stats.items())
+
+    # ---------- دریافت ----------
+
+    def _outcome(self, source, started, response=None, error=None):
+        """ثبت نتیجه یک منبع؛ خروجی (منبع, ایندکس, زمان قیمت, کهنگی) یا None در صورت خطا"""
+        elapsed = time.monotonic() - started
+        if error is None:
+            try:
+                index, quote_time = source.handle(*response)
+            except SourceError as e:
+                error = e
+        if error is not None:
+            self._record(source, elapsed, error=error)
+            logger.warning(f"⚠️ منبع قیمت {source.name} ناموفق ({elapsed:.2f} ثانیه): {error}")
+            return None
+        staleness = self._staleness(quote_time)
+        self._record(source, elapsed, staleness)
+        return source, index, quote_time, staleness
+
+    def _fetch_one(self, source, get):
+        started = time.monotonic()
+        url, headers = source.request()
+        try:
+            response = (source.transport or get)(url, headers, self.timeout)
+        except Exception as e:
+            return self._outcome(source, started, error=e)
+        return self._outcome(source, started, response)
+
+    async def _fetch_one_async(self, source, get):
+        started = time.monotonic()
+        url, headers = source.request()
+        try:
+            if source.transport is not None:
+                response = source.transport(url, headers, self.timeout)
+            else:
+                response = await get(url, headers=headers, timeout=self.timeout)
+        except Exception as e:
+            return self._outcome(source, started, error=e)
+        return self._outcome(source, started, response)
+
+    def fetch(self, get):
+        """دریافت موازی در نخ‌های کارگر"""
+        sources = self.active_sources()
+        if len(sources) == 1:
+            return self._combine([self._fetch_one(sources[0], get)])
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.sources), thread_name_prefix='price-source')
+        pending = {self._executor.submit(self._fetch_one, source, get) for source in sources}
+        outcomes = []
+        deadline = time.monotonic() + self.timeout + 1
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            outcomes.extend(future.result() for future in done)
+            # در حالت fastest بقیه منابع در پس‌زمینه تمام می‌شوند و فقط آمارشان ثبت می‌شود
+            if self.mode == 'fastest' and any(self._valid(outcome) for outcome in outcomes):
+                break
+        return self._combine(outcomes)
+
+    async def fetch_async(self, get):
+        """دریافت موازی روی یک event loop"""
+        import asyncio
+        tasks = [asyncio.ensure_future(self._fetch_one_async(source, get)) for source in self.active_sources()]
+        outcomes = []
+        try:
+            for next_done in asyncio.as_completed(tasks, timeout=self.timeout + 1):
+                outcomes.append(await next_done)
+                if self.mode == 'fastest' and self._valid(outcomes[-1]):
+                    break
+        except asyncio.TimeoutError:
+            pass
+        return self._combine(outcomes)
+
+    # ---------- ترکیب ----------
+
+    def _valid(self, outcome):
+        return outcome is not None and not self._is_stale(outcome[3])
+
+    def _combine(self, outcomes):
+        results = [outcome for outcome in outcomes if outcome is not None]
+        if not results:
+            raise SourceError("هیچ منبع قیمتی پاسخ معتبر نداد")
+        valid = [outcome for outcome in results if self._valid(outcome)]
+        if not valid:
+            # همه منابع کهنه‌اند؛ تازه‌ترین استفاده می‌شود
+            valid = [min(results, key=lambda outcome: outcome[3] or 0)]
+            logger.warning(f"⚠️ داده همه منابع قیمت کهنه است، از {valid[0][0].name} استفاده شد")
+
+        if self.mode == 'fastest' or len(valid) == 1:
+            _, index, quote_time, _ = valid[0]
+        else:
+            index = _median_index([outcome[1] for outcome in valid])
+            quote_time = max((outcome[2] for outcome in valid if outcome[2]), default=None)
+
+        combined = (index, quote_time)
+        if combined == self._last:
+            logger.info("⏭️ داده‌های منابع قیمت تغییری نکرده", extra={'event': 'price.unchanged'})
+            return None
+        self._last = combined
+        names = ', '.join(outcome[0].name for outcome in valid)
+        logger.info("📥 قیمت‌ها از %s دریافت شد", names, extra={'event': 'price.received', 'sources': names})
+        return combined
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def _median_index(indexes):
+    """برای هر نماد آیتمی که قیمتش میانه قیمت‌های منابع است (میانه پایینی برای تعداد زوج)"""
+    combined = {}
+    for symbol in set().union(*indexes):
+        items = []
+        for index in indexes:
+            item = index.get(symbol)
+            try:
+                items.append((float(item['price']), item))
+            except (TypeError, KeyError, ValueError):
+                continue
+        if items:
+            items.sort(key=lambda pair: pair[0])
+            combined[symbol] = items[(len(items) - 1) // 2][1]
+        else:
+            combined[symbol] = next(index[symbol] for index in indexes if symbol in index)
+    return combined
@@ -0,0 +1,88 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+
+class StateStore:
+    """وضعیت اجرای ربات که با هر تغییر به شکل اتمی روی دیسک ذخیره می‌شود
+
+    کلیدهای مجاز و مقدار پیش‌فرضشان در defaults مشخص می‌شوند و مقادیر باید قابل
+    تبدیل به JSON باشند. update فقط وقتی مقداری واقعاً عوض شده باشد فایل را بازنویسی
+    می‌کند؛ نوشتن در فایل موقت و os.replace باعث می‌شود فایل هیچ‌وقت نیمه‌کاره نماند.
+    بعد از ری‌استارت مقادیر ذخیره‌شده بازیابی می‌شوند و restored برابر True است.
+    path برابر None یعنی وضعیت فقط در حافظه نگه داشته می‌شود (برای شبیه‌سازی).
+    """
+
+    def __init__(self, path, defaults):
+        self.path = path
+        self._defaults = dict(defaults)
+        self._values = dict(defaults)
+        self._lock = threading.Lock()
+        self.restored = False
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ خواندن فایل وضعیت {self.path} ناموفق بود، از وضعیت پیش‌فرض استفاده می‌شود: {e}")
+            return
+        if data.get('version') != STATE_VERSION:
+            logger.warning(f"⚠️ نسخه فایل وضعیت ({data.get('version')}) پشتیبانی نمی‌شود، نادیده گرفته شد")
+            return
+        values = data.get('values', {})
+        self._values.update((key, value) for key, value in values.items() if key in self._defaults)
+        self.restored = True
+        logger.info(f"♻️ وضعیت اجرای قبلی از {self.path} بازیابی شد (ذخیره‌شده {time.time() - data.get('saved', 0):.0f} ثانیه پیش)")
+
+    def __getitem__(self, key):
+        with self._lock:
+            return self._values[key]
+
+    def update(self, **changes):
+        """تغییر یک یا چند مقدار؛ اگر چیزی عوض شده باشد فوراً ذخیره می‌شود و True برمی‌گرداند"""
+        with self._lock:
+            changed = {key: value for key, value in changes.items() if self._values[key] != value}
+            if not changed:
+                return False
+            self._values.update(changed)
+            self._checkpoint()
+        return True
+
+    def reset(self, *keys):
+        """برگرداندن کلیدهای داده‌شده به مقدار پیش‌فرض"""
+        return self.update(**{key: self._defaults[key] for key in keys})
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def _checkpoint(self):
+        if self.path is None:
+            return
+        data = json.dumps(
+            {'version': STATE_VERSION, 'saved': time.time(), 'values': self._values},
+            ensure_ascii=False, separators=(',', ':')
+        )
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"❌ ذخیره فایل وضعیت ناموفق بود: {e}")
@@ -0,0 +1,242 @@
+import bisect
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# ==================== تنظیمات هشدارهای اشتراکی ====================
+MAX_RULES_PER_CHAT = 50   # بیشترین تعداد قانون فعال برای هر گیرنده
+DIRECTIONS = ('any', 'up', 'down')
+# ====================================================================
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rules (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    provider TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value REAL NOT NULL,
+    direction TEXT NOT NULL DEFAULT 'any',
+    reference REAL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rules_chat ON rules (provider, chat_id);
+"""
+
+
+class _Levels:
+    """سطح‌های مرتب یک نماد در یک جهت؛ levels و ids هم‌ترتیب‌اند"""
+
+    __slots__ = ('levels', 'ids')
+
+    def __init__(self):
+        self.levels = []
+        self.ids = []
+
+    def insert(self, level, rule_id):
+        index = bisect.bisect_right(self.levels, level)
+        self.levels.insert(index, level)
+        self.ids.insert(index, rule_id)
+
+    def remove(self, level, rule_id):
+        index = bisect.bisect_left(self.levels, level)
+        while index < len(self.levels) and self.levels[index] == level:
+            if self.ids[index] == rule_id:
+                del self.levels[index]
+                del self.ids[index]
+                return
+            index += 1
+
+    def rising(self, old, new):
+        """قانون‌های سطح‌هایی که با رفتن قیمت از old به new رو به بالا رد شده‌اند: old < level <= new"""
+        return self.ids[bisect.bisect_right(self.levels, old):bisect.bisect_right(self.levels, new)]
+
+    def falling(self, old, new):
+        """قانون‌های سطح‌هایی که با رفتن قیمت از old به new رو به پایین رد شده‌اند: new <= level < old"""
+        return self.ids[bisect.bisect_left(self.levels, new):bisect.bisect_left(self.levels, old)]
+
+    def at_or_below(self, price):
+        return self.ids[:bisect.bisect_right(self.levels, price)]
+
+    def at_or_above(self, price):
+        return self.ids[bisect.bisect_left(self.levels, price):]
+
+
+class SubscriptionRules:
+    """قانون‌های هشدار هر مشترک روی SQLite با ایندکس سطح قیمت در حافظه
+
+    دو نوع قانون وجود دارد:
+    level: عبور قیمت از value (direction برابر up فقط رو به بالا، down فقط رو به پایین)؛ یک‌بار مصرف
+    move: تغییر value درصدی نسبت به قیمت مرجع؛ بعد از هر هشدار مرجع قیمت جدید می‌شود
+    هر قانون به سطح‌های قیمت تبدیل می‌شود (move دو سطح بالا و پایین مرجع دارد) و سطح‌ها برای هر
+    نماد، جهت و نوع در لیست مرتب نگه داشته می‌شوند. check برای level فقط سطح‌های بین قیمت قبلی
+    و جدید و برای move سطح‌هایی که قیمت جدید به آن‌ها رسیده یا از آن‌ها گذشته (حتی با جهش قیمت
+    بعد از ری‌استارت) را با bisect پیدا می‌کند؛ هزینه هر تیک O(log n + k) است.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._rules = {}    # شناسه -> دیکشنری قانون
+        self._index = {}    # (نماد, 'up' یا 'down', نوع) -> _Levels
+        self._by_chat = {}   # (سرویس‌دهنده, شناسه چت) -> شناسه قانون‌ها
+        self._pending = set()  # قانون‌های move بدون قیمت مرجع
+        self._load()
+
+    def __len__(self):
+        return len(self._rules)
+
+    def _load(self):
+        rows = self._db.execute(
+            "SELECT id, provider, chat_id, symbol, kind, value, direction, reference FROM rules"
+        ).fetchall()
+        for row in rows:
+            rule = dict(zip(('id', 'provider', 'chat_id', 'symbol', 'kind', 'value', 'direction', 'reference'), row))
+            self._attach(rule)
+        if rows:
+            logger.info(f"🔔 {len(rows)} قانون هشدار اشتراکی بارگذاری شد")
+
+    def _levels(self, rule):
+        """سطح‌های قیمت یک قانون به شکل (جهت, سطح)"""
+        if rule['kind'] == 'level':
+            sides = ('up', 'down') if rule['direction'] == 'any' else (rule['direction'],)
+            return [(side, rule['value']) for side in sides]
+        if rule['reference'] is None:
+            return []  # مرجع با اولین قیمت دریافتی تعیین می‌شود
+        step = rule['reference'] * rule['value'] / 100
+        sides = []
+        if rule['direction'] in ('any', 'up'):
+            sides.append(('up', rule['reference'] + step))
+        if rule['direction'] in ('any', 'down'):
+            sides.append(('down', rule['reference'] - step))
+        return sides
+
+    def _attach(self, rule):
+        self._rules[rule['id']] = rule
+        self._by_chat.setdefault((rule['provider'], rule['chat_id']), set()).add(rule['id'])
+        if rule['kind'] == 'move' and rule['reference'] is None:
+            self._pending.add(rule['id'])
+        self._index_rule(rule)
+
+    def _index_rule(self, rule):
+        for side, level in self._levels(rule):
+            self._index.setdefault((rule['symbol'], side, rule['kind']), _Levels()).insert(level, rule['id'])
+
+    def _unindex_rule(self, rule):
+        for side, level in self._levels(rule):
+            self._index[(rule['symbol'], side, rule['kind'])].remove(level, rule['id'])
+
+    def _detach(self, rule):
+        self._unindex_rule(rule)
+        del self._rules[rule['id']]
+        self._pending.discard(rule['id'])
+        chat = (rule['provider'], rule['chat_id'])
+        self._by_chat[chat].discard(rule['id'])
+        if not self._by_chat[chat]:
+            del self._by_chat[chat]
+
+    def add(self, provider, chat_id, symbol, kind, value, direction='any', reference=None):
+        """اضافه کردن یک قانون؛ خروجی دیکشنری قانون. برای move، reference قیمت فعلی است"""
+        if kind not in ('level', 'move') or direction not in DIRECTIONS:
+            raise ValueError(f"قانون نامعتبر: {kind}/{direction}")
+        value = float(value)
+        if value <= 0:
+            raise ValueError("مقدار قانون باید مثبت باشد")
+        chat_id = str(chat_id)
+        with self._lock:
+            if len(self._by_chat.get((provider, chat_id), ())) >= MAX_RULES_PER_CHAT:
+                raise ValueError(f"حداکثر {MAX_RULES_PER_CHAT} قانون برای هر گیرنده مجاز است")
+            cursor = self._db.execute(
+                "INSERT INTO rules (provider, chat_id, symbol, kind, value, direction, reference, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (provider, chat_id, symbol, kind, value, direction, reference, time.time())
+            )
+            rule = {'id': cursor.lastrowid, 'provider': provider, 'chat_id': chat_id, 'symbol': symbol,
+                    'kind': kind, 'value': value, 'direction': direction, 'reference': reference}
+            self._attach(rule)
+        return dict(rule)
+
+    def remove(self, rule_id, provider=None, chat_id=None):
+        """حذف یک قانون؛ با provider و chat_id فقط قانون همان گیرنده حذف می‌شود"""
+        with self._lock:
+            rule = self._rules.get(rule_id)
+            if rule is None or (provider is not None and (rule['provider'], rule['chat_id']) != (provider, str(chat_id))):
+                return False
+            self._db.execute("DELETE FROM rules WHERE id = ?", (rule_id,))
+            self._detach(rule)
+        return True
+
+    def rules_for(self, provider, chat_id):
+        """قانون‌های یک گیرنده به ترتیب شناسه"""
+        with self._lock:
+            return [dict(self._rules[rule_id]) for rule_id in sorted(self._by_chat.get((provider, str(chat_id)), ()))]
+
+    def check(self, old_prices, new_prices):
+        """پیدا کردن قانون‌هایی که بین دو اسنپ‌شات فعال شده‌اند
+
+        old_prices و new_prices دیکشنری نماد -> قیمت (عدد) هستند. خروجی لیست (قانون, قیمت جدید)
+        است؛ قانون‌های level حذف و مرجع قانون‌های move به قیمت جدید منتقل می‌شود.
+        """
+        triggered = []
+        with self._lock:
+            fired = {}
+            for symbol, new in new_prices.items():
+                ids = []
+                old = old_prices.get(symbol)
+                if old is not None and old != new:
+                    side = 'up' if new > old else 'down'
+                    levels = self._index.get((symbol, side, 'level'))
+                    if levels is not None:
+                        ids.extend(levels.rising(old, new) if side == 'up' else levels.falling(old, new))
+                levels = self._index.get((symbol, 'up', 'move'))
+                if levels is not None:
+                    ids.extend(levels.at_or_below(new))
+                levels = self._index.get((symbol, 'down', 'move'))
+                if levels is not None:
+                    ids.extend(levels.at_or_above(new))
+                for rule_id in ids:
+                    fired.setdefault(rule_id, new)
+
+            deleted, moved = [], []
+            for rule_id, price in fired.items():
+                rule = self._rules[rule_id]
+                triggered.append((dict(rule), price))
+                if rule['kind'] == 'level':
+                    self._detach(rule)
+                    deleted.append((rule_id,))
+                else:
+                    self._unindex_rule(rule)
+                    rule['reference'] = price
+                    self._index_rule(rule)
+                    moved.append((price, rule_id))
+
+            # مرجع قانون‌های move که هنوز قیمتی ندیده‌اند
+            for rule_id in list(self._pending):
+                rule = self._rules[rule_id]
+                price = new_prices.get(rule['symbol'])
+                if price is not None:
+                    rule['reference'] = price
+                    self._index_rule(rule)
+                    self._pending.discard(rule_id)
+                    moved.append((price, rule_id))
+
+            if deleted or moved:
+                self._db.execute("BEGIN")
+                self._db.executemany("DELETE FROM rules WHERE id = ?", deleted)
+                self._db.executemany("UPDATE rules SET reference = ? WHERE id = ?", moved)
+                self._db.execute("COMMIT")
+        return triggered
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import jdatetime
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+    TEHRAN_TZ = ZoneInfo('Asia/Tehran')
+except (ImportError, ZoneInfoNotFoundError):
+    # بدون پایگاه داده منطقه زمانی، از اختلاف ثابت +03:30 (ایران از 1401 ساعت تابستانی ندارد) استفاده می‌شود
+    logging.warning("⚠️ منطقه زمانی Asia/Tehran پیدا نشد، از اختلاف ثابت +03:30 استفاده می‌شود")
+    TEHRAN_TZ = timezone(timedelta(hours=3, minutes=30), 'Asia/Tehran')
+
+logger = logging.getLogger(__name__)
+
+RESYNC_INTERVAL = 3600  # هر چند ثانیه مبنای monotonic با ساعت سیستم هماهنگ شود
+
+ClockSnapshot = namedtuple('ClockSnapshot', ['timestamp', 'tehran', 'jalali', 'hour', 'minute', 'is_trading_hours'])
+
+
+class VirtualTime:
+    """زمان مجازی برای شبیه‌سازی و بازپخش؛ فقط با set و advance جلو می‌رود
+
+    خود شیء قابل فراخوانی است و به عنوان time_source به TehranClock، Scheduler و کش داده می‌شود.
+    """
+
+    def __init__(self, start):
+        self.now = float(start)
+
+    def __call__(self):
+        return self.now
+
+    def set(self, timestamp):
+        if timestamp < self.now:
+            raise ValueError("زمان مجازی به عقب برنمی‌گردد")
+        self.now = float(timestamp)
+
+    def advance(self, seconds):
+        self.set(self.now + seconds)
+
+
+class TehranClock:
+    """ساعت تهران بر پایه UTC و time.monotonic با اسنپ‌شات کش‌شده برای هر دقیقه
+
+    زمان فعلی از یک نقطه مبنای UTC به اضافه زمان سپری‌شده monotonic محاسبه می‌شود تا
+    پرش‌های ساعت سیستم بین دو هماهنگ‌سازی اثری نداشته باشد. snapshot در طول یک دقیقه
+    همان نتیجه را برمی‌گرداند، پس همه بخش‌های یک تیک یک زمان منسجم می‌بینند.
+    با time_source (مثلاً VirtualTime) ساعت به جای ساعت سیستم از آن خوانده می‌شود.
+    """
+
+    def __init__(self, start_hour, end_hour, time_source=None):
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._time_source = time_source
+        self._sync()
+
+    def use_time_source(self, time_source):
+        """جایگزینی منبع زمان (None یعنی ساعت سیستم)؛ اسنپ‌شات کش‌شده دور ریخته می‌شود"""
+        with self._lock:
+            self._time_source = time_source
+            self._snapshot = None
+        self._sync()
+
+    def _sync(self):
+        self._base_wall = time.time()
+        self._base_monotonic = time.monotonic()
+
+    def time(self):
+        """timestamp فعلی (ثانیه از epoch)"""
+        if self._time_source is not None:
+            return self._time_source()
+        elapsed = time.monotonic() - self._base_monotonic
+        if elapsed > RESYNC_INTERVAL:
+            self._sync()
+            elapsed = 0.0
+        return self._base_wall + elapsed
+
+    def from_timestamp(self, timestamp):
+        """تبدیل timestamp به datetime آگاه از منطقه زمانی تهران"""
+        return datetime.fromtimestamp(timestamp, TEHRAN_TZ)
+
+    def to_timestamp(self, tehran_time):
+        """تبدیل زمان تهران به timestamp؛ datetime بدون منطقه زمانی به وقت تهران فرض می‌شود"""
+        if tehran_time.tzinfo is None:
+            tehran_time = tehran_time.replace(tzinfo=TEHRAN_TZ)
+        return tehran_time.timestamp()
+
+    def now(self):
+        """زمان دقیق فعلی تهران (بدون کش)"""
+        return self.from_timestamp(self.time())
+
+    def snapshot(self):
+        """اسنپ‌شات زمان تهران، تاریخ شمسی و وضعیت ساعات کاری؛ در طول هر دقیقه کش می‌شود"""
+        timestamp = self.time()
+        minute_key = int(timestamp // 60)
+        with self._lock:
+            cached = self._snapshot
+            if cached is not None and int(cached.timestamp // 60) == minute_key:
+                return cached
+            tehran = self.from_timestamp(timestamp)
+            snapshot = ClockSnapshot(
+                timestamp=timestamp,
+                tehran=tehran,
+                jalali=jdatetime.date.fromgregorian(date=tehran.date()),
+                hour=tehran.hour,
+                minute=tehran.minute,
+                is_trading_hours=self.start_hour <= tehran.hour < self.end_hour,
+            )
+            self._snapshot = snapshot
+        logger.debug("⏰ زمان تهران: %02d:%02d", tehran.hour, tehran.minute, extra={'event': 'clock'})
+        return snapshot
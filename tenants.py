@@ -0,0 +1,86 @@
+import json
+import logging
+
+from render import PriceRenderer
+
+logger = logging.getLogger(__name__)
+
+
+class Tenant:
+    """یک مشتری در حالت چندمشتری با گیرندگان، نمادها، ساعات کاری و آستانه هشدار خودش
+
+    همه مشتری‌ها از یک دریافت مشترک قیمت تغذیه می‌شوند؛ هر مشتری فقط قالب پیام خودش
+    (renderer) و کارهای زمان‌بندی‌شده خودش را دارد.
+    """
+
+    def __init__(self, name, recipients, keys, start_hour, end_hour, update_interval, alert_rules, renderer):
+        self.name = name
+        self.recipients = recipients      # لیست (سرویس‌دهنده, شناسه چت)
+        self.keys = keys                  # کلیدهای قیمت نمایش‌داده‌شده
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+        self.update_interval = update_interval
+        self.alert_rules = alert_rules
+        self.renderer = renderer
+
+    def __repr__(self):
+        return f"Tenant({self.name!r}, {len(self.recipients)} گیرنده)"
+
+    @property
+    def rules_key(self):
+        """کلید قابل hash قوانین هشدار؛ مشتری‌های با قوانین یکسان یک ارزیابی مشترک دارند"""
+        return tuple(tuple(sorted(rule.items())) for rule in self.alert_rules)
+
+
+def load_tenants(path, lookup, extras, defaults, providers=('telegram', 'whatsapp')):
+    """خواندن فایل JSON مشتری‌ها به شکل {"tenants": [...]}
+
+    هر مشتری name و دست‌کم یکی از telegram (شناسه کانال‌ها) یا whatsapp (شماره‌ها) را دارد و
+    symbols، start_hour، end_hour، update_interval، change_threshold، alert_rules و signature
+    اختیاری‌اند (پیش‌فرض‌ها از defaults). lookup نام نماد (یا نام کوتاه) را به کلید قیمت تبدیل
+    می‌کند و extras لیست (کلید, نماد) قیمت‌های بیرون از LAYOUT است. گیرندگان سرویس‌دهنده‌هایی که
+    در providers نیستند (توکن ندارند) کنار گذاشته می‌شوند.
+    """
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    tenants = []
+    for entry in config.get('tenants', []):
+        name = str(entry.get('name') or '').strip()
+        if not name or any(tenant.name == name for tenant in tenants):
+            raise ValueError(f"نام مشتری خالی یا تکراری است: {name!r}")
+        recipients = [
+            (provider, str(chat_id).strip())
+            for provider in ('telegram', 'whatsapp') if provider in providers
+            for chat_id in entry.get(provider, [])
+            if str(chat_id).strip()
+        ]
+        if not recipients:
+            logger.warning(f"⚠️ مشتری {name} گیرنده فعالی ندارد و نادیده گرفته شد")
+            continue
+
+        keys = None
+        if entry.get('symbols'):
+            keys = []
+            for symbol in entry['symbols']:
+                key = lookup(str(symbol).lower())
+                if key is None:
+                    raise ValueError(f"نماد ناشناخته برای مشتری {name}: {symbol}")
+                keys.append(key)
+        settings = {option: entry.get(option, value) for option, value in defaults.items()}
+        if not 0 <= settings['start_hour'] < settings['end_hour'] <= 23:
+            raise ValueError(f"ساعات کاری نامعتبر برای مشتری {name}")
+        interval = settings['update_interval']
+        if not isinstance(interval, int) or isinstance(interval, bool) or interval <= 0:
+            raise ValueError(f"update_interval نامعتبر برای مشتری {name}: {interval!r} (باید عدد صحیح مثبت ثانیه باشد)")
+        alert_rules = entry.get('alert_rules') or [
+            {'window': settings['update_interval'], 'percent': settings['change_threshold']}
+        ]
+        selected = [(key, symbol) for key, symbol in extras if keys is None or key in keys]
+        signature = entry.get('signature') or (entry.get('telegram') or entry.get('whatsapp'))[0]
+        renderer = PriceRenderer(signature, selected, keys)
+        tenants.append(Tenant(
+            name, recipients, tuple(keys) if keys is not None else None,
+            settings['start_hour'], settings['end_hour'], settings['update_interval'], alert_rules, renderer
+        ))
+    logger.info(f"🏢 {len(tenants)} مشتری از {path} بارگذاری شد")
+    return tenants
@@ -0,0 +1,91 @@
+import json
+import logging
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_UPDATE_SIZE = 64 * 1024  # حداکثر حجم بدنه یک آپدیت تلگرام (بایت)
+
+UPDATE_SECONDS = metrics.Histogram('bot_webhook_seconds', 'زمان پاسخ به هر آپدیت webhook', ['command'])
+UPDATES = metrics.Counter('bot_webhook_updates_total', 'تعداد آپدیت‌های webhook به تفکیک دستور', ['command'])
+
+_commands = {}
+
+
+def add_command(name, handler):
+    """ثبت یک دستور؛ handler(args, message) متن پاسخ (HTML) یا دیکشنری متد Bot API یا None برمی‌گرداند"""
+    _commands[name.lower()] = handler
+
+
+def parse_command(text):
+    """'/price@GoldBot usd' -> ('price', ['usd'])؛ متنی که دستور نیست None می‌دهد"""
+    if not text or not text.startswith('/'):
+        return None
+    head, *args = text.split()
+    name = head[1:].split('@', 1)[0].lower()
+    return (name, args) if name else None
+
+
+def handle_update(update):
+    """پاسخ یک آپدیت تلگرام به شکل فراخوانی متد Bot API (برای بدنه پاسخ webhook) یا None"""
+    message = update.get('message')
+    if not message:
+        return None
+    parsed = parse_command(message.get('text'))
+    if parsed is None or parsed[0] not in _commands:
+        return None
+    name, args = parsed
+    started = time.monotonic()
+    try:
+        reply = _commands[name](args, message)
+    except Exception as e:
+        logger.error(f"❌ خطا در پاسخ به دستور /{name}: {e}")
+        return None
+    finally:
+        UPDATES.inc(command=name)
+        UPDATE_SECONDS.observe(time.monotonic() - started, command=name)
+    if reply is None:
+        return None
+    if isinstance(reply, str):
+        reply = {'method': 'sendMessage', 'text': reply, 'parse_mode': 'HTML', 'disable_web_page_preview': True}
+    return dict(reply, chat_id=message['chat']['id'], reply_to_message_id=message.get('message_id'))
+
+
+def make_app(path='/telegram', secret_token=None, fallback=None):
+    """برنامه WSGI برای webhook تلگرام روی path؛ مسیرهای دیگر به fallback (مثلاً metrics.app) می‌روند
+
+    پاسخ در همان بدنه پاسخ webhook برگردانده می‌شود، پس هیچ درخواست خروجی در مسیر پاسخ نیست.
+    با secret_token فقط درخواست‌هایی با هدر X-Telegram-Bot-Api-Secret-Token برابر پذیرفته می‌شوند.
+    """
+    def app(environ, start_response):
+        if environ.get('PATH_INFO') != path:
+            if fallback is not None:
+                return fallback(environ, start_response)
+            return _respond(start_response, '404 Not Found', b'not found\n', 'text/plain; charset=utf-8')
+        if environ.get('REQUEST_METHOD') != 'POST':
+            return _respond(start_response, '405 Method Not Allowed', b'', 'text/plain; charset=utf-8')
+        if secret_token and environ.get('HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN') != secret_token:
+            return _respond(start_response, '403 Forbidden', b'', 'text/plain; charset=utf-8')
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if not 0 < length <= MAX_UPDATE_SIZE:
+            return _respond(start_response, '400 Bad Request', b'', 'text/plain; charset=utf-8')
+        try:
+            update = json.loads(environ['wsgi.input'].read(length))
+        except ValueError:
+            return _respond(start_response, '400 Bad Request', b'', 'text/plain; charset=utf-8')
+        reply = handle_update(update) if isinstance(update, dict) else None
+        # همیشه 200 تا تلگرام آپدیت را دوباره نفرستد
+        body = json.dumps(reply, ensure_ascii=False).encode('utf-8') if reply else b''
+        return _respond(start_response, '200 OK', body, 'application/json; charset=utf-8')
+
+    return app
+
+
+def _respond(start_response, status, body, content_type):
+    start_response(status, [('Content-Type', content_type), ('Content-Length', str(len(body)))])
+    return [body]